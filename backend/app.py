@@ -1,11 +1,10 @@
-from flask import Flask, jsonify, request, send_from_directory, send_file
+from flask import Flask, Response, jsonify, request, send_from_directory, send_file, stream_with_context
 from flask_cors import CORS
 import base64
-import json
 import os
-import subprocess
 import sys
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Add the video_generator directory to the path
@@ -13,74 +12,87 @@ sys.path.append(os.path.join(os.path.dirname(__file__), 'video_generator'))
 
 # Import video generation modules (with error handling)
 try:
-    from video_generator.llm_client import ask_llm
-    from video_generator.lesson_schema import Lesson
+    from video_generator.pipeline import (
+        generate_lesson, metrics, record_video_access, render_lesson, run_job, start_services,
+    )
+    from video_generator.hls import HLS_MIMETYPES, HLS_SUFFIX
+    from video_generator.jobs import (
+        JobRegistry, SSE_KEEPALIVE, TERMINAL_EVENTS, format_sse, parse_last_event_id,
+    )
+    from video_generator.manim_runner import BUILD_DIR, VIDEO_DIR
+    from video_generator.render_cache import VIDEO_CACHE_DIR
+    from video_generator.stills import STILL_MIMETYPES, STILL_SUFFIXES
     VIDEO_GENERATION_AVAILABLE = True
 except Exception as e:
     print(f"Warning: Video generation not available: {e}")
     VIDEO_GENERATION_AVAILABLE = False
-    ask_llm = None
-    Lesson = None
+    generate_lesson = metrics = record_video_access = render_lesson = run_job = start_services = None
+    JobRegistry = None
+    # Same locations as manim_runner/render_cache, so earlier videos are still served
+    _VIDEO_GEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'video_generator')
+    _MEDIA_DIR = Path(os.getenv("CLULUS_MEDIA_DIR", os.path.join(_VIDEO_GEN_DIR, 'media')))
+    BUILD_DIR = Path(os.getenv("CLULUS_BUILD_DIR", os.path.join(_VIDEO_GEN_DIR, 'build')))
+    VIDEO_DIR = _MEDIA_DIR / "videos" / "render_scene" / "1080p60"
+    VIDEO_CACHE_DIR = _MEDIA_DIR / "cache"
+    HLS_MIMETYPES, HLS_SUFFIX = {}, ".hls"
+    STILL_MIMETYPES, STILL_SUFFIXES = {}, {}
 
 app = Flask(__name__)
 
 # Enable CORS for all routes
 CORS(app, origins=['http://localhost:3000'])
 
-VIDEO_DIR = './video_generator/media/videos/render_scene/1080p60'
-BUILD_DIR = './video_generator/build'
-
 # Ensure directories exist
 os.makedirs(BUILD_DIR, exist_ok=True)
 os.makedirs(VIDEO_DIR, exist_ok=True)
 
-def compile_manim(json_path: Path, quality: str = "h", out_name: str = None) -> Path:
-    """Compile Manim video from lesson JSON"""
-    assert json_path.exists()
-    out_name = out_name or "lesson"
-    
-    env = os.environ.copy()
-    # Make 100% sure TeX is on PATH for the manim subprocess
-    texbin = "/Library/TeX/texbin"
-    env["PATH"] = f"{texbin}:{env.get('PATH','')}"
-    env["LESSON_JSON"] = str(json_path.resolve())
+# Background lesson jobs (see /jobs endpoints)
+JOBS = JobRegistry() if JobRegistry else None
+JOB_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv("JOB_WORKERS", "4")), thread_name_prefix="lesson-job")
 
-    cmd = [
-        "manim", f"-q{quality}", "-o", out_name,
-        "render_scene.py", "LessonScene",
-        "--disable_caching"
-    ]
-    print("Running:", " ".join(cmd))
-    print("LESSON_JSON:", env["LESSON_JSON"])
-    
-    # Change to video_generator directory for manim command
-    original_cwd = os.getcwd()
-    video_gen_dir = os.path.join(os.path.dirname(__file__), 'video_generator')
-    try:
-        os.chdir(video_gen_dir)
-        proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
-        print("Manim stdout:", proc.stdout)
-        print("Manim stderr:", proc.stderr)
-        if proc.returncode != 0:
-            raise RuntimeError(f"Manim render failed. Return code: {proc.returncode}, stderr: {proc.stderr}")
-    finally:
-        os.chdir(original_cwd)
-    
-    # Manim creates videos in media/videos/render_scene/1080p60/ directory
-    manim_output_dir = os.path.join(video_gen_dir, "media", "videos", "render_scene", "1080p60")
-    out_path = Path(manim_output_dir) / f"{out_name}.mp4"
-    
-    # Check if the video was actually created
-    if not out_path.exists():
-        raise RuntimeError(f"Video file was not created at {out_path}")
-    
-    return out_path
+# Background work of the pipeline (disk sweeper), started by the app rather than on import
+if VIDEO_GENERATION_AVAILABLE:
+    start_services()
 
 # Route to get a video by filename
 @app.route('/get_video/<filename>')
 def get_video(filename):
+    # Finished renders live in the cache; VIDEO_DIR holds older outputs
+    if (VIDEO_CACHE_DIR / filename).is_file():
+        if record_video_access:
+            record_video_access(filename)
+        return send_from_directory(VIDEO_CACHE_DIR, filename)
     return send_from_directory(VIDEO_DIR, filename)
 
+# Poster image or animated preview of a video, rendered with it
+@app.route('/get_video/<filename>/<kind>')
+def get_video_still(filename, kind):
+    suffix = STILL_SUFFIXES.get(kind)
+    name = os.path.splitext(filename)[0] + (suffix or '')
+    if suffix is None or not (VIDEO_CACHE_DIR / name).is_file():
+        return jsonify({'error': 'Not found'}), 404
+    response = send_from_directory(VIDEO_CACHE_DIR, name, mimetype=STILL_MIMETYPES[os.path.splitext(name)[1]])
+    # Named by the lesson fingerprint, so the content never changes
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+# HLS playlists and segments of a video, when it was packaged (HLS_PACKAGING=1)
+@app.route('/get_video/<filename>/hls/<name>')
+def get_video_hls(filename, name):
+    package = VIDEO_CACHE_DIR / (os.path.splitext(filename)[0] + HLS_SUFFIX)
+    mimetype = HLS_MIMETYPES.get(os.path.splitext(name)[1])
+    if mimetype is None or not (package / name).is_file():
+        return jsonify({'error': 'Not found'}), 404
+    if name.endswith('.m3u8') and record_video_access:
+        record_video_access(f'{package.name}/{name}')
+    response = send_from_directory(package, name, mimetype=mimetype)
+    # Segments never change; playlists are rewritten if the package is rebuilt
+    if name.endswith('.m3u8'):
+        response.headers['Cache-Control'] = 'public, max-age=300'
+    else:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
 # New endpoint to generate video from math question
 @app.route('/generate_video', methods=['POST'])
 def generate_video():
@@ -101,15 +113,10 @@ def generate_video():
         
         # Generate unique filename for this request
         video_id = str(uuid.uuid4())
-        json_filename = f"lesson_{video_id}.json"
-        video_filename = f"lesson_{video_id}.mp4"
         
-        json_path = Path(BUILD_DIR) / json_filename
-        video_path = Path(BUILD_DIR) / video_filename
-        
-        # Step 1: Generate lesson JSON using LLM
+        # Step 1: Generate and validate lesson JSON using LLM
         try:
-            json_str = ask_llm(question)
+            lesson = generate_lesson(question)
         except RuntimeError as e:
             if "GEMINI_KEY" in str(e):
                 return jsonify({
@@ -119,17 +126,9 @@ def generate_video():
             else:
                 raise
         
-        # Step 2: Validate schema
-        lesson_data = json.loads(json_str)
-        lesson = Lesson.model_validate(lesson_data)
-        
-        # Step 3: Save JSON for Manim to read
-        with open(json_path, "w") as f:
-            json.dump(lesson.model_dump(), f, indent=2)
-        
-        # Step 4: Compile to video
+        # Step 2: Save JSON for Manim to read and compile to video
         try:
-            mp4_path = compile_manim(json_path, quality="h", out_name=f"lesson_{video_id}")
+            mp4_path = render_lesson(lesson, video_id, question=question)
             
             # Check if video was created successfully
             if not mp4_path.exists():
@@ -140,7 +139,7 @@ def generate_video():
                 mp4_path,
                 as_attachment=False,
                 mimetype='video/mp4',
-                add_etags=False
+                etag=False
             )
             
         except Exception as e:
@@ -169,13 +168,10 @@ def generate_video_blob():
         
         # Generate unique filename for this request
         video_id = str(uuid.uuid4())
-        json_filename = f"lesson_{video_id}.json"
-        
-        json_path = Path(BUILD_DIR) / json_filename
         
-        # Step 1: Generate lesson JSON using LLM
+        # Step 1: Generate and validate lesson JSON using LLM
         try:
-            json_str = ask_llm(question)
+            lesson = generate_lesson(question)
         except RuntimeError as e:
             if "GEMINI_KEY" in str(e):
                 return jsonify({
@@ -185,17 +181,9 @@ def generate_video_blob():
             else:
                 raise
         
-        # Step 2: Validate schema
-        lesson_data = json.loads(json_str)
-        lesson = Lesson.model_validate(lesson_data)
-        
-        # Step 3: Save JSON for Manim to read
-        with open(json_path, "w") as f:
-            json.dump(lesson.model_dump(), f, indent=2)
-        
-        # Step 4: Compile to video
+        # Step 2: Save JSON for Manim to read and compile to video
         try:
-            mp4_path = compile_manim(json_path, quality="h", out_name=f"lesson_{video_id}")
+            mp4_path = render_lesson(lesson, video_id, question=question)
             
             # Check if video was created successfully
             if not mp4_path.exists():
@@ -206,13 +194,6 @@ def generate_video_blob():
                 video_data = video_file.read()
                 video_base64 = base64.b64encode(video_data).decode('utf-8')
             
-            # Clean up temporary files
-            try:
-                os.remove(json_path)
-                os.remove(mp4_path)
-            except:
-                pass  # Ignore cleanup errors
-            
             return jsonify({
                 'success': True,
                 'video_blob': video_base64,
@@ -226,11 +207,79 @@ def generate_video_blob():
     except Exception as e:
         return jsonify({'error': f'Video generation failed: {str(e)}'}), 500
 
+# Start a lesson job in the background and return immediately
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    if not VIDEO_GENERATION_AVAILABLE:
+        return jsonify({
+            'error': 'Video generation not available',
+            'details': 'Required dependencies or API keys not configured'
+        }), 503
+
+    data = request.get_json(silent=True)
+    if not data or 'question' not in data:
+        return jsonify({'error': 'Question is required'}), 400
+
+    question = data['question'].strip()
+    if not question:
+        return jsonify({'error': 'Question cannot be empty'}), 400
+
+    job = JOBS.create(question)
+    JOB_EXECUTOR.submit(run_job, job)
+    return jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'events': f'/jobs/{job.id}/events',
+    }), 202
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    job = JOBS.get(job_id) if JOBS else None
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+# Server-Sent Events stream of a job's stage transitions
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    job = JOBS.get(job_id) if JOBS else None
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    last_id = parse_last_event_id(request.headers.get('Last-Event-ID'))
+
+    def stream():
+        nonlocal last_id
+        while True:
+            events = job.wait(last_id, timeout=15.0)
+            if not events:
+                if job.finished:
+                    return
+                yield SSE_KEEPALIVE
+                continue
+            for event in events:
+                last_id = event["id"]
+                yield format_sse(event)
+                if event["event"] in TERMINAL_EVENTS:
+                    return
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
 # Create directory for storing processed images
 UPLOAD_DIR = 'processed_images'
 if not os.path.exists(UPLOAD_DIR):
     os.makedirs(UPLOAD_DIR)
 
+@app.route('/metrics')
+def get_metrics():
+    if not VIDEO_GENERATION_AVAILABLE:
+        return jsonify({'error': 'Video generation not available'}), 503
+    return jsonify(metrics())
+
 @app.route('/')
 def hello_world():
     return jsonify({
@@ -248,6 +297,11 @@ def health_check():
             'generate_video': 'POST /generate_video - Generate Manim video (stream response)',
             'generate_video_blob': 'POST /generate_video_blob - Generate Manim video (base64 blob)',
             'get_video': 'GET /get_video/<filename> - Get video by filename',
+            'get_video_still': 'GET /get_video/<filename>/poster|preview - Poster image or animated preview',
+            'get_video_hls': 'GET /get_video/<filename>/hls/master.m3u8 - Adaptive bitrate HLS stream',
+            'jobs': 'POST /jobs - Start a lesson job in the background',
+            'job_events': 'GET /jobs/<id>/events - Server-Sent Events progress stream',
+            'metrics': 'GET /metrics - Render cache, dedup, LLM, local solver, disk usage, render farm and HLS statistics',
             'health': 'GET /health - Health check'
         }
     })
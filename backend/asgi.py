@@ -0,0 +1,304 @@
+"""
+ASGI entry point with the same routes as app.py, built on non-blocking I/O.
+
+LLM calls go through Gemini's async transport, Manim renders are awaited as
+asyncio subprocesses and SSE streams park coroutines instead of threads, so
+concurrency is no longer capped by the number of worker threads.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8080
+"""
+import asyncio
+import base64
+import contextlib
+import os
+import sys
+import uuid
+from pathlib import Path
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+# Add the video_generator directory to the path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'video_generator'))
+
+# Import video generation modules (with error handling)
+try:
+    from video_generator.pipeline import (
+        generate_lesson_async, metrics, record_video_access, render_lesson_async, run_job_async, start_services,
+    )
+    from video_generator.hls import HLS_MIMETYPES, HLS_SUFFIX
+    from video_generator.jobs import (
+        JobRegistry, SSE_KEEPALIVE, TERMINAL_EVENTS, format_sse, parse_last_event_id,
+    )
+    from video_generator.manim_runner import BUILD_DIR, VIDEO_DIR
+    from video_generator.render_cache import VIDEO_CACHE_DIR
+    from video_generator.stills import STILL_MIMETYPES, STILL_SUFFIXES
+    VIDEO_GENERATION_AVAILABLE = True
+except Exception as e:
+    print(f"Warning: Video generation not available: {e}")
+    VIDEO_GENERATION_AVAILABLE = False
+    generate_lesson_async = metrics = record_video_access = render_lesson_async = run_job_async = None
+    start_services = JobRegistry = None
+    # Same locations as manim_runner/render_cache, so earlier videos are still served
+    _VIDEO_GEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'video_generator')
+    _MEDIA_DIR = Path(os.getenv("CLULUS_MEDIA_DIR", os.path.join(_VIDEO_GEN_DIR, 'media')))
+    BUILD_DIR = Path(os.getenv("CLULUS_BUILD_DIR", os.path.join(_VIDEO_GEN_DIR, 'build')))
+    VIDEO_DIR = _MEDIA_DIR / "videos" / "render_scene" / "1080p60"
+    VIDEO_CACHE_DIR = _MEDIA_DIR / "cache"
+    HLS_MIMETYPES, HLS_SUFFIX = {}, ".hls"
+    STILL_MIMETYPES, STILL_SUFFIXES = {}, {}
+
+# Ensure directories exist
+os.makedirs(BUILD_DIR, exist_ok=True)
+os.makedirs(VIDEO_DIR, exist_ok=True)
+
+# Renders are CPU bound, so only a few run at once; everything else waits on the loop
+RENDER_SLOTS = asyncio.Semaphore(int(os.getenv("RENDER_CONCURRENCY", str(os.cpu_count() or 2))))
+
+# When set (e.g. "X-Accel-Redirect"), files are handed to the reverse proxy instead of streamed
+SENDFILE_HEADER = os.getenv("SENDFILE_HEADER")
+SENDFILE_PREFIX = os.getenv("SENDFILE_PREFIX", "/protected_videos/")
+
+JOBS = JobRegistry() if JobRegistry else None
+_BACKGROUND_TASKS = set()
+
+UNAVAILABLE = {
+    'error': 'Video generation not available',
+    'details': 'Required dependencies or API keys not configured'
+}
+
+
+def video_response(path: Path) -> Response:
+    if SENDFILE_HEADER:
+        return Response(
+            headers={SENDFILE_HEADER: SENDFILE_PREFIX + path.name, "Content-Type": "video/mp4"},
+        )
+    # Starlette hands the path to servers that offer the ASGI pathsend extension
+    # (e.g. Granian) and streams it in chunks everywhere else, uvicorn included
+    return FileResponse(path, media_type="video/mp4")
+
+
+async def _read_question(request: Request):
+    """Returns (question, error_response)."""
+    try:
+        data = await request.json()
+    except Exception:
+        data = None
+    if not data or 'question' not in data:
+        return None, JSONResponse({'error': 'Question is required'}, status_code=400)
+    question = data['question'].strip()
+    if not question:
+        return None, JSONResponse({'error': 'Question cannot be empty'}, status_code=400)
+    return question, None
+
+
+async def _generate(question: str, video_id: str):
+    """Runs LLM + render for a request. Returns (mp4_path, error_response)."""
+    try:
+        lesson = await generate_lesson_async(question)
+    except Exception as e:
+        return None, JSONResponse({'error': f'Video generation failed: {str(e)}'}, status_code=500)
+
+    try:
+        mp4_path = await render_lesson_async(lesson, video_id, render_slots=RENDER_SLOTS, question=question)
+    except Exception as e:
+        return None, JSONResponse({'error': f'Video compilation failed: {str(e)}'}, status_code=500)
+    return mp4_path, None
+
+
+# Route to get a video by filename
+async def get_video(request: Request):
+    filename = request.path_params['filename']
+    # Finished renders live in the cache; VIDEO_DIR holds older outputs
+    for directory in (VIDEO_CACHE_DIR, VIDEO_DIR):
+        path = (directory / filename).resolve()
+        if path.parent == directory.resolve() and path.is_file():
+            if directory == VIDEO_CACHE_DIR and record_video_access:
+                record_video_access(filename)
+            return video_response(path)
+    return JSONResponse({'error': 'Video not found'}, status_code=404)
+
+
+# Poster image or animated preview of a video, rendered with it
+async def get_video_still(request: Request):
+    suffix = STILL_SUFFIXES.get(request.path_params['kind'])
+    if suffix is not None:
+        path = (VIDEO_CACHE_DIR / (Path(request.path_params['filename']).stem + suffix)).resolve()
+        if path.parent == VIDEO_CACHE_DIR.resolve() and path.is_file():
+            # Named by the lesson fingerprint, so the content never changes
+            return FileResponse(path, media_type=STILL_MIMETYPES[path.suffix],
+                                headers={'Cache-Control': 'public, max-age=31536000, immutable'})
+    return JSONResponse({'error': 'Not found'}, status_code=404)
+
+
+# HLS playlists and segments of a video, when it was packaged (HLS_PACKAGING=1)
+async def get_video_hls(request: Request):
+    package = (VIDEO_CACHE_DIR / (Path(request.path_params['filename']).stem + HLS_SUFFIX)).resolve()
+    path = (package / request.path_params['name']).resolve()
+    media_type = HLS_MIMETYPES.get(path.suffix)
+    if media_type is None or path.parent != package or not path.is_file():
+        return JSONResponse({'error': 'Not found'}, status_code=404)
+    if path.suffix == '.m3u8' and record_video_access:
+        record_video_access(f'{package.name}/{path.name}')
+    # Segments never change; playlists are rewritten if the package is rebuilt
+    cache_control = 'public, max-age=300' if path.suffix == '.m3u8' else 'public, max-age=31536000, immutable'
+    return FileResponse(path, media_type=media_type, headers={'Cache-Control': cache_control})
+
+
+async def generate_video(request: Request):
+    if not VIDEO_GENERATION_AVAILABLE:
+        return JSONResponse(UNAVAILABLE, status_code=503)
+    question, error = await _read_question(request)
+    if error:
+        return error
+    mp4_path, error = await _generate(question, str(uuid.uuid4()))
+    if error:
+        return error
+    return video_response(mp4_path)
+
+
+async def generate_video_blob(request: Request):
+    if not VIDEO_GENERATION_AVAILABLE:
+        return JSONResponse(UNAVAILABLE, status_code=503)
+    question, error = await _read_question(request)
+    if error:
+        return error
+    mp4_path, error = await _generate(question, str(uuid.uuid4()))
+    if error:
+        return error
+
+    def _encode():
+        video_data = mp4_path.read_bytes()
+        return base64.b64encode(video_data).decode('utf-8'), len(video_data)
+
+    video_base64, size = await asyncio.to_thread(_encode)
+    return JSONResponse({
+        'success': True,
+        'video_blob': video_base64,
+        'mimetype': 'video/mp4',
+        'size': size
+    })
+
+
+async def create_job(request: Request):
+    if not VIDEO_GENERATION_AVAILABLE:
+        return JSONResponse(UNAVAILABLE, status_code=503)
+    question, error = await _read_question(request)
+    if error:
+        return error
+
+    job = JOBS.create(question)
+    task = asyncio.create_task(run_job_async(job, render_slots=RENDER_SLOTS))
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+    return JSONResponse({
+        'job_id': job.id,
+        'status': job.status,
+        'events': f'/jobs/{job.id}/events',
+    }, status_code=202)
+
+
+async def get_job(request: Request):
+    job = JOBS.get(request.path_params['job_id']) if JOBS else None
+    if job is None:
+        return JSONResponse({'error': 'Job not found'}, status_code=404)
+    return JSONResponse(job.to_dict())
+
+
+async def job_events(request: Request):
+    job = JOBS.get(request.path_params['job_id']) if JOBS else None
+    if job is None:
+        return JSONResponse({'error': 'Job not found'}, status_code=404)
+
+    last_id = parse_last_event_id(request.headers.get('last-event-id'))
+
+    async def stream():
+        nonlocal last_id
+        while True:
+            events = await job.wait_async(last_id, timeout=15.0)
+            if not events:
+                if job.finished:
+                    return
+                yield SSE_KEEPALIVE
+                continue
+            for event in events:
+                last_id = event["id"]
+                yield format_sse(event)
+                if event["event"] in TERMINAL_EVENTS:
+                    return
+
+    return StreamingResponse(
+        stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+async def get_metrics(request: Request):
+    if not VIDEO_GENERATION_AVAILABLE:
+        return JSONResponse({'error': 'Video generation not available'}, status_code=503)
+    # The disk report walks the media tree now and then
+    return JSONResponse(await asyncio.to_thread(metrics))
+
+
+async def hello_world(request: Request):
+    return JSONResponse({
+        'message': 'Hello, World!',
+        'status': 'success'
+    })
+
+
+async def health_check(request: Request):
+    return JSONResponse({
+        'status': 'healthy',
+        'service': 'asgi-backend',
+        'video_generation': 'ready' if VIDEO_GENERATION_AVAILABLE else 'not_available',
+        'endpoints': {
+            'generate_video': 'POST /generate_video - Generate Manim video (stream response)',
+            'generate_video_blob': 'POST /generate_video_blob - Generate Manim video (base64 blob)',
+            'get_video': 'GET /get_video/<filename> - Get video by filename',
+            'get_video_still': 'GET /get_video/<filename>/poster|preview - Poster image or animated preview',
+            'get_video_hls': 'GET /get_video/<filename>/hls/master.m3u8 - Adaptive bitrate HLS stream',
+            'jobs': 'POST /jobs - Start a lesson job in the background',
+            'job_events': 'GET /jobs/<id>/events - Server-Sent Events progress stream',
+            'metrics': 'GET /metrics - Render cache, dedup, LLM, local solver, disk usage, render farm and HLS statistics',
+            'health': 'GET /health - Health check'
+        }
+    })
+
+
+routes = [
+    Route('/', hello_world),
+    Route('/health', health_check),
+    Route('/metrics', get_metrics),
+    Route('/get_video/{filename}', get_video),
+    Route('/get_video/{filename}/{kind}', get_video_still),
+    Route('/get_video/{filename}/hls/{name}', get_video_hls),
+    Route('/generate_video', generate_video, methods=['POST']),
+    Route('/generate_video_blob', generate_video_blob, methods=['POST']),
+    Route('/jobs', create_job, methods=['POST']),
+    Route('/jobs/{job_id}', get_job),
+    Route('/jobs/{job_id}/events', job_events),
+]
+
+middleware = [
+    Middleware(CORSMiddleware, allow_origins=['http://localhost:3000'], allow_methods=['*'], allow_headers=['*']),
+]
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # The pipeline's background work (disk sweeper) starts with the server, not on import
+    if VIDEO_GENERATION_AVAILABLE:
+        start_services()
+    yield
+
+
+app = Starlette(routes=routes, middleware=middleware, lifespan=lifespan)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=8080)
@@ -0,0 +1,121 @@
+"""
+Load test for the ASGI app (asgi.py).
+
+Serves the app with uvicorn in-process, stubs the LLM with an async sleep and
+the renderer with a real subprocess that sleeps and writes a small file, then
+keeps `--concurrency` requests in flight for `--duration` seconds. Reports
+throughput, latency percentiles and the peak thread count of the process,
+which should stay flat no matter how many requests are in flight.
+
+    python benchmarks/asgi_load.py --concurrency 200 --duration 20
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import statistics
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("GEMINI_KEY", "load-test")  # the stub never calls Gemini
+
+import httpx
+import uvicorn
+
+import asgi
+from lesson_schema import Lesson  # same module pipeline uses (asgi puts video_generator on sys.path)
+from video_generator import pipeline
+
+
+def install_stubs(llm_latency: float, render_latency: float) -> None:
+    async def ask_llm_lesson_async(question):
+        await asyncio.sleep(llm_latency)
+        return Lesson(title=question, steps=["x^2"])
+
+    async def compile_manim_async(json_path, quality="h", out_name=None, on_progress=None, fps=None, media_dir=None,
+                                  caching=False):
+        out_path = json_path.with_suffix(".mp4")
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, "-c",
+            f"import time; time.sleep({render_latency}); open({str(out_path)!r}, 'wb').write(b'0' * 4096)",
+        )
+        await proc.wait()
+        if on_progress:
+            on_progress({"animation": 1, "name": "Stub"})
+        return out_path
+
+    pipeline.ask_llm_lesson_async = ask_llm_lesson_async
+    pipeline.compile_manim_async = compile_manim_async
+
+
+async def run(args) -> None:
+    install_stubs(args.llm_latency, args.render_latency)
+    config = uvicorn.Config(asgi.app, host="127.0.0.1", port=args.port, log_level="warning")
+    server = uvicorn.Server(config)
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    latencies, errors = [], 0
+    peak_threads = threading.active_count()
+    deadline = time.perf_counter() + args.duration
+    counter = itertools.count()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=120) as client:
+        async def user():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                t0 = time.perf_counter()
+                # Unique questions miss the render cache, --repeat measures cache hits
+                question = "derivative of x^2" if args.repeat else f"question {next(counter)}"
+                r = await client.post(args.endpoint, json={"question": question})
+                if r.status_code == 200:
+                    latencies.append(time.perf_counter() - t0)
+                else:
+                    errors += 1
+
+        async def sample_threads():
+            nonlocal peak_threads
+            while time.perf_counter() < deadline:
+                peak_threads = max(peak_threads, threading.active_count())
+                await asyncio.sleep(0.1)
+
+        started = time.perf_counter()
+        await asyncio.gather(sample_threads(), *[user() for _ in range(args.concurrency)])
+        elapsed = time.perf_counter() - started
+
+    server.should_exit = True
+    await server_task
+
+    latencies.sort()
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000 if latencies else float("nan")
+
+    print(f"endpoint:        {args.endpoint}")
+    print(f"concurrency:     {args.concurrency}")
+    print(f"render slots:    {os.getenv('RENDER_CONCURRENCY', os.cpu_count())}")
+    print(f"requests ok:     {len(latencies)}  errors: {errors}")
+    print(f"throughput:      {len(latencies) / elapsed:.1f} req/s")
+    print(f"latency ms:      p50={pct(50):.0f} p90={pct(90):.0f} p99={pct(99):.0f} "
+          f"mean={statistics.mean(latencies) * 1000 if latencies else float('nan'):.0f}")
+    print(f"peak threads:    {peak_threads}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", default="/generate_video_blob")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--render-latency", type=float, default=0.5)
+    parser.add_argument("--repeat", action="store_true", help="send the same question every time")
+    parser.add_argument("--port", type=int, default=8765)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Dedup rate of LLM lessons over a traffic sample.
+
+Reads a JSONL file where every line has a `lesson` (the LLM output) and
+optionally the `question` that produced it, and reports how many renders a
+naive hash of the lesson would save compared to the canonical fingerprint
+used by the render cache.
+
+    python benchmarks/dedup_rate.py [benchmarks/data/traffic_sample.jsonl] [--groups]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "video_generator"))
+
+from lesson_canon import DedupStats, canonicalize_lesson, lesson_fingerprint
+from lesson_schema import Lesson
+
+DEFAULT_SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "traffic_sample.jsonl")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sample", nargs="?", default=DEFAULT_SAMPLE)
+    parser.add_argument("--groups", action="store_true", help="print the questions that share a fingerprint")
+    args = parser.parse_args()
+
+    stats = DedupStats()
+    groups = defaultdict(list)
+    invalid = 0
+    elapsed = 0.0
+    with open(args.sample) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            try:
+                raw = Lesson.model_validate(row.get("lesson", row))
+            except Exception:
+                invalid += 1
+                continue
+            t0 = time.perf_counter()
+            fingerprint = lesson_fingerprint(canonicalize_lesson(raw), canonical=True)
+            elapsed += time.perf_counter() - t0
+            stats.record(raw, fingerprint)
+            groups[fingerprint].append(row.get("question", raw.title))
+
+    summary = stats.summary()
+    n = summary["lessons"]
+    print(f"lessons:              {n} ({invalid} invalid skipped)")
+    print(f"unique (naive hash):  {summary['unique_naive']}")
+    print(f"unique (canonical):   {summary['unique_canonical']}")
+    print(f"naive hit rate:       {summary['naive_hit_rate']:.1%}")
+    print(f"canonical hit rate:   {summary['canonical_hit_rate']:.1%}")
+    if n:
+        print(f"canonicalize cost:    {elapsed / n * 1000:.2f} ms/lesson")
+
+    if args.groups:
+        for fingerprint, questions in sorted(groups.items(), key=lambda kv: -len(kv[1])):
+            print(f"\n{fingerprint} ({len(questions)})")
+            for q in questions:
+                print(f"  - {q}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Render farm on one host: a coordinator, several worker processes, a killed worker.
+
+Starts the coordinator in-process with a temporary store, spawns worker
+processes whose render is a stub (a sleep instead of Manim) and sends every
+lesson of the sample through `FarmClient` at two qualities, from many
+threads. Partway through one worker is killed with SIGKILL. Reports whether
+every render finished, how its jobs were requeued and how often both
+qualities of a lesson rendered on the same node (cache affinity).
+
+    python benchmarks/farm_failover.py [--workers 4] [--lessons 40] [--render 0.5] [--kill-after 2]
+"""
+import argparse
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VIDEO_GEN_DIR = os.path.join(BACKEND_DIR, "video_generator")
+sys.path.insert(0, VIDEO_GEN_DIR)
+
+from lesson_compact import CompactLesson
+from manim_runner import output_dir
+from render_cache import RenderCache, cache_key
+from render_farm import FarmClient, RenderWorker, serve_coordinator
+from render_profile import RenderProfile
+from stills import StillsRecorder
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def stub_render(seconds: float):
+    """compile_manim stand-in: sleeps `seconds` over the lesson's steps, then writes a fake MP4 and stills."""
+    def render(json_path, quality="h", out_name="lesson", on_progress=None, fps=None, media_dir=None, **_):
+        lesson = json.loads(Path(json_path).read_text())
+        out = output_dir(quality, fps, media_dir)
+        out.mkdir(parents=True, exist_ok=True)
+        steps = len(lesson.get("steps", [])) or 1
+        for i in range(steps):
+            time.sleep(seconds / steps)
+            if on_progress:
+                on_progress({"animation": i + 1, "name": "Stub"})
+        mp4_path = out / f"{out_name}.mp4"
+        mp4_path.write_bytes(Path(json_path).read_bytes() * 64)
+        stills = StillsRecorder(frame_rate=30)
+        stills.add_frame(np.zeros((1080, 1920, 4), dtype=np.uint8), num_frames=30)
+        stills.save(str(out / out_name))
+        return mp4_path
+    return render
+
+
+def lessons(n):
+    return [
+        CompactLesson.from_dict({"title": f"Lesson {i}", "steps": [f"x^{i}", f"{i}x^{i - 1}", "done"]})
+        for i in range(n)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--lessons", type=int, default=40)
+    parser.add_argument("--render", type=float, default=0.5, help="stub render time in seconds")
+    parser.add_argument("--kill-after", type=float, default=2.0, help="seconds until a worker is killed (0 = never)")
+    parser.add_argument("--heartbeat-timeout", type=float, default=2.0)
+    parser.add_argument("--steal-after", type=float, default=None,
+                        help="seconds a job waits before an idle worker takes it (default 2x --render)")
+    # Used by the worker processes this script spawns
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--id", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        RenderWorker(args.worker, args.id, render=stub_render(args.render)).run()
+        return
+
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    storage = Path(tempfile.mkdtemp(prefix="farm_store_"))
+    # Worker media dirs and lesson JSON
+    scratch = Path(tempfile.mkdtemp(prefix="farm_workers_"))
+    env = {**os.environ, "CLULUS_MEDIA_DIR": str(scratch / "media"), "CLULUS_BUILD_DIR": str(scratch / "build")}
+    steal_after = args.steal_after if args.steal_after is not None else 2 * args.render
+    coordinator, server = serve_coordinator(port, "127.0.0.1", storage, args.heartbeat_timeout, steal_after)
+
+    workers = [
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker", url,
+             "--id", f"worker-{i}", "--render", str(args.render)],
+            env=env, stdout=subprocess.DEVNULL,
+        )
+        for i in range(args.workers)
+    ]
+    while len(coordinator.workers) < args.workers:
+        time.sleep(0.05)
+
+    client = FarmClient(url, RenderCache(storage))
+    jobs = [(lesson, RenderProfile(q, 30)) for q in ("h", "m") for lesson in lessons(args.lessons)]
+    rendered_by = {}
+
+    def render(item):
+        lesson, profile = item
+        key = cache_key(lesson.fingerprint, profile.tag)
+        path = client.render(key, lesson, profile)
+        job = next(j for j in coordinator.jobs.values() if j.key == key)
+        rendered_by[key] = (lesson.fingerprint, job.worker, job.attempts)
+        return path
+
+    killed = None
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        futures = [pool.submit(render, item) for item in jobs]
+        if args.kill_after:
+            time.sleep(args.kill_after)
+            killed = workers[0]
+            killed.send_signal(signal.SIGKILL)
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+    elapsed = time.perf_counter() - t0
+
+    for proc in workers:
+        proc.kill()
+        proc.wait()
+    server.shutdown()
+    shutil.rmtree(scratch, ignore_errors=True)
+
+    failed = [r for r in results if isinstance(r, Exception)]
+    stored = sum(1 for r in results if not isinstance(r, Exception) and r.exists())
+    by_fingerprint = defaultdict(set)
+    for fingerprint, worker, _ in rendered_by.values():
+        by_fingerprint[fingerprint].add(worker)
+    affinity = sum(1 for w in by_fingerprint.values() if len(w) == 1) / len(by_fingerprint)
+    stats = coordinator.stats()
+    ideal = len(jobs) * args.render / args.workers
+
+    print(f"workers:          {args.workers} ({'worker-0 killed' if killed else 'none killed'})")
+    print(f"renders:          {len(jobs)} ({len(failed)} failed, {stored} in the store)")
+    print(f"elapsed:          {elapsed:.1f} s (ideal {ideal:.1f} s)")
+    print(f"requeued:         {stats['requeued']}  stolen: {stats['stolen']}  dead workers: {stats['dead_workers']}")
+    print(f"retried jobs:     {sum(1 for *_, attempts in rendered_by.values() if attempts > 1)}")
+    print(f"same-node pairs:  {affinity:.0%} of lessons rendered both qualities on one worker")
+    print("per worker:       " + ", ".join(f"{w}={n}" for w, n in sorted(Counter(
+        w for _, w, _ in rendered_by.values()).items())))
+    for error in failed[:3]:
+        print(f"error: {error}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
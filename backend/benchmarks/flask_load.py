@@ -0,0 +1,469 @@
+"""
+Open-loop load test of the Flask app (app.py), and a capacity model fitted from it.
+
+Starts `--workers` server processes, each serving app.py from a fixed pool
+of `--threads` request threads, like gunicorn's gthread workers. The LLM is
+stubbed: the lesson comes from the traffic sample after a lognormal delay.
+By default the renderer is stubbed too: a child process burns `--stub-cpu`
+CPU-seconds for the lesson's tier and writes a small file. With
+`--renderer manim`, Manim renders for real. All workers share a temporary
+media dir, so the real render cache is left alone.
+
+Requests arrive open loop, as a Poisson process at each rate of `--rates`
+for `--duration` seconds. Arrivals don't wait for earlier responses. They
+are spread round robin over the workers and mixed per `--mix`:
+
+- /generate_video and /generate_video_blob: a question from the sample.
+  A `--novel` share gets a suffix, so its lesson (and video) is new.
+- /get_video: a video an earlier request produced.
+
+For every rate the script reports throughput, latency percentiles, time
+queued for a request thread, and CPU and peak memory per worker.
+
+It then fits the capacity model: CPU-seconds per render for each quality
+tier (least squares over workers and rates), plus request handling CPU. From
+these it gives renders per hour per core for each tier and the arrival rate
+at which the host saturates. Compare these with production numbers.
+`--json` writes everything out.
+
+    python benchmarks/flask_load.py [--workers 2] [--threads 4] [--rates 0.5,1,2] [--duration 30]
+    python benchmarks/flask_load.py --renderer manim --rates 0.05,0.1 --duration 300
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "traffic_sample.jsonl")
+# Stubbed CPU-seconds per render; scaled down from Manim (tens of seconds) so a run takes minutes
+DEFAULT_STUB_CPU = "1080p30=1.0,1080p60=2.0"
+DEFAULT_MIX = "generate_video=0.3,generate_video_blob=0.2,get_video=0.5"
+_VARIANT = re.compile(r" \(variant (\d+)\)$")
+
+
+def parse_pairs(text, cast=float):
+    return {k.strip(): cast(v) for k, v in (pair.split("=") for pair in text.split(",") if pair.strip())}
+
+
+def load_sample(path):
+    with open(path) as f:
+        return [row for row in (json.loads(line) for line in f if line.strip()) if "lesson" in row]
+
+
+# --- Worker process ---
+
+def serve(args) -> None:
+    """Runs app.py with stubs on args.port until killed."""
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault("GEMINI_KEY", "load-test")  # the stub never calls Gemini
+
+    from flask import request
+    from werkzeug.serving import BaseWSGIServer
+
+    import app as flask_app
+    from video_generator import pipeline
+    from lesson_schema import Lesson  # same module pipeline uses (app puts video_generator on sys.path)
+    from render_profile import QUALITY_HEIGHTS
+
+    timing = threading.local()
+    lessons = {row["question"]: row["lesson"] for row in load_sample(args.sample)}
+    stub_cpu = parse_pairs(args.stub_cpu)
+    rng = random.Random(os.getpid())
+    rng_lock = threading.Lock()
+    totals = {"renders": Counter(), "requests": 0}
+    totals_lock = threading.Lock()
+
+    def ask_llm_lesson(question):
+        with rng_lock:
+            delay = rng.lognormvariate(np.log(args.llm_ms / 1000), 0.4)
+        time.sleep(delay)
+        timing.llm = getattr(timing, "llm", 0.0) + delay
+        base = _VARIANT.sub("", question)
+        data = dict(lessons.get(base) or next(iter(lessons.values())))
+        variant = _VARIANT.search(question)
+        if variant:
+            data["title"] = f"{data['title']} ({variant.group(1)})"
+        return Lesson.model_validate(data)
+
+    real_compile = pipeline.compile_manim
+
+    def stub_compile(json_path, quality="h", out_name=None, on_progress=None, fps=None, media_dir=None,
+                     stills=True, caching=False, tier=None):
+        seconds = stub_cpu.get(tier, stub_cpu.get("1080p30", 1.0) * (QUALITY_HEIGHTS[quality] / 1080) ** 2)
+        out = Path(media_dir) / f"{out_name}.mp4"
+        out.parent.mkdir(parents=True, exist_ok=True)
+        subprocess.run([
+            sys.executable, "-c",
+            f"import time\nend = time.process_time() + {seconds}\n"
+            f"while time.process_time() < end: pass\nopen({str(out)!r}, 'wb').write(b'0' * 65536)",
+        ], check=True)
+        return out
+
+    def compile_manim(json_path, quality="h", out_name=None, on_progress=None, fps=None, media_dir=None,
+                      stills=True, caching=False):
+        fps = fps or 60
+        tier = f"{QUALITY_HEIGHTS[quality]}p{fps}"
+        t0 = time.perf_counter()
+        if args.renderer == "manim":
+            out = real_compile(json_path, quality=quality, out_name=out_name, on_progress=on_progress, fps=fps,
+                               media_dir=media_dir, stills=stills, caching=caching)
+        else:
+            out = stub_compile(json_path, quality, out_name, on_progress, fps, media_dir, stills, caching, tier)
+        timing.render = getattr(timing, "render", 0.0) + time.perf_counter() - t0
+        timing.tier = tier
+        with totals_lock:
+            totals["renders"][tier] += 1
+        return out
+
+    pipeline.ask_llm_lesson = ask_llm_lesson
+    pipeline.compile_manim = compile_manim
+
+    real_render_lesson = flask_app.render_lesson
+
+    def render_lesson(lesson, video_id, **kwargs):
+        video = real_render_lesson(lesson, video_id, **kwargs)
+        timing.video = video.name
+        return video
+
+    flask_app.render_lesson = render_lesson
+    app = flask_app.app
+
+    @app.before_request
+    def start_timing():
+        timing.started = time.perf_counter()
+        timing.llm = timing.render = 0.0
+        timing.tier = timing.video = None
+
+    @app.after_request
+    def report_timing(response):
+        if request.path == "/__load_stats":
+            return response
+        response.headers["X-Load-Timing"] = json.dumps({
+            "queued": getattr(timing, "queued", 0.0),
+            "server": time.perf_counter() - timing.started,
+            "llm": timing.llm, "render": timing.render, "tier": timing.tier, "video": timing.video,
+        })
+        with totals_lock:
+            totals["requests"] += 1
+        return response
+
+    @app.route("/__load_stats")
+    def load_stats():
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        with totals_lock:
+            return {
+                "pid": os.getpid(),
+                "cpu": own.ru_utime + own.ru_stime,
+                "children_cpu": children.ru_utime + children.ru_stime,
+                # KiB on Linux
+                "maxrss_kb": own.ru_maxrss,
+                # Largest render process; Linux counts a child from before its exec, so never below the worker's
+                "children_maxrss_kb": children.ru_maxrss,
+                "renders": dict(totals["renders"]),
+                "requests": totals["requests"],
+            }
+
+    class PooledWSGIServer(BaseWSGIServer):
+        """Werkzeug server with a fixed pool of request threads; the rest wait in its queue."""
+
+        def __init__(self, host, port, wsgi_app, threads):
+            super().__init__(host, port, wsgi_app)
+            self.pool = ThreadPoolExecutor(threads, thread_name_prefix="request")
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._process, request, client_address, time.perf_counter())
+
+        def _process(self, request, client_address, accepted):
+            timing.queued = time.perf_counter() - accepted
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no line per request
+    server = PooledWSGIServer("127.0.0.1", args.port, app, args.threads)
+    print(f"worker {os.getpid()} serving on {args.port}", flush=True)
+    server.serve_forever()
+
+
+# --- Load generator ---
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_workers(args, data_dir: Path):
+    env = dict(os.environ, CLULUS_MEDIA_DIR=str(data_dir / "media"), CLULUS_BUILD_DIR=str(data_dir / "build"),
+               RETENTION_SWEEP_SECONDS="0", PYTHONUNBUFFERED="1")
+    workers = []
+    for _ in range(args.workers):
+        port = free_port()
+        cmd = [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port), "--threads", str(args.threads),
+               "--sample", args.sample, "--llm-ms", str(args.llm_ms), "--stub-cpu", args.stub_cpu,
+               "--renderer", args.renderer]
+        workers.append((port, subprocess.Popen(cmd, env=env, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL)))
+    return workers
+
+
+async def wait_ready(client, ports, timeout=120.0):
+    deadline = time.monotonic() + timeout
+    for port in ports:
+        while True:
+            try:
+                if (await client.get(f"http://127.0.0.1:{port}/health")).status_code == 200:
+                    break
+            except Exception:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"worker on {port} did not start")
+            await asyncio.sleep(0.2)
+
+
+async def worker_stats(client, ports):
+    return {port: (await client.get(f"http://127.0.0.1:{port}/__load_stats")).json() for port in ports}
+
+
+async def run_rate(client, args, ports, rate, rows, videos, rng, counter):
+    """One open-loop step at `rate` requests/s; returns the per-request records."""
+    mix = parse_pairs(args.mix)
+    endpoints, weights = list(mix), list(mix.values())
+    records, tasks = [], []
+    start = time.perf_counter()
+    deadline = start + args.duration
+    next_arrival = start
+
+    async def send(scheduled, endpoint, port):
+        record = {"endpoint": endpoint, "lag": time.perf_counter() - scheduled}
+        url = f"http://127.0.0.1:{port}"
+        try:
+            if endpoint == "get_video":
+                response = await client.get(f"{url}/get_video/{rng.choice(videos)}")
+            else:
+                row = rng.choice(rows)
+                question = row["question"]
+                if rng.random() < args.novel:
+                    question += f" (variant {next(counter)})"
+                response = await client.post(f"{url}/{endpoint}", json={"question": question})
+            record["status"] = response.status_code
+            record.update(json.loads(response.headers.get("X-Load-Timing", "{}")))
+            if record.get("video"):
+                videos.append(record["video"])
+        except Exception as e:
+            record["status"] = type(e).__name__
+        record["latency"] = time.perf_counter() - scheduled
+        records.append(record)
+
+    i = 0
+    while next_arrival < deadline:
+        await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+        endpoint = rng.choices(endpoints, weights)[0]
+        # Nothing to fetch until a video exists
+        if endpoint == "get_video" and not videos:
+            endpoint = "generate_video"
+        tasks.append(asyncio.create_task(send(next_arrival, endpoint, ports[i % len(ports)])))
+        i += 1
+        next_arrival += rng.expovariate(rate)
+    done, pending = await asyncio.wait(tasks, timeout=args.drain) if tasks else (set(), set())
+    for task in pending:
+        task.cancel()
+    return records, len(pending), time.perf_counter() - start
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float("nan")
+
+
+def summarize_step(rate, records, unfinished, elapsed, before, after):
+    ok = [r for r in records if r["status"] == 200]
+    latencies = [r["latency"] for r in ok]
+    step = {
+        "rate": rate,
+        "requests": len(records) + unfinished,
+        "ok": len(ok),
+        "errors": len(records) - len(ok),
+        "unfinished": unfinished,
+        "throughput": len(ok) / elapsed,
+        "latency_s": {f"p{q}": pct(latencies, q / 100) for q in (50, 90, 95, 99)},
+        "queued_s": {"mean": float(np.mean([r.get("queued", 0.0) for r in ok])) if ok else 0.0,
+                     "p95": pct([r.get("queued", 0.0) for r in ok], 0.95)},
+        # Time in the handler that was neither the LLM nor a render: locks, waiting on other requests
+        "waiting_s": float(np.mean([max(0.0, r.get("server", 0) - r.get("llm", 0) - r.get("render", 0))
+                                    for r in ok])) if ok else 0.0,
+        "generator_lag_p99_s": pct([r["lag"] for r in records], 0.99),
+        "by_endpoint": {e: {"ok": n, "p95_s": pct([r["latency"] for r in ok if r["endpoint"] == e], 0.95)}
+                        for e, n in Counter(r["endpoint"] for r in ok).items()},
+        "workers": {},
+    }
+    for port, end in after.items():
+        start = before[port]
+        renders = Counter(end["renders"]) - Counter(start["renders"])
+        step["workers"][port] = {
+            "pid": end["pid"],
+            "cpu_s": end["cpu"] - start["cpu"],
+            "render_cpu_s": end["children_cpu"] - start["children_cpu"],
+            "requests": end["requests"] - start["requests"],
+            "renders": dict(renders),
+            "maxrss_mb": end["maxrss_kb"] / 1024,
+            "render_maxrss_mb": end["children_maxrss_kb"] / 1024,
+        }
+    return step
+
+
+def fit_capacity(steps, cores, stub_cpu=None):
+    """CPU-seconds per render by tier (least squares) and per request; renders/hour/core from them."""
+    tiers = sorted({t for s in steps for w in s["workers"].values() for t in w["renders"]})
+    rows, render_cpu, request_cpu, requests = [], [], 0.0, 0
+    for s in steps:
+        for w in s["workers"].values():
+            rows.append([w["renders"].get(t, 0) for t in tiers])
+            render_cpu.append(w["render_cpu_s"])
+            request_cpu += w["cpu_s"]
+            requests += w["requests"]
+    model = {"cores": cores, "tiers": {}}
+    if tiers and any(any(r) for r in rows):
+        per_render, *_ = np.linalg.lstsq(np.array(rows, dtype=float), np.array(render_cpu), rcond=None)
+        renders = np.array(rows).sum(axis=0)
+        for tier, cpu, n in zip(tiers, per_render, renders):
+            cpu = max(float(cpu), 1e-6)
+            model["tiers"][tier] = {
+                "renders": int(n),
+                "cpu_s_per_render": cpu,
+                "renders_per_hour_per_core": 3600 / cpu,
+                "stub_cpu_s": stub_cpu.get(tier) if stub_cpu else None,
+            }
+    model["cpu_s_per_request"] = request_cpu / requests if requests else 0.0
+    # Saturation at the observed mix: all cores busy with renders and request handling
+    total_requests = sum(s["ok"] for s in steps)
+    total_render_cpu = sum(t["renders"] * t["cpu_s_per_render"] for t in model["tiers"].values())
+    if total_requests:
+        cpu_per_arrival = total_render_cpu / total_requests + model["cpu_s_per_request"]
+        model["cpu_s_per_arrival"] = cpu_per_arrival
+        model["saturation_rate"] = cores / cpu_per_arrival if cpu_per_arrival else float("inf")
+    return model
+
+
+def observed_knee(steps):
+    """Lowest rate where the host fell behind: throughput under 90% of arrivals, or p95 tripled."""
+    base = steps[0]["latency_s"]["p95"]
+    for s in steps:
+        if s["throughput"] < 0.9 * s["rate"] or s["latency_s"]["p95"] > 3 * base:
+            return s["rate"]
+    return None
+
+
+def print_report(args, steps, model, knee):
+    print(f"{args.workers} workers x {args.threads} threads, renderer: {args.renderer}, "
+          f"llm ~{args.llm_ms:.0f} ms, mix {args.mix}, novel {args.novel:.0%}")
+    print(f"{'rate/s':>7} {'ok':>5} {'err':>4} {'thru/s':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+          f"{'queued':>7} {'waiting':>8}")
+    for s in steps:
+        lat = s["latency_s"]
+        print(f"{s['rate']:>7.2f} {s['ok']:>5} {s['errors'] + s['unfinished']:>4} {s['throughput']:>7.2f} "
+              f"{lat['p50']:>7.2f} {lat['p95']:>7.2f} {lat['p99']:>7.2f} {s['queued_s']['mean']:>7.2f} "
+              f"{s['waiting_s']:>8.2f}")
+        if s["generator_lag_p99_s"] > 0.05:
+            print(f"        (load generator lagged {s['generator_lag_p99_s'] * 1000:.0f} ms at p99; "
+                  f"arrivals are not truly open loop)")
+    print()
+    print(f"{'rate/s':>7} {'worker':>7} {'reqs':>5} {'web cpu s':>10} {'render cpu s':>13} {'rss MB':>7} "
+          f"{'render rss MB':>14}")
+    for s in steps:
+        for w in s["workers"].values():
+            print(f"{s['rate']:>7.2f} {w['pid']:>7} {w['requests']:>5} {w['cpu_s']:>10.2f} {w['render_cpu_s']:>13.2f} "
+                  f"{w['maxrss_mb']:>7.0f} {w['render_maxrss_mb']:>14.0f}")
+    print()
+    print(f"capacity model ({model['cores']} cores):")
+    for tier, t in model["tiers"].items():
+        stub = f" (stub set {t['stub_cpu_s']:.2f})" if t["stub_cpu_s"] is not None else ""
+        print(f"  {tier:<9} {t['cpu_s_per_render']:>7.2f} CPU-s per render{stub}, "
+              f"{t['renders_per_hour_per_core']:>7.0f} renders/hour/core, over {t['renders']} renders")
+    print(f"  request handling: {model['cpu_s_per_request'] * 1000:.1f} CPU-ms per request")
+    if "saturation_rate" in model:
+        print(f"  at this mix the host saturates at {model['saturation_rate']:.2f} arrivals/s "
+              f"({model['cpu_s_per_arrival']:.2f} CPU-s each); "
+              + (f"latency broke down at {knee} arrivals/s" if knee else "no step reached it"))
+
+
+async def run(args) -> None:
+    import httpx
+
+    rows = load_sample(args.sample)
+    rates = [float(r) for r in args.rates.split(",")]
+    rng = random.Random(args.seed)
+    data_dir = Path(tempfile.mkdtemp(prefix="flask_load_"))
+    workers = start_workers(args, data_dir)
+    ports = [port for port, _ in workers]
+    try:
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=0)
+        async with httpx.AsyncClient(limits=limits, timeout=args.drain) as client:
+            await wait_ready(client, ports)
+            videos, counter, steps = [], iter(range(1, 10 ** 9)), []
+            for rate in rates:
+                before = await worker_stats(client, ports)
+                records, unfinished, elapsed = await run_rate(client, args, ports, rate, rows, videos, rng, counter)
+                after = await worker_stats(client, ports)
+                steps.append(summarize_step(rate, records, unfinished, elapsed, before, after))
+    finally:
+        for _, proc in workers:
+            proc.kill()
+            proc.wait()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    model = fit_capacity(steps, os.cpu_count() or 1, parse_pairs(args.stub_cpu) if args.renderer == "stub" else None)
+    knee = observed_knee(steps)
+    print_report(args, steps, model, knee)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "steps": steps, "model": model, "knee_rate": knee}, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sample", default=DEFAULT_SAMPLE)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4, help="request threads per worker")
+    parser.add_argument("--rates", default="0.5,1,2", help="arrival rates in requests/s, one step each")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per rate")
+    parser.add_argument("--drain", type=float, default=300.0, help="seconds to wait for a step's last responses")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--novel", type=float, default=0.5, help="share of questions that produce a new lesson")
+    parser.add_argument("--llm-ms", type=float, default=2500.0, help="median stubbed LLM latency")
+    parser.add_argument("--renderer", choices=("stub", "manim"), default="stub")
+    parser.add_argument("--stub-cpu", default=DEFAULT_STUB_CPU, help="CPU-seconds per stubbed render, by tier")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write steps and model to this file")
+    # Internal: run as one server worker
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args)
+    else:
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
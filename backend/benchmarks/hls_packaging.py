@@ -0,0 +1,146 @@
+"""
+HLS packaging time, and bytes served against the single 1080p MP4.
+
+Renders a synthetic lesson natively at each ladder height (lines of text
+revealed left to right on a dark background, encoded with x264 like Manim's
+output). With --lesson, Manim renders a real lesson JSON at each quality
+instead. Every rendition is segmented with `hls.segment`. The script then
+models one full viewing per link speed:
+
+- MP4: the player downloads the whole 1080p file
+- HLS: the player takes the highest rendition whose peak bandwidth fits in
+  80% of the link
+
+For each link it reports bytes served, time to first frame (the first
+segment's worth of video) and stall time.
+
+    python benchmarks/hls_packaging.py [--seconds 30] [--fps 30]
+    python benchmarks/hls_packaging.py --lesson video_generator/build/lesson_x.json
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import av
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "video_generator"))
+
+from hls import HLS_LADDER, segment
+from render_profile import QUALITY_HEIGHTS
+
+# Per-viewer throughput in Mbit/s (a school access point is shared by a whole class)
+LINKS = {"school Wi-Fi, 30 pupils": 0.05, "phone 3G": 0.4, "phone 4G": 4.0, "home broadband": 25.0}
+LINES = ["f(x) = x^3 + 2x^2 - 5x", "f'(x) = 3x^2 + 4x - 5", "f'(2) = 12 + 8 - 5 = 15",
+         "Tangent: y - 6 = 15(x - 2)", "y = 15x - 24"]
+
+
+def synthetic_lesson(path: Path, height: int, fps: int, seconds: float) -> Path:
+    """Text lines written one after another, each over 1.5 s, then held."""
+    width = (height * 16 // 9 + 1) // 2 * 2
+    font = ImageFont.load_default(size=height // 14)
+    canvas = Image.new("RGB", (width, height), (17, 17, 17))
+    draw = ImageDraw.Draw(canvas)
+    out = av.open(str(path), "w")
+    stream = out.add_stream("libx264", rate=fps)
+    stream.width, stream.height, stream.pix_fmt = width, height, "yuv420p"
+    stream.options = {"crf": "23", "preset": "medium"}
+    per_line = 1.5 * fps
+    total = int(seconds * fps)
+    for i in range(total):
+        line = int(i // per_line) % len(LINES)
+        if line == 0 and i % (per_line * len(LINES)) == 0:
+            draw.rectangle((0, 0, width, height), fill=(17, 17, 17))
+        y = height // 10 + line * height // 6
+        draw.text((width // 12, y), LINES[line], font=font, fill=(235, 235, 235))
+        # Reveal the line left to right, as Write() does
+        shown = np.asarray(canvas).copy()
+        cut = width // 12 + int(width * 0.8 * ((i % per_line) + 1) / per_line)
+        shown[y:y + height // 6, cut:] = 17
+        frame = av.VideoFrame.from_ndarray(shown, format="rgb24")
+        for packet in stream.encode(frame):
+            out.mux(packet)
+    for packet in stream.encode():
+        out.mux(packet)
+    out.close()
+    return path
+
+
+def manim_lesson(lesson_json: Path, quality: str, fps: int, work: Path) -> Path:
+    from manim_runner import compile_manim
+    return compile_manim(lesson_json, quality=quality, fps=fps, out_name=f"{QUALITY_HEIGHTS[quality]}p",
+                         media_dir=work / quality, stills=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--lesson", type=Path, help="render this lesson JSON with Manim instead")
+    args = parser.parse_args()
+
+    work = Path(tempfile.mkdtemp(prefix="hls_bench_"))
+    try:
+        videos, render_s = {}, {}
+        for quality in sorted(HLS_LADDER, key=QUALITY_HEIGHTS.get):
+            height = QUALITY_HEIGHTS[quality]
+            t0 = time.perf_counter()
+            if args.lesson:
+                videos[height] = manim_lesson(args.lesson.resolve(), quality, args.fps, work)
+            else:
+                videos[height] = synthetic_lesson(work / f"{height}p.mp4", height, args.fps, args.seconds)
+            render_s[height] = time.perf_counter() - t0
+
+        package = work / "package"
+        package.mkdir()
+        renditions, segment_s = {}, {}
+        for height, path in videos.items():
+            t0 = time.perf_counter()
+            renditions[height] = segment(path, package, f"{height}p")
+            segment_s[height] = time.perf_counter() - t0
+
+        top = max(videos)
+        mp4_bytes = videos[top].stat().st_size
+        duration = renditions[top].duration
+        source = "manim" if args.lesson else "synthetic"
+        print(f"lesson:  {duration:.1f} s at {args.fps} fps ({source})")
+        print(f"{'rendition':<10} {'render':>8} {'segment':>8} {'segments':>9} {'MB':>7} {'peak Mbps':>10}")
+        for height, r in renditions.items():
+            count = len(list(package.glob(f"{height}p_*.m4s")))
+            print(f"{r.name:<10} {render_s[height]:>7.1f}s {segment_s[height] * 1000:>6.0f}ms "
+                  f"{count:>9} {r.bytes / 1e6:>7.2f} {r.bandwidth / 1e6:>10.2f}")
+        extra = sum(render_s[h] for h in videos if h != top)
+        print(f"extra rungs cost {extra / render_s[top]:.0%} of the {top}p render (sequential; "
+              f"the pipeline renders them in parallel), segmenting all "
+              f"{sum(segment_s.values()) * 1000:.0f} ms; fMP4 segments add "
+              f"{renditions[top].bytes / mp4_bytes - 1:.1%} over the MP4")
+
+        print()
+        def first_segment(r):
+            return sum((package / f"{r.name}{part}").stat().st_size for part in ("_init.mp4", "_00000.m4s"))
+
+        print(f"{'link':<24} {'MP4 MB':>7} {'start':>7} {'stall':>7}   {'HLS':>6} {'MB':>6} {'start':>7} {'stall':>7}")
+        for link, mbps in LINKS.items():
+            bps = mbps * 1e6
+            # Progressive MP4 (moov in front): starts once the same first seconds of 1080p arrived,
+            # then stalls whenever the download falls behind playback
+            mp4_start = first_segment(renditions[top]) * 8 / bps
+            mp4_stall = max(0.0, mp4_bytes * 8 / bps - duration - mp4_start)
+            fitting = [r for r in renditions.values() if r.bandwidth <= 0.8 * bps]
+            r = max(fitting, key=lambda r: r.bandwidth) if fitting else min(renditions.values(), key=lambda r: r.bandwidth)
+            hls_start = first_segment(r) * 8 / bps
+            hls_stall = max(0.0, r.bytes * 8 / bps - duration - hls_start)
+            print(f"{link:<24} {mp4_bytes / 1e6:>7.2f} {mp4_start:>6.2f}s {mp4_stall:>6.1f}s   "
+                  f"{r.name:>6} {r.bytes / 1e6:>6.2f} {hls_start:>6.2f}s {hls_stall:>6.1f}s")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
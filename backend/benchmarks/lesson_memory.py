@@ -0,0 +1,141 @@
+"""
+Validation cost and memory footprint of lessons in the pipeline.
+
+Replays the lessons of a traffic sample (plus the local solver's lessons for
+the same questions) through two paths:
+
+  before   validate in llm_client, dump to JSON, validate again in the pipeline,
+           canonicalize into a new validated Lesson, model_dump for the
+           fingerprint, the job event and the file LessonScene reads
+  after    validate once, canonicalize into a CompactLesson, fingerprint
+           cached, to_dict for the file and the event
+
+and reports the time per lesson, then the memory held by N cached canonical
+lessons as pydantic models vs CompactLesson (tracemalloc), and the cost of a
+fingerprint with and without the cached value.
+
+    python benchmarks/lesson_memory.py [benchmarks/data/traffic_sample.jsonl] [--lessons 10000]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "video_generator"))
+
+from lesson_canon import canonicalize_lesson
+from lesson_compact import CompactLesson, hash_data
+from lesson_schema import Lesson
+from local_solver import solve_locally
+
+DEFAULT_SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "traffic_sample.jsonl")
+
+
+def load_corpus(path):
+    corpus = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            try:
+                corpus.append(Lesson.model_validate(row["lesson"]).model_dump())
+            except Exception:
+                continue
+            solved = solve_locally(row.get("question", ""))
+            if solved is not None:
+                corpus.append(solved[1].model_dump())
+    return corpus
+
+
+def before(data):
+    raw = Lesson.model_validate(data)                                 # llm_client
+    raw = Lesson.model_validate(json.loads(json.dumps(raw.model_dump())))  # pipeline
+    lesson = Lesson.model_validate(canonicalize_lesson(raw).to_dict())     # canonicalize_lesson
+    fingerprint = hash_data(lesson.model_dump(exclude_none=True))          # cache key
+    json.dumps(lesson.model_dump())                                   # lesson_<id>.json
+    json.dumps(lesson.model_dump())                                   # job event
+    Lesson.model_validate(lesson.model_dump())                        # LessonScene
+    return fingerprint
+
+
+def after(data):
+    raw = Lesson.model_validate(data)                                 # llm_client
+    lesson = canonicalize_lesson(raw)                                 # CompactLesson
+    fingerprint = lesson.fingerprint
+    payload = lesson.to_dict()
+    json.dumps(payload)                                               # lesson_<id>.json
+    json.dumps(payload)                                               # job event
+    CompactLesson.from_dict(payload)                                  # LessonScene
+    return fingerprint
+
+
+def time_per_lesson(fn, corpus, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for data in corpus:
+            fn(data)
+    return (time.perf_counter() - t0) / (repeat * len(corpus))
+
+
+def held_bytes(build, corpus, n):
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    held = [build(corpus[i % len(corpus)]) for i in range(n)]
+    size = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del held
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sample", nargs="?", default=DEFAULT_SAMPLE)
+    parser.add_argument("--lessons", type=int, default=10000, help="cached lessons for the memory comparison")
+    parser.add_argument("--repeat", type=int, default=50, help="passes over the corpus for timings")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.sample)
+    canonical = [canonicalize_lesson(Lesson.model_validate(d)).to_dict() for d in corpus]
+    for data in corpus:  # warm the canonical expression cache for both paths
+        assert before(data) == after(data)
+
+    t_before = time_per_lesson(before, corpus, args.repeat)
+    t_after = time_per_lesson(after, corpus, args.repeat)
+    print(f"corpus:            {len(corpus)} lessons ({len(corpus) - len(set(map(str, corpus)))} duplicates)")
+    print(f"pipeline before:   {t_before * 1e6:8.1f} us/lesson")
+    print(f"pipeline after:    {t_after * 1e6:8.1f} us/lesson  ({1 - t_after / t_before:.0%} less)")
+
+    pydantic_bytes = held_bytes(Lesson.model_validate, canonical, args.lessons)
+    compact_bytes = held_bytes(CompactLesson.from_dict, canonical, args.lessons)
+    print(f"\n{args.lessons} cached lessons")
+    print(f"pydantic Lesson:   {pydantic_bytes / 1e6:8.2f} MB  ({pydantic_bytes / args.lessons:.0f} B/lesson)")
+    print(f"CompactLesson:     {compact_bytes / 1e6:8.2f} MB  ({compact_bytes / args.lessons:.0f} B/lesson, "
+          f"{1 - compact_bytes / pydantic_bytes:.0%} less)")
+
+    models = [Lesson.model_validate(d) for d in canonical]
+    compact = [CompactLesson.from_dict(d) for d in canonical]
+    for lesson in compact:
+        lesson.fingerprint
+    n = args.repeat * len(canonical)
+    t0 = time.perf_counter()
+    for _ in range(args.repeat):
+        for lesson in models:
+            hash_data(lesson.model_dump(exclude_none=True))
+    t_dump = (time.perf_counter() - t0) / n
+    t0 = time.perf_counter()
+    for _ in range(args.repeat):
+        for lesson in compact:
+            lesson.fingerprint
+    t_cached = (time.perf_counter() - t0) / n
+    print(f"\nfingerprint, model_dump + hash: {t_dump * 1e6:8.2f} us")
+    print(f"fingerprint, cached:            {t_cached * 1e6:8.2f} us")
+
+
+if __name__ == "__main__":
+    main()
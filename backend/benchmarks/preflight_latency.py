@@ -0,0 +1,169 @@
+"""
+Pre-flight LaTeX check: latency per lesson, and the broken lessons it stops.
+
+Takes the lessons of a traffic sample and breaks a share of them with the
+mistakes LLM output tends to have: undefined commands, a double superscript,
+a missing brace. Every lesson is checked twice:
+
+- pool: `tex_preflight.TexPreflight`, persistent latex processes
+- fresh: one `latex` run per string, as Manim compiles them
+
+It reports the latency per lesson for both and how many of the broken lessons
+each catches. With --manim, the broken lessons are also rendered, to time
+how long Manim takes to fail without the check. Needs `latex` on the PATH.
+
+    python benchmarks/preflight_latency.py [benchmarks/data/traffic_sample.jsonl] [--broken 0.2] [--repeat 5] [--manim]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "video_generator"))
+
+from lesson_canon import canonicalize_lesson
+from lesson_compact import CompactLesson
+from lesson_schema import Lesson
+from tex_preflight import PREAMBLE, PREFLIGHT_WORKERS, TexPreflight, check_lesson, guard, lesson_tex
+
+DEFAULT_SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "traffic_sample.jsonl")
+# (description, how a step gets broken)
+MISTAKES = [
+    ("undefined command", lambda s: s + r" \degree"),
+    ("double superscript", lambda s: s + "^2^3"),
+    ("missing brace", lambda s: r"\frac{1}{2" + " " + s),
+    ("text command in math", lambda s: r"\textbf x_{\R} " + s),
+]
+
+
+def load_lessons(path):
+    lessons = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip() and "lesson" in json.loads(line):
+                lesson = canonicalize_lesson(Lesson.model_validate(json.loads(line)["lesson"]))
+                lessons[lesson.fingerprint] = lesson
+    return list(lessons.values())
+
+
+def break_lesson(lesson, rng):
+    data = lesson.to_dict()
+    name, mistake = rng.choice(MISTAKES)
+    i = rng.randrange(len(data["steps"]))
+    data["steps"][i] = mistake(data["steps"][i])
+    return CompactLesson.from_dict(data), name
+
+
+def fresh_check(lesson, work: Path):
+    """One latex process per string, like Manim; returns the number of strings that failed."""
+    failed = 0
+    for n, item in enumerate(lesson_tex(lesson)):
+        if guard(item.latex):
+            failed += 1
+            continue
+        tex = work / f"s{n}.tex"
+        tex.write_text(
+            PREAMBLE + f"\n\\begin{{{item.environment}}}\n{item.latex}\n\\end{{{item.environment}}}\n\\end{{document}}\n"
+        )
+        proc = subprocess.run(["latex", "-interaction=batchmode", "-halt-on-error", tex.name],
+                              cwd=work, stdin=subprocess.DEVNULL, capture_output=True)
+        failed += proc.returncode != 0
+    return failed
+
+
+def manim_failure_seconds(lesson, work: Path):
+    from manim_runner import compile_manim
+    json_path = work / "broken.json"
+    json_path.write_text(json.dumps(lesson.to_dict()))
+    t0 = time.perf_counter()
+    try:
+        compile_manim(json_path, quality="l", out_name="broken", media_dir=work / "media", stills=False)
+    except Exception:
+        return time.perf_counter() - t0
+    return None
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000 if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sample", nargs="?", default=DEFAULT_SAMPLE)
+    parser.add_argument("--broken", type=float, default=0.2, help="share of lessons to break")
+    parser.add_argument("--manim", action="store_true", help="also time Manim failing on the broken lessons")
+    parser.add_argument("--repeat", type=int, default=5, help="passes over the sample, each broken differently")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if shutil.which("latex") is None:
+        sys.exit("latex is not on the PATH")
+    rng = random.Random(args.seed)
+    lessons = load_lessons(args.sample)
+    cases = []
+    for _ in range(args.repeat):
+        broken = set(rng.sample(range(len(lessons)), round(args.broken * len(lessons))))
+        for i, lesson in enumerate(lessons):
+            cases.append(break_lesson(lesson, rng) if i in broken else (lesson, None))
+
+    pool = TexPreflight(timeout=30)
+    t0 = time.perf_counter()
+    pool.start()
+    pool.check(lesson_tex(cases[0][0])[:1])
+    startup = time.perf_counter() - t0
+
+    work = Path(tempfile.mkdtemp(prefix="preflight_bench_"))
+    try:
+        pool_s, fresh_s, manim_s = [], [], []
+        caught = {"pool": 0, "fresh": 0}
+        false_alarms = {"pool": 0, "fresh": 0}
+        by_mistake = {}
+        for lesson, mistake in cases:
+            t0 = time.perf_counter()
+            reports = check_lesson(pool, lesson)
+            pool_s.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            fresh_failed = fresh_check(lesson, work)
+            fresh_s.append(time.perf_counter() - t0)
+            for name, failed in (("pool", bool(reports)), ("fresh", bool(fresh_failed))):
+                if mistake and failed:
+                    caught[name] += 1
+                elif failed:
+                    false_alarms[name] += 1
+            if mistake:
+                by_mistake.setdefault(mistake, [0, 0])
+                by_mistake[mistake][0] += 1
+                by_mistake[mistake][1] += bool(reports)
+                if args.manim:
+                    seconds = manim_failure_seconds(lesson, work)
+                    if seconds is not None:
+                        manim_s.append(seconds)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    broken = sum(1 for _, m in cases if m)
+    strings = sum(len(lesson_tex(l)) for l, _ in cases)
+    print(f"lessons:      {len(cases)} ({strings} TeX strings), {broken} broken")
+    print(f"pool:         {PREFLIGHT_WORKERS} latex processes, started in {startup * 1000:.0f} ms")
+    print(f"{'check':<8} {'p50 ms':>8} {'p95 ms':>8} {'caught':>8} {'false alarms':>13}")
+    for name, seconds in (("pool", pool_s), ("fresh", fresh_s)):
+        print(f"{name:<8} {pct(seconds, 0.5):>8.1f} {pct(seconds, 0.95):>8.1f} "
+              f"{caught[name]:>5}/{broken:<2} {false_alarms[name]:>13}")
+    for mistake, (n, hit) in sorted(by_mistake.items()):
+        print(f"  {mistake:<22} {hit}/{n} caught")
+    if manim_s:
+        avg = sum(manim_s) / len(manim_s)
+        print(f"manim takes {avg:.1f} s to fail on a broken lesson (480p); the pool check rejects it in "
+              f"{pct(pool_s, 0.5):.0f} ms, {caught['pool'] * avg:.0f} s of failed renders avoided")
+
+
+if __name__ == "__main__":
+    main()
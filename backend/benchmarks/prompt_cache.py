@@ -0,0 +1,179 @@
+"""
+Request size and latency of the lesson prompt, with a stubbed Gemini transport.
+
+Replays the questions of a traffic sample through `ask_llm` with the client
+replaced by a stub that answers with the sample's lesson, and compares:
+
+  baseline   the previous path (FEW_SHOT + question through GenerativeModel)
+  prebuilt   full few-shot set, request template built once and copied
+  cached     full few-shot set stored in a (stubbed) Gemini context cache
+  lean-k     only the k most relevant examples from the local index
+
+Latency is modelled as a fixed time to first token plus a prefill cost per
+prompt token (cached tokens cost a fraction of that), tokens estimated as
+request bytes / 4. Client-side time to build the request is measured for real.
+
+    python benchmarks/prompt_cache.py [benchmarks/data/traffic_sample.jsonl] [--invalid 0.1]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from unittest import mock
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "video_generator"))
+os.environ.setdefault("GEMINI_KEY", "benchmark")
+
+import llm_client
+from google.generativeai import caching, protos
+
+DEFAULT_SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "traffic_sample.jsonl")
+BYTES_PER_TOKEN = 4
+
+
+class StubTransport:
+    """Stands in for the Gemini client: records requests and answers with canned lessons."""
+
+    def __init__(self, lessons, invalid_rate, ttft_ms, prefill_ms, cached_factor, cached_prefix_tokens):
+        self.lessons = lessons
+        self.invalid_rate = invalid_rate
+        self.ttft_ms = ttft_ms
+        self.prefill_ms = prefill_ms
+        self.cached_factor = cached_factor
+        self.cached_prefix_tokens = cached_prefix_tokens
+        self.rng = random.Random(0)
+        self.reset()
+
+    def reset(self):
+        self.rng.seed(0)
+        self.calls = 0
+        self.bytes = 0
+        self.tokens = 0
+        self.latency_ms = 0.0
+
+    def generate_content(self, request, **kwargs):
+        size = protos.GenerateContentRequest.pb(request).ByteSize()
+        tokens = size // BYTES_PER_TOKEN
+        cached = self.cached_prefix_tokens if request.cached_content else 0
+        self.calls += 1
+        self.bytes += size
+        self.tokens += tokens + cached
+        self.latency_ms += self.ttft_ms + (tokens + cached * self.cached_factor) * self.prefill_ms
+
+        # The question is the last user turn that isn't a repair message
+        texts = [c.parts[0].text for c in request.contents if c.role == "user"]
+        lesson = next((self.lessons[t] for t in reversed(texts) if t in self.lessons), None)
+        if lesson is None or self.rng.random() < self.invalid_rate:
+            part = protos.Part(text="Here is the lesson you asked for.")
+        else:
+            part = protos.Part(function_call=protos.FunctionCall(name="submit_lesson", args=lesson))
+        return protos.GenerateContentResponse(
+            candidates=[protos.Candidate(content=protos.Content(role="model", parts=[part]))],
+            usage_metadata={"prompt_token_count": tokens + cached, "cached_content_token_count": cached},
+        )
+
+
+def stub_cache(**kwargs):
+    return caching.CachedContent._from_obj(
+        protos.CachedContent(name="cachedContents/benchmark", model=f"models/{llm_client.MODEL_NAME}")
+    )
+
+
+def baseline_ask(question: str) -> str:
+    """The request path before prompt caching, kept here for comparison."""
+    convo = llm_client.FEW_SHOT + [{"role": "user", "parts": [{"text": question}]}]
+    try:
+        resp = llm_client.MODEL.generate_content(convo, tool_config=llm_client.TOOL_CONFIG)
+        return llm_client._lesson_from_response(resp)
+    except Exception as e1:
+        convo.append(llm_client._repair_message(e1))
+        resp2 = llm_client.MODEL.generate_content(convo, tool_config=llm_client.TOOL_CONFIG)
+        return llm_client._lesson_from_response(resp2, retry=True)
+
+
+def baseline_build(question: str):
+    convo = llm_client.FEW_SHOT + [{"role": "user", "parts": [{"text": question}]}]
+    return llm_client.build_request(convo)
+
+
+def run(name, ask, build, questions, transport):
+    transport.reset()
+    failures = 0
+    for q in questions:
+        try:
+            ask(q)
+        except Exception:
+            failures += 1
+    n = transport.calls
+
+    t0 = time.perf_counter()
+    for q in questions:
+        build(q)
+    build_us = (time.perf_counter() - t0) / len(questions) * 1e6
+    return {
+        "name": name,
+        "calls": n,
+        "bytes": transport.bytes / n,
+        "tokens": transport.tokens / n,
+        "latency_ms": transport.latency_ms / len(questions),
+        "build_us": build_us,
+        "failures": failures,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sample", nargs="?", default=DEFAULT_SAMPLE)
+    parser.add_argument("--invalid", type=float, default=0.1, help="share of first answers without a function call")
+    parser.add_argument("--repeat", type=int, default=20, help="passes over the sample")
+    parser.add_argument("--ttft-ms", type=float, default=350.0)
+    parser.add_argument("--prefill-ms", type=float, default=0.08, help="per uncached prompt token")
+    parser.add_argument("--cached-factor", type=float, default=0.25, help="relative cost of a cached token")
+    args = parser.parse_args()
+
+    lessons = {}
+    with open(args.sample) as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                lessons[row["question"]] = row["lesson"]
+    questions = list(lessons) * args.repeat
+
+    full = llm_client.PromptCache(context_cache=False)
+    prefix = full._local_template(llm_client.DEFAULT_EXAMPLES)
+    transport = StubTransport(lessons, args.invalid, args.ttft_ms, args.prefill_ms, args.cached_factor,
+                              prefix.ByteSize() // BYTES_PER_TOKEN)
+    llm_client.MODEL._client = transport
+
+    variants = [
+        ("prebuilt", full),
+        ("cached", llm_client.PromptCache(context_cache=True)),
+        ("lean-1", llm_client.PromptCache(mode="lean", k=1)),
+        ("lean-2", llm_client.PromptCache(mode="lean", k=2)),
+    ]
+    with tempfile.TemporaryDirectory() as tmp, \
+            mock.patch.object(llm_client.genai_client, "get_default_generative_client", return_value=transport), \
+            mock.patch.object(caching.CachedContent, "create", side_effect=stub_cache):
+        os.chdir(tmp)  # _lesson_from_response writes ./build/lesson.json
+        results = [run("baseline", baseline_ask, baseline_build, questions, transport)]
+        for name, prompt in variants:
+            llm_client.PROMPT = prompt
+            build = lambda q, prompt=prompt: prompt.request(q, [llm_client._question_turn(q)])
+            results.append(run(name, llm_client.ask_llm, build, questions, transport))
+
+    base = results[0]
+    print(f"{len(questions)} questions, {args.invalid:.0%} invalid first answers\n")
+    print(f"{'variant':<9} {'calls':>6} {'bytes/req':>10} {'tokens/req':>11} {'latency ms':>11} "
+          f"{'vs base':>8} {'build us':>9} {'failed':>7}")
+    for r in results:
+        delta = (r["latency_ms"] - base["latency_ms"]) / base["latency_ms"]
+        print(f"{r['name']:<9} {r['calls']:>6} {r['bytes']:>10.0f} {r['tokens']:>11.0f} {r['latency_ms']:>11.1f} "
+              f"{delta:>+8.0%} {r['build_us']:>9.0f} {r['failures']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+CPU cost of per-lesson frame rate selection (render_profile.py).
+
+Renders every distinct lesson of a corpus twice, once with the fixed preset
+(1080p60 for -qh) and once with the frame rate picked for its lesson class,
+and reports the CPU-seconds (user + sys of the Manim subprocess) saved per
+class. Needs Manim and a TeX installation.
+
+    python benchmarks/render_quality.py [benchmarks/data/traffic_sample.jsonl] [--quality h]
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "video_generator"))
+
+from lesson_canon import canonicalize_lesson, lesson_fingerprint
+from lesson_schema import Lesson
+from manim_runner import compile_manim
+from render_profile import choose_render_profile, default_profile, lesson_class
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "traffic_sample.jsonl")
+
+
+def load_corpus(path: str):
+    """Distinct canonical lessons of a JSONL file (one `lesson` per line)."""
+    lessons = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                lesson = canonicalize_lesson(Lesson.model_validate(row.get("lesson", row)))
+                lessons.setdefault(lesson_fingerprint(lesson, canonical=True), lesson)
+    return list(lessons.values())
+
+
+def child_cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def render_cpu(json_path: Path, profile) -> float:
+    before = child_cpu_seconds()
+    mp4 = compile_manim(json_path, quality=profile.quality, fps=profile.fps, out_name=f"bench_{uuid.uuid4().hex}")
+    cpu = child_cpu_seconds() - before
+    mp4.unlink()
+    return cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", nargs="?", default=DEFAULT_CORPUS)
+    parser.add_argument("--quality", default="h", help="Manim quality preset (l, m, h, p, k)")
+    args = parser.parse_args()
+
+    lessons = load_corpus(args.corpus)
+    baseline = default_profile(args.quality)
+    results = defaultdict(lambda: {"n": 0, "profile": "", "baseline": 0.0, "tuned": 0.0})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, lesson in enumerate(lessons):
+            json_path = Path(tmp) / f"lesson_{i}.json"
+            json_path.write_text(json.dumps(lesson.to_dict()))
+            tuned = choose_render_profile(lesson, args.quality, auto=True)
+
+            base_cpu = render_cpu(json_path, baseline)
+            # Same profile as the baseline (e.g. plots): nothing to measure twice
+            tuned_cpu = render_cpu(json_path, tuned) if tuned != baseline else base_cpu
+
+            row = results[lesson_class(lesson)]
+            row["n"] += 1
+            row["profile"] = tuned.tag
+            row["baseline"] += base_cpu
+            row["tuned"] += tuned_cpu
+            print(f"[{i + 1}/{len(lessons)}] {lesson_class(lesson)}: {lesson.title}", file=sys.stderr)
+
+    print(f"\n{'class':<8} {'n':>3} {'profile':>9} {'base cpu-s':>11} {'tuned cpu-s':>12} {'saved/lesson':>13} {'saved':>7}")
+    total_base = total_tuned = 0.0
+    for cls in ("text", "shapes", "plot"):
+        row = results.get(cls)
+        if not row:
+            continue
+        n = row["n"]
+        total_base += row["baseline"]
+        total_tuned += row["tuned"]
+        saved = row["baseline"] - row["tuned"]
+        print(f"{cls:<8} {n:>3} {row['profile']:>9} {row['baseline'] / n:>11.1f} {row['tuned'] / n:>12.1f} "
+              f"{saved / n:>13.1f} {saved / row['baseline']:>7.0%}")
+    if total_base:
+        print(f"\ntotal: {total_base:.1f} -> {total_tuned:.1f} CPU-seconds "
+              f"({(total_base - total_tuned) / total_base:.0%} saved)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+How shape construction and rendering cost scale with the number of shapes.
+
+For lessons with 1, 10 and 50 `geometric_shapes` this measures, in-process:
+  - create_geometric_shape with a cold and a warm template cache
+  - shape labels compiled one MathTex each vs. batch_math_tex (fresh TeX dir)
+and with --render also the full Manim render of each lesson (wall and CPU).
+Needs Manim and a TeX installation.
+
+    python benchmarks/shape_scaling.py [--counts 1 10 50] [--render] [--quality l]
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "video_generator"))
+
+from manim import MathTex, config
+
+import render_scene
+from lesson_schema import Lesson
+from manim_runner import compile_manim
+
+SHAPE_TYPES = ["square", "circle", "triangle"]
+COLORS = ["BLUE", "RED", "GREEN", "YELLOW", "ORANGE"]
+
+
+def shape_lesson(n: int) -> Lesson:
+    shapes = []
+    for i in range(n):
+        shapes.append({
+            "shape_type": SHAPE_TYPES[i % len(SHAPE_TYPES)],
+            "label": f"S_{{{i}}}",
+            "position": [(i % 10) * 2.0 - 9.0, (i // 10) * 2.0 - 4.0],
+            "size": 1.0 + (i % 3) * 0.5,
+            "color": COLORS[i % len(COLORS)],
+        })
+    return Lesson.model_validate({
+        "title": f"{n} shapes",
+        "steps": [r"A = s^2"],
+        "geometric_shapes": shapes,
+    })
+
+
+def timed(fn, repeat: int = 1) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat
+
+
+def bench_construction(lesson: Lesson) -> dict:
+    shapes = lesson.geometric_shapes
+
+    def build():
+        for s in shapes:
+            render_scene.create_geometric_shape(s)
+
+    render_scene._SHAPE_TEMPLATES.clear()
+    cold = timed(build)
+    warm = timed(build, repeat=5)
+
+    labels = [s.label for s in shapes]
+    with tempfile.TemporaryDirectory() as tex_dir:
+        config.tex_dir = tex_dir
+        separate = timed(lambda: [MathTex(l, font_size=24) for l in labels])
+    with tempfile.TemporaryDirectory() as tex_dir:
+        config.tex_dir = tex_dir
+        batched = timed(lambda: render_scene.batch_math_tex(labels, font_size=24))
+    return {"cold": cold, "warm": warm, "labels_separate": separate, "labels_batched": batched}
+
+
+def bench_render(lesson: Lesson, quality: str) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = Path(tmp) / "lesson.json"
+        json_path.write_text(json.dumps(lesson.model_dump()))
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu0 = usage.ru_utime + usage.ru_stime
+        t0 = time.perf_counter()
+        mp4 = compile_manim(json_path, quality=quality, out_name=f"bench_{uuid.uuid4().hex}")
+        wall = time.perf_counter() - t0
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        mp4.unlink()
+    return {"wall": wall, "cpu": usage.ru_utime + usage.ru_stime - cpu0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--counts", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--render", action="store_true", help="also time full Manim renders")
+    parser.add_argument("--quality", default="l")
+    args = parser.parse_args()
+
+    print(f"{'shapes':>6} {'build cold ms':>14} {'build warm ms':>14} {'labels 1-by-1 s':>16} {'labels batched s':>17}"
+          + (f" {'render wall s':>14} {'render cpu s':>13}" if args.render else ""))
+    for n in args.counts:
+        lesson = shape_lesson(n)
+        c = bench_construction(lesson)
+        line = (f"{n:>6} {c['cold'] * 1000:>14.2f} {c['warm'] * 1000:>14.2f} "
+                f"{c['labels_separate']:>16.2f} {c['labels_batched']:>17.2f}")
+        if args.render:
+            r = bench_render(lesson, args.quality)
+            line += f" {r['wall']:>14.1f} {r['cpu']:>13.1f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
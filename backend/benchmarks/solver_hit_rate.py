@@ -0,0 +1,76 @@
+"""
+Template hit rate of the local solver over a traffic sample.
+
+For every question in the sample this tries `solve_locally`, and reports
+the share answered without the LLM, the local latency per template, and how
+often the local lesson has the same canonical fingerprint (renders the same
+video) as the LLM lesson stored in the sample.
+
+    python benchmarks/solver_hit_rate.py [benchmarks/data/traffic_sample.jsonl] [--llm-ms 2500] [--misses]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "video_generator"))
+
+from lesson_canon import lesson_fingerprint
+from lesson_schema import Lesson
+from local_solver import solve_locally
+
+DEFAULT_SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "traffic_sample.jsonl")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sample", nargs="?", default=DEFAULT_SAMPLE)
+    parser.add_argument("--llm-ms", type=float, default=2500.0, help="typical Gemini latency, for the saving estimate")
+    parser.add_argument("--misses", action="store_true", help="print the questions no template matched")
+    args = parser.parse_args()
+
+    rows = []
+    with open(args.sample) as f:
+        for line in f:
+            if line.strip():
+                rows.append(json.loads(line))
+
+    solve_locally("derivative of x^2")  # warm up SymPy's printers and parser
+    per_template = defaultdict(lambda: {"hits": 0, "seconds": 0.0, "same_video": 0})
+    misses = []
+    for row in rows:
+        t0 = time.perf_counter()
+        match = solve_locally(row["question"])
+        elapsed = time.perf_counter() - t0
+        if match is None:
+            misses.append(row["question"])
+            continue
+        template, lesson = match
+        stats = per_template[template]
+        stats["hits"] += 1
+        stats["seconds"] += elapsed
+        if "lesson" in row and lesson_fingerprint(lesson) == lesson_fingerprint(Lesson.model_validate(row["lesson"])):
+            stats["same_video"] += 1
+
+    hits = sum(s["hits"] for s in per_template.values())
+    local_s = sum(s["seconds"] for s in per_template.values())
+    print(f"questions:   {len(rows)}")
+    print(f"hit rate:    {hits / len(rows):.1%} ({hits} answered locally)")
+    print(f"\n{'template':<11} {'hits':>5} {'avg ms':>7} {'same video as LLM':>18}")
+    for name, s in sorted(per_template.items()):
+        print(f"{name:<11} {s['hits']:>5} {s['seconds'] / s['hits'] * 1000:>7.1f} {s['same_video']:>18}")
+    if hits:
+        saved = hits * args.llm_ms / 1000 - local_s
+        print(f"\nlatency saved: {saved:.1f}s over the sample, {saved / len(rows) * 1000:.0f} ms/question "
+              f"(at {args.llm_ms:.0f} ms per LLM call)")
+    if args.misses:
+        print("\nleft to the LLM:")
+        for q in misses:
+            print(f"  - {q}")
+
+
+if __name__ == "__main__":
+    main()
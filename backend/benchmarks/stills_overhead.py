@@ -0,0 +1,78 @@
+"""
+Cost of recording the poster and preview during a render, and their size.
+
+Feeds StillsRecorder the frames of a synthetic lesson (1080p, text-like
+strokes being drawn onto a dark background, with static waits between
+steps) the way LessonScene does, and reports the time it adds per second
+of video next to the file sizes. Manim itself spends seconds of CPU on each
+second of 1080p video, so the recording cost is small next to it.
+
+    python benchmarks/stills_overhead.py [--seconds 20] [--fps 30]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "video_generator"))
+
+from stills import StillsRecorder
+
+
+def timeline(seconds, fps, rng):
+    """(frame, num_frames) pairs: a stroke drawn over 1.2 s, then a 0.3 s static wait."""
+    frame = np.zeros((1080, 1920, 4), dtype=np.uint8)
+    frame[..., 3] = 255
+    row = 200
+    elapsed = 0.0
+    while elapsed < seconds:
+        draw_frames = int(1.2 * fps)
+        width = rng.integers(600, 1400)
+        for i in range(draw_frames):
+            frame = frame.copy()  # Manim hands out a new array per frame
+            x = 160 + int(width * (i + 1) / draw_frames)
+            frame[row:row + 40, 160:x, :3] = 230
+            yield frame, 1
+        yield frame, int(0.3 * fps)
+        elapsed += 1.5
+        row = 200 + (row + 80 - 200) % 720
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--fps", type=int, default=30)
+    args = parser.parse_args()
+
+    recorder = StillsRecorder(args.fps)
+    record_s = 0.0
+    writes = 0
+    for frame, n in timeline(args.seconds, args.fps, np.random.default_rng(0)):
+        t0 = time.perf_counter()
+        recorder.add_frame(frame, n)
+        if recorder.frames_seen >= args.seconds * args.fps / 2 and recorder.poster is None:
+            recorder.keep_poster()
+        record_s += time.perf_counter() - t0
+        writes += 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        written = recorder.save(os.path.join(tmp, "lesson"))
+        save_s = time.perf_counter() - t0
+        sizes = {kind: os.path.getsize(path) for kind, path in written.items()}
+
+    video_s = recorder.frames_seen / args.fps
+    print(f"video:            {video_s:.1f} s at {args.fps} fps ({recorder.frames_seen} frames, {writes} writes)")
+    print(f"recording:        {record_s * 1000:.0f} ms ({record_s / video_s * 1000:.1f} ms per video second)")
+    print(f"encoding stills:  {save_s * 1000:.0f} ms")
+    print(f"preview frames:   {len(recorder.preview)}")
+    for kind, size in sizes.items():
+        print(f"{kind + ':':<17} {size / 1024:.1f} KiB ({written[kind].rsplit('.', 1)[-1]})")
+
+
+if __name__ == "__main__":
+    main()
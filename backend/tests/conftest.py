@@ -0,0 +1,21 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# video_generator modules import each other by bare name, as they do under app.py
+sys.path.insert(0, os.path.join(BACKEND_DIR, "video_generator"))
+sys.path.insert(0, BACKEND_DIR)
+
+# Keep renders, caches and checkpoints out of the real media and build dirs
+_DATA_DIR = tempfile.mkdtemp(prefix="clulus_tests_")
+atexit.register(shutil.rmtree, _DATA_DIR, ignore_errors=True)
+os.environ.setdefault("CLULUS_MEDIA_DIR", os.path.join(_DATA_DIR, "media"))
+os.environ.setdefault("CLULUS_BUILD_DIR", os.path.join(_DATA_DIR, "build"))
+# llm_client refuses to import without a key; no test calls Gemini
+os.environ.setdefault("GEMINI_KEY", "test")
+# No sweeper thread or TeX processes in the test process; tests that need them start their own
+os.environ.setdefault("RETENTION_SWEEP_SECONDS", "0")
+os.environ.setdefault("PREFLIGHT_TEX", "0")
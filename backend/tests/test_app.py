@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+
+import app as flask_app
+from conftest import BACKEND_DIR
+
+
+def sse_events(body: str):
+    events = []
+    for frame in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in frame.splitlines() if not line.startswith(":"))
+        if fields:
+            events.append((int(fields["id"]), fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_job_events_replay_after_last_event_id():
+    job = flask_app.JOBS.create("What is 2+2?")
+    job.emit("llm_started", {"question": job.question})
+    job.emit("lesson_validated", {"lesson": {}})
+    job.emit("render_started", {"fps": 30})
+    job.emit("done", {"filename": "x.mp4"})
+    client = flask_app.app.test_client()
+
+    everything = sse_events(client.get(f"/jobs/{job.id}/events").get_data(as_text=True))
+    assert [e[1] for e in everything] == ["llm_started", "lesson_validated", "render_started", "done"]
+
+    # A reconnecting client only gets what it missed
+    resumed = client.get(f"/jobs/{job.id}/events", headers={"Last-Event-ID": "1"})
+    assert [(e[0], e[1]) for e in sse_events(resumed.get_data(as_text=True))] == [(2, "render_started"), (3, "done")]
+    # Garbage ids replay from the start
+    garbage = client.get(f"/jobs/{job.id}/events", headers={"Last-Event-ID": "abc"})
+    assert len(sse_events(garbage.get_data(as_text=True))) == 4
+
+    assert client.get("/jobs/missing/events").status_code == 404
+    assert client.get(f"/jobs/{job.id}").get_json()["status"] == "done"
+
+
+def test_app_imports_without_video_dependencies():
+    # PyAV missing: the app still serves /health, with video generation unavailable
+    code = (
+        "import sys; sys.modules['av'] = None\n"
+        "import app\n"
+        "client = app.app.test_client()\n"
+        "print(client.get('/health').get_json()['video_generation'])\n"
+        "print(client.post('/jobs', json={'question': 'q'}).status_code)\n"
+        "print(client.get('/jobs/x/events').status_code)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=dict(os.environ),
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split()[-3:] == ["not_available", "503", "404"]
@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+
+from starlette.testclient import TestClient
+
+import asgi
+from conftest import BACKEND_DIR
+from video_generator.render_cache import VIDEO_CACHE_DIR
+
+
+def test_get_video_serves_cached_file():
+    VIDEO_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    (VIDEO_CACHE_DIR / "served.mp4").write_bytes(b"0123456789")
+    client = TestClient(asgi.app)
+
+    response = client.get("/get_video/served.mp4")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "video/mp4"
+    assert response.content == b"0123456789"
+
+    response = client.get("/get_video/served.mp4", headers={"Range": "bytes=2-5"})
+    assert response.status_code == 206
+    assert response.content == b"2345"
+
+    assert client.get("/get_video/missing.mp4").status_code == 404
+
+
+def test_asgi_imports_without_video_dependencies():
+    code = (
+        "import sys; sys.modules['av'] = None\n"
+        "from starlette.testclient import TestClient\n"
+        "import asgi\n"
+        "client = TestClient(asgi.app)\n"
+        "print(client.get('/health').json()['video_generation'])\n"
+        "print(client.get('/jobs/x').status_code)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=dict(os.environ),
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split()[-2:] == ["not_available", "404"]
@@ -0,0 +1,49 @@
+import pytest
+
+from benchmarks.flask_load import fit_capacity, observed_knee
+
+COST = {"480p15": 2.0, "1080p30": 10.0}
+
+
+def step(rate, workers, p95=1.0):
+    """A load step whose workers rendered `workers` = [{tier: renders}, ...] at exactly COST each."""
+    return {
+        "rate": rate,
+        "ok": sum(sum(r.values()) for r in workers) * 2,
+        "throughput": rate,
+        "latency_s": {"p95": p95},
+        "workers": {
+            port: {"renders": renders, "render_cpu_s": sum(COST[t] * n for t, n in renders.items()),
+                   "cpu_s": 0.1 * sum(renders.values()), "requests": 2 * sum(renders.values())}
+            for port, renders in enumerate(workers)
+        },
+    }
+
+
+def test_fit_recovers_per_tier_cost():
+    steps = [
+        step(1, [{"480p15": 3}, {"1080p30": 1}]),
+        step(2, [{"480p15": 1, "1080p30": 2}, {"480p15": 4}]),
+    ]
+    model = fit_capacity(steps, cores=4, stub_cpu={"480p15": 1.5})
+    assert model["tiers"]["480p15"]["cpu_s_per_render"] == pytest.approx(2.0)
+    assert model["tiers"]["1080p30"]["renders_per_hour_per_core"] == pytest.approx(360)
+    assert model["tiers"]["480p15"]["stub_cpu_s"] == 1.5
+    assert model["tiers"]["1080p30"]["renders"] == 3
+    assert model["cpu_s_per_request"] == pytest.approx(0.05)
+    # 46 CPU-s of renders over 22 requests, plus handling each request
+    assert model["saturation_rate"] == pytest.approx(4 / (46 / 22 + 0.05))
+
+
+def test_fit_without_renders():
+    model = fit_capacity([step(1, [{}])], cores=2)
+    assert model["tiers"] == {}
+    assert "saturation_rate" not in model
+
+
+def test_knee_is_first_step_behind():
+    steps = [step(1, [{}]), step(2, [{}], p95=2.5), step(4, [{}], p95=3.5), step(8, [{}])]
+    assert observed_knee(steps) == 4
+    steps[1]["throughput"] = 1.5
+    assert observed_knee(steps) == 2
+    assert observed_knee(steps[:1]) is None
@@ -0,0 +1,70 @@
+import av
+import numpy as np
+import pytest
+
+import hls
+from hls import MASTER_PLAYLIST, package_hls, segment
+from render_profile import RenderProfile
+
+
+def h264(path, height, seconds=3, fps=15):
+    """A short H.264 MP4 with a keyframe every second."""
+    width = height * 16 // 9
+    with av.open(str(path), "w") as container:
+        stream = container.add_stream("libx264", rate=fps, options={"g": str(fps), "keyint_min": str(fps)})
+        stream.width, stream.height, stream.pix_fmt = width, height, "yuv420p"
+        for i in range(seconds * fps):
+            image = np.random.default_rng(i).integers(0, 255, (height, width, 3), dtype=np.uint8)
+            container.mux(stream.encode(av.VideoFrame.from_ndarray(image, format="rgb24")))
+        container.mux(stream.encode())
+    return path
+
+
+def test_ladder_skips_rungs_at_or_above_the_lesson(monkeypatch):
+    monkeypatch.setattr(hls, "HLS_LADDER", ["l", "m", "h"])
+    assert hls.ladder(RenderProfile("h", 30)) == [RenderProfile("l", 30), RenderProfile("m", 30)]
+    assert hls.ladder(RenderProfile("l", 15)) == []
+
+
+def test_segment_copies_at_keyframes(tmp_path):
+    video = h264(tmp_path / "in.mp4", 180)
+    rendition = segment(video, tmp_path, "180p", seconds=1)
+    assert (rendition.width, rendition.height, rendition.fps) == (320, 180, 15.0)
+    assert rendition.codecs.startswith("avc1.")
+    assert rendition.duration == pytest.approx(3, abs=0.1)
+    assert rendition.bandwidth >= rendition.average_bandwidth > 0
+    playlist = (tmp_path / "180p.m3u8").read_text()
+    assert "180p_init.mp4" in playlist and playlist.count("#EXTINF") == 3
+
+
+def test_package_lists_renditions_by_bandwidth(tmp_path, monkeypatch):
+    monkeypatch.setattr(hls, "HLS_LADDER", ["l", "m", "h"])
+    renders = []
+
+    def render(json_path, quality, fps, out_name, media_dir, stills):
+        renders.append((quality, fps, stills))
+        media_dir.mkdir(parents=True)
+        return h264(media_dir / f"{out_name}.mp4", {"l": 90, "m": 144}[quality], fps=fps)
+
+    dest = tmp_path / "key.hls"
+    video = h264(tmp_path / "key.mp4", 216)
+    renditions = package_hls(tmp_path / "lesson.json", video, RenderProfile("h", 15), dest,
+                             tmp_path / "work", render=render)
+    assert sorted(renders) == [("l", 15, False), ("m", 15, False)]
+    assert [r.name for r in renditions] == ["480p", "720p", "1080p"]
+    master = (dest / MASTER_PLAYLIST).read_text().splitlines()
+    assert [line for line in master if line.endswith(".m3u8")] == ["480p.m3u8", "720p.m3u8", "1080p.m3u8"]
+    assert not list(tmp_path.glob(".key.hls.*"))
+
+
+def test_failed_package_leaves_nothing_behind(tmp_path):
+    def render(*args, **kwargs):
+        raise RuntimeError("manim failed")
+
+    dest = tmp_path / "key.hls"
+    failures = hls.HLS_STATS.failures
+    with pytest.raises(RuntimeError):
+        package_hls(tmp_path / "lesson.json", tmp_path / "key.mp4", RenderProfile("h", 15), dest,
+                    tmp_path / "work", render=render)
+    assert list(tmp_path.iterdir()) == []
+    assert hls.HLS_STATS.failures == failures + 1
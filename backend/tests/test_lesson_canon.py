@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+from lesson_canon import DedupStats, canonical_expression, canonicalize_lesson, lesson_fingerprint
+from lesson_schema import Lesson
+
+BASE = {
+    "title": "Derivative of  $e^x + 6x$",
+    "steps": ["f(x) = e^x + 6x", r"f'(x) = \frac{d}{dx}(e^x) + \frac{d}{dx}(6x)", "f'(x)=e^x+6"],
+    "function_plots": [{"expression": "exp(x) + 6*x", "label": "f(x)"}, {"expression": "e**x + 6", "label": "f'(x)"}],
+    "x_min": -3,
+    "x_max": 3,
+}
+
+
+def fingerprint(**changes):
+    return lesson_fingerprint(Lesson.model_validate({**BASE, **changes}))
+
+
+def test_fingerprint_ignores_insignificant_differences():
+    same = fingerprint()
+    assert fingerprint(title="Derivative of $e^x + 6x$ ") == same
+    assert fingerprint(steps=["f(x)=e^x+6x", r"f'(x)=\frac{d}{dx}(e^x)+\frac{d}{dx}(6x)", "f'(x) = e^x + 6"]) == same
+    assert fingerprint(function_plots=[
+        {"expression": "6x+e^x", "label": "f(x)"}, {"expression": "6 + exp(x)", "label": " f'(x) "},
+    ]) == same
+    assert fingerprint(x_min=-3.00001) == same
+
+
+def test_fingerprint_changes_with_content():
+    same = fingerprint()
+    assert fingerprint(steps=["f(x)=e^x+6x", "f'(x)=e^x+6"]) != same
+    assert fingerprint(function_plots=[{"expression": "exp(x) + 7*x", "label": "f(x)"}]) != same
+    assert fingerprint(x_max=4) != same
+    # Spaces inside \text{} are typeset
+    assert fingerprint(steps=[r"\text{a b}"]) != fingerprint(steps=[r"\text{ab}"])
+
+
+def test_axis_range_only_counts_with_plots():
+    text_only = {"title": "Sum", "steps": ["1+1=2"]}
+    assert lesson_fingerprint(Lesson.model_validate({**text_only, "x_min": -5})) == \
+        lesson_fingerprint(Lesson.model_validate(text_only))
+
+
+def test_canonical_form_is_stable():
+    lesson = canonicalize_lesson(Lesson.model_validate(BASE))
+    again = canonicalize_lesson(lesson)
+    assert again.to_dict() == lesson.to_dict()
+    assert lesson_fingerprint(lesson, canonical=True) == lesson.fingerprint == again.fingerprint
+    assert canonical_expression("(x+1)**2") == canonical_expression("x^2 + 2x + 1")
+
+
+@pytest.mark.parametrize("a, b", [
+    ("sin(x)**2 + cos(x)**2", "1"),
+    ("(x**2 - 1)/(x - 1)", "x + 1"),
+    ("1/(x+1) + 1/(x-1)", "2x/(x^2 - 1)"),
+    ("2*sin(x)*cos(x)", "sin(2x)"),
+    ("tan(x)*cos(x)", "sin(x)"),
+])
+def test_equal_expressions_compare_equal(a, b):
+    assert canonical_expression(a) == canonical_expression(b)
+
+
+def test_long_trig_expression_is_bounded():
+    # sympy.simplify spent over 3 s on this one
+    expression = "sin(x+1)*cos(x-1)*tan(2*x+3)*sin(3*x)**2*cos(4*x)**3/(sin(x)+cos(x))+sin(5*x)*cos(6*x)**3"
+    t0 = time.perf_counter()
+    canonical = canonical_expression(expression)
+    assert time.perf_counter() - t0 < 1.5
+    assert "tan(2*x + 3)" in canonical
+
+
+def test_dedup_stats():
+    stats = DedupStats()
+    stats.record(Lesson.model_validate(BASE))
+    stats.record(Lesson.model_validate({**BASE, "title": "Derivative of $e^x + 6x$"}))
+    summary = stats.summary()
+    assert summary["lessons"] == 2
+    assert summary["unique_naive"] == 2
+    assert summary["unique_canonical"] == 1
+    assert summary["canonical_hit_rate"] == 0.5
@@ -0,0 +1,41 @@
+import pickle
+
+import pytest
+
+from lesson_compact import CompactLesson
+from lesson_schema import Lesson
+
+DATA = {
+    "title": "Area",
+    "steps": ["A = s^2", "A = 16"],
+    "function_plots": [{"expression": "x**2", "label": "f(x)"}],
+    "geometric_shapes": [{"shape_type": "square", "label": "s=4", "position": [0, 0], "size": 2.0}],
+    "x_min": -2,
+    "x_max": 2,
+}
+
+
+def test_round_trip_matches_validated_lesson():
+    lesson = CompactLesson.from_lesson(Lesson.model_validate(DATA))
+    again = CompactLesson.from_dict(lesson.to_dict())
+    assert again == lesson
+    assert again.to_dict() == lesson.to_dict()
+    assert lesson.to_dict()["steps"] == DATA["steps"]
+    assert lesson.geometric_shapes[0].shape_type == "square"
+
+
+def test_immutable_and_hashable():
+    lesson = CompactLesson.from_dict(DATA)
+    with pytest.raises(AttributeError):
+        lesson.title = "Other"
+    assert {lesson: 1}[CompactLesson.from_dict(DATA)] == 1
+    assert pickle.loads(pickle.dumps(lesson)) == lesson
+    assert CompactLesson.from_dict({**DATA, "title": "Other"}) != lesson
+
+
+def test_plot_samples():
+    lesson = CompactLesson.from_dict(DATA)
+    xs, ys = lesson.sample_plots(5)
+    assert list(xs) == [-2, -1, 0, 1, 2]
+    assert list(ys[0]) == [4, 1, 0, 1, 4]
+    assert not ys.flags.writeable
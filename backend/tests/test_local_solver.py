@@ -0,0 +1,41 @@
+import pytest
+
+from local_solver import solve_locally
+
+
+@pytest.mark.parametrize("question, last_step", [
+    ("Find the area of a square with side length 4", r"A = 16 \text{ square units}"),
+    ("a square has side 4, what is its area?", r"A = 16 \text{ square units}"),
+    ("area of a 5 cm square", r"A = 25 \text{ square units}"),
+    ("Area of a circle with radius 3", r"A = 9\pi \approx 28.27"),
+    ("circumference of a circle with diameter 10", r"C = 10\pi \approx 31.42"),
+    ("perimeter of a rectangle 3 by 5", r"P = 16 \text{ units}"),
+    ("area of a rectangle 5 cm long and 3 cm wide", r"A = 15 \text{ square units}"),
+    ("area of a triangle with base 6 and height 4", r"A = 12 \text{ square units}"),
+    ("area of a right triangle with legs 3 and 4", r"A = 6 \text{ square units}"),
+])
+def test_geometry(question, last_step):
+    template, lesson = solve_locally(question)
+    assert template == "geometry"
+    assert lesson.steps[-1] == last_step
+
+
+@pytest.mark.parametrize("question", [
+    # Asks for a dimension, not the area or perimeter
+    "What is the side length of a square with area 16?",
+    "Find the width of a rectangle with area 20 and length 5",
+    "find the height of a triangle with area 12 and base 4",
+    "the area of a square is 25, find the side",
+    "length of a rectangle with perimeter 20 and width 4",
+    # Mixed units
+    "area of a rectangle with length 2 cm and width 3 m",
+    # The asked quantity is given
+    "area of a square with side 4 and area 16",
+])
+def test_geometry_leaves_inverse_questions_to_llm(question):
+    assert solve_locally(question) is None
+
+
+def test_derivative_and_equation():
+    assert solve_locally("derivative of x^2")[1].steps[-1] == "f'(x)=2 x"
+    assert solve_locally("solve x^2 - 4 = 0")[0] == "equation"
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from video_generator import pipeline
+from test_hls import h264
+from test_preflight import FakePool, lesson
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """Stubs Manim out of the pipeline; returns the lessons it was asked to render."""
+    rendered = []
+
+    def compile_manim(json_path, quality="h", out_name=None, on_progress=None, fps=None, media_dir=None,
+                      stills=True, caching=False):
+        rendered.append(json_path.read_text())
+        media_dir.mkdir(parents=True, exist_ok=True)
+        out = media_dir / f"{out_name}.mp4"
+        out.write_bytes(b"video")
+        return out
+
+    monkeypatch.setattr(pipeline, "compile_manim", compile_manim)
+    monkeypatch.setattr(pipeline, "PREFLIGHT", FakePool())
+    monkeypatch.setattr(pipeline, "TEX_WARMER", None)
+    monkeypatch.setattr(pipeline, "FARM", None)
+    monkeypatch.setattr(pipeline, "HLS_PACKAGING", False)
+    return rendered
+
+
+def test_preflight_failure_is_repaired_before_rendering(monkeypatch, renders):
+    def repair(broken, failure, question=None):
+        return lesson(steps=["A = s^2", "A = 4^2", "A = 16"], geometric_shapes=None)
+
+    monkeypatch.setattr(pipeline, "repair_lesson", repair)
+    video = pipeline.render_lesson(lesson(title="Repaired"), "repaired")
+    assert video.exists()
+    assert len(renders) == 1
+    assert r"\bad" not in renders[0]
+
+
+def test_preflight_only_warns_once_repairs_run_out(monkeypatch, renders):
+    def repair(broken, failure, question=None):
+        raise RuntimeError("LLM unavailable")
+
+    monkeypatch.setattr(pipeline, "repair_lesson", repair)
+    # Manim tolerated this lesson before the check existed, so it still renders
+    video = pipeline.render_lesson(lesson(title="Unrepaired"), "unrepaired")
+    assert video.exists()
+    assert r"\bad" in renders[0]
+
+    monkeypatch.setattr(pipeline, "RENDER_REPAIRS", 0)
+    assert pipeline.render_lesson(lesson(title="No repairs"), "no_repairs").exists()
+
+
+@pytest.fixture
+def hls_renders(monkeypatch, renders):
+    """Packages every render for HLS with a single render slot; returns [peak Manim runs at once]."""
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def compile_manim(json_path, quality="h", out_name=None, on_progress=None, fps=None, media_dir=None,
+                      stills=True, caching=False):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        try:
+            media_dir.mkdir(parents=True, exist_ok=True)
+            return h264(media_dir / f"{out_name}.mp4", {"l": 90, "m": 144, "h": 216}[quality], seconds=1)
+        finally:
+            with lock:
+                running[0] -= 1
+
+    async def compile_manim_async(*args, **kwargs):
+        return await asyncio.to_thread(compile_manim, *args, **kwargs)
+
+    monkeypatch.setattr(pipeline, "compile_manim", compile_manim)
+    monkeypatch.setattr(pipeline, "compile_manim_async", compile_manim_async)
+    monkeypatch.setattr(pipeline, "HLS_PACKAGING", True)
+    monkeypatch.setattr(pipeline, "RENDER_SLOTS", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(pipeline, "_HLS_EXECUTOR", ThreadPoolExecutor(max_workers=1))
+    return peak
+
+
+def test_hls_package_is_built_after_the_video_is_returned(monkeypatch, hls_renders):
+    release = threading.Event()
+    package_hls = pipeline.package_hls
+
+    def held_package_hls(*args, **kwargs):
+        release.wait(10)
+        return package_hls(*args, **kwargs)
+
+    monkeypatch.setattr(pipeline, "package_hls", held_package_hls)
+    video = pipeline.render_lesson(lesson(title="Streamed", steps=["A = s^2"], geometric_shapes=None), "streamed")
+    # The MP4 is back while the package waits; its URL is handed out already
+    assert not video.with_suffix(".hls").exists()
+    assert pipeline._job_result(video)["hls_url"] == f"/get_video/{video.name}/hls/master.m3u8"
+
+    release.set()
+    pipeline._HLS_EXECUTOR.shutdown(wait=True)
+    assert (video.with_suffix(".hls") / "master.m3u8").exists()
+    # Both rungs waited for the one render slot
+    assert hls_renders[0] == 1
+
+
+def test_async_hls_rungs_share_the_render_slots(hls_renders):
+    async def render():
+        video = await pipeline.render_lesson_async(lesson(title="Async", steps=["A = s^2"], geometric_shapes=None), "async",
+                                                   render_slots=asyncio.Semaphore(1))
+        await asyncio.gather(*pipeline._HLS_TASKS)
+        return video
+
+    video = asyncio.run(render())
+    assert (video.with_suffix(".hls") / "master.m3u8").exists()
+    assert hls_renders[0] == 1
@@ -0,0 +1,65 @@
+import shutil
+
+import pytest
+
+from lesson_canon import canonicalize_lesson
+from lesson_schema import Lesson
+from manim_runner import RenderFailure
+from recovery import repairable
+from tex_preflight import TexPreflight, check_lesson, guard, lesson_tex
+
+LESSON = {
+    "title": "Area of a Square",
+    "steps": ["A = s^2", r"A = \bad", "A = 16"],
+    "geometric_shapes": [{
+        "shape_type": "square", "label": r"s = \bad", "position": [0, 0], "size": 1.0,
+        "color": "BLUE", "fill_opacity": 0.3,
+    }],
+}
+
+
+class FakePool:
+    """Fails every string with \\bad in it, as TeX would with an undefined command."""
+
+    def check(self, items):
+        return {item: guard(item.latex) or ("Undefined control sequence" if r"\bad" in item.latex else None)
+                for item in items}
+
+
+def lesson(**changes):
+    return canonicalize_lesson(Lesson.model_validate({**LESSON, **changes}))
+
+
+@pytest.mark.parametrize("latex", [r"\frac{1}{2}", r"\begin{matrix} 1 \end{matrix}", r"\{x\}"])
+def test_guard_accepts(latex):
+    assert guard(latex) is None
+
+
+@pytest.mark.parametrize("latex", [
+    r"\def\x{1}", r"\input{/etc/passwd}", r"\frac{1}{2", "x}", r"\begin{matrix} 1", "CLULUS_END 3",
+])
+def test_guard_rejects(latex):
+    assert guard(latex) is not None
+
+
+def test_lesson_tex_covers_labels():
+    fields = [(item.field, item.index) for item in lesson_tex(lesson())]
+    assert fields == [("title", None), ("steps", 0), ("steps", 1), ("steps", 2), ("geometric_shapes", 0)]
+
+
+def test_check_lesson_reports_are_repairable():
+    reports = check_lesson(FakePool(), lesson())
+    assert [(r["category"], r["field"], r["index"]) for r in reports] == [
+        ("preflight", "steps", 1), ("preflight", "geometric_shapes", 0),
+    ]
+    assert repairable(RenderFailure("preflight", "preflight", reports))
+    assert check_lesson(FakePool(), lesson(steps=["A = 16"], geometric_shapes=None)) == []
+
+
+@pytest.mark.skipif(shutil.which("latex") is None, reason="latex is not installed")
+def test_tex_pool_checks_strings():
+    pool = TexPreflight(size=1, timeout=30)
+    items = lesson_tex(lesson())
+    results = pool.check(items)
+    assert results[items[0]] is None
+    assert results[items[2]] is not None
@@ -0,0 +1,42 @@
+import threading
+
+import llm_client
+from few_shot import DEFAULT_EXAMPLES, example_turns
+
+
+def test_build_request_matches_model():
+    turns = example_turns(DEFAULT_EXAMPLES)
+    request = llm_client.build_request(turns)
+    assert request.model == llm_client.MODEL.model_name
+    assert len(request.contents) == len(turns)
+    assert request.tools[0].function_declarations[0].name == "submit_lesson"
+    assert not request.cached_content
+
+
+def test_requests_dont_wait_for_context_cache(monkeypatch):
+    creating, release = threading.Event(), threading.Event()
+
+    class Cache:
+        name = "cachedContents/test"
+
+    def create(**kwargs):
+        creating.set()
+        release.wait(5)
+        return Cache()
+
+    monkeypatch.setattr(llm_client.caching.CachedContent, "create", create)
+    prompt = llm_client.PromptCache(context_cache=True)
+    first = []
+    creator = threading.Thread(target=lambda: first.append(prompt.request("q", [llm_client._question_turn("q")])))
+    creator.start()
+    assert creating.wait(5)
+
+    # While the cache is being created, requests carry the full prefix
+    request = prompt.request("q", [llm_client._question_turn("q")])
+    assert not request.cached_content
+    assert request.system_instruction.parts
+
+    release.set()
+    creator.join(5)
+    assert first[0].cached_content == "cachedContents/test"
+    assert prompt.request("q", [llm_client._question_turn("q")]).cached_content == "cachedContents/test"
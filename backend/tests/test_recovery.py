@@ -0,0 +1,83 @@
+import threading
+import time
+
+from lesson_canon import canonicalize_lesson
+from lesson_schema import Lesson
+from manim_runner import RenderFailure
+from recovery import MAX_RESUMES, CheckpointStore, repairable
+
+LESSON = {"title": "Area of a Square", "steps": ["A = s^2", "A = 4^2", "A = 16"]}
+
+
+def lesson(**changes):
+    return canonicalize_lesson(Lesson.model_validate({**LESSON, **changes}))
+
+
+def test_checkpoint_resume_and_discard(tmp_path):
+    store = CheckpointStore(tmp_path)
+    assert store.load("What is the area?") is None
+    store.save("What is the area?", lesson(), "lesson")
+    # Same question, spelled differently
+    resumed = store.load("  what is THE area? ")
+    assert resumed.fingerprint == lesson().fingerprint
+    store.discard("what is the area?")
+    assert store.load("What is the area?") is None
+
+
+def test_loading_does_not_use_up_the_checkpoint(tmp_path):
+    store = CheckpointStore(tmp_path)
+    store.save("q", lesson(), "lesson")
+    # Jobs that resume while a render is still running haven't failed
+    for _ in range(MAX_RESUMES + 2):
+        assert store.load("q") is not None
+
+
+def test_checkpoint_dropped_after_resumed_jobs_fail(tmp_path):
+    store = CheckpointStore(tmp_path)
+    store.save("q", lesson(), "lesson")
+    # The job that wrote it, then MAX_RESUMES resumed jobs
+    for _ in range(MAX_RESUMES):
+        store.record_failure("q")
+        assert store.load("q") is not None
+    store.record_failure("q")
+    assert store.load("q") is None
+
+
+def test_repaired_lesson_keeps_failure_count(tmp_path):
+    store = CheckpointStore(tmp_path)
+    store.save("q", lesson(), "lesson")
+    for _ in range(MAX_RESUMES + 1):
+        store.record_failure("q")
+    store.save("q", lesson(title="Square"), "repaired")
+    assert store.load("q") is None
+
+
+def test_media_dir_is_used_by_one_render_at_a_time(tmp_path):
+    store = CheckpointStore(tmp_path)
+    inside, overlaps = [], []
+
+    def render():
+        with store.using_media_dir("q") as media_dir:
+            overlaps.append(bool(inside))
+            inside.append(media_dir)
+            time.sleep(0.02)
+            inside.pop()
+
+    threads = [threading.Thread(target=render) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert overlaps == [False] * 4
+    assert store._media_locks == {}
+
+
+def test_repairable():
+    report = {"field": "steps", "index": 1, "latex": r"\frac{1}{2", "error": "Missing }"}
+    assert repairable(RenderFailure("tex", "tex", [report]))
+    assert repairable(RenderFailure("preflight", "preflight", [report]))
+    # Nothing the LLM can rewrite
+    assert not repairable(RenderFailure("crash", "crash", []))
+    assert not repairable(RenderFailure("tex", "tex", []))
+    assert not repairable(RenderFailure("tex", "tex", [{"field": "x_min", "latex": "1"}]))
+    assert not repairable(ValueError("tex"))
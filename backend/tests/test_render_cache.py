@@ -0,0 +1,108 @@
+import asyncio
+import os
+import threading
+import time
+
+from render_cache import RenderCache, cache_key
+
+
+def cached(cache, key, size, age, sidecars=()):
+    """A cached video of `size` bytes last watched `age` seconds ago."""
+    video = cache.path_for(key)
+    video.write_bytes(b"0" * size)
+    paths = [video]
+    for suffix in sidecars:
+        path = cache.sidecar_path(key, suffix)
+        if suffix == ".hls":
+            path.mkdir()
+            (path / "master.m3u8").write_bytes(b"0" * size)
+        else:
+            path.write_bytes(b"0" * size)
+        paths.append(path)
+    then = time.time() - age
+    for path in paths:
+        for p in [path, *path.glob("*")] if path.is_dir() else [path]:
+            os.utime(p, (then, then))
+    return paths
+
+
+def test_evicts_least_recently_watched_first(tmp_path):
+    cache = RenderCache(tmp_path, quota_bytes=250)
+    cached(cache, "old", 100, 300)
+    cached(cache, "older", 100, 400)
+    cached(cache, "new", 100, 10)
+    assert cache.enforce_quota() == ["older"]
+    assert cache.lookup("older") is None
+    assert cache.lookup("old") and cache.lookup("new")
+    assert cache.stats()["evicted_bytes"] == 100
+
+
+def test_watching_a_video_protects_it(tmp_path):
+    cache = RenderCache(tmp_path, quota_bytes=150)
+    cached(cache, "a", 100, 400)
+    cached(cache, "b", 100, 300)
+    cache.record_access("a.mp4")
+    assert cache.enforce_quota() == ["b"]
+
+
+def test_keep_and_sidecars(tmp_path):
+    cache = RenderCache(tmp_path, quota_bytes=100)
+    cached(cache, "oldest", 50, 500, sidecars=(".poster.jpg", ".hls"))
+    cached(cache, "just_rendered", 100, 1000)
+    assert cache.enforce_quota(keep=["just_rendered"]) == ["oldest"]
+    # Sidecars go with their video
+    assert list(tmp_path.iterdir()) == [cache.path_for("just_rendered")]
+
+
+def test_no_quota(tmp_path):
+    cache = RenderCache(tmp_path, quota_bytes=0)
+    cached(cache, "a", 100, 100)
+    assert cache.enforce_quota() == []
+    assert cache_key("abc", "1080p30") == "abc_1080p30"
+
+
+def test_key_lock_stays_while_a_waiter_has_it(tmp_path):
+    cache = RenderCache(tmp_path)
+    first = cache.key_lock("k")
+    first.__enter__()
+    b_in, b_done, c_in = threading.Event(), threading.Event(), threading.Event()
+
+    def render(entered, done=None):
+        with cache.key_lock("k"):
+            entered.set()
+            if done:
+                done.wait(5)
+
+    b = threading.Thread(target=render, args=(b_in, b_done))
+    b.start()
+    while cache._key_locks["k"][1] < 2:
+        time.sleep(0.01)
+    # The first render fails and lets go while b is still waiting
+    first.__exit__(None, None, None)
+    assert b_in.wait(5)
+    c = threading.Thread(target=render, args=(c_in,))
+    c.start()
+    assert not c_in.wait(0.2)
+    b_done.set()
+    b.join(5)
+    c.join(5)
+    assert c_in.is_set()
+    assert cache._key_locks == {}
+
+
+def test_async_key_lock_is_dropped_by_the_last_user(tmp_path):
+    cache = RenderCache(tmp_path)
+    order = []
+
+    async def render(name):
+        async with cache.async_key_lock("k"):
+            order.append(name)
+            await asyncio.sleep(0.01)
+            order.append(name)
+
+    async def main():
+        await asyncio.gather(render("a"), render("b"), render("c"))
+
+    asyncio.run(main())
+    assert order == ["a", "a", "b", "b", "c", "c"]
+    assert cache._async_key_locks == {}
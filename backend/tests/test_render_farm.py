@@ -0,0 +1,103 @@
+import shutil
+import time
+
+import render_farm
+from render_farm import Coordinator, HashRing, RenderWorker, serve_coordinator
+
+KEYS = [f"fingerprint-{i}" for i in range(500)]
+
+
+def test_removing_a_node_only_moves_its_keys():
+    ring = HashRing()
+    for node in ("a", "b", "c"):
+        ring.add(node)
+    before = {key: ring.node_for(key) for key in KEYS}
+    assert set(before.values()) == {"a", "b", "c"}
+
+    ring.remove("b")
+    after = {key: ring.node_for(key) for key in KEYS}
+    assert len(ring) == 2
+    for key in KEYS:
+        if before[key] == "b":
+            assert after[key] in ("a", "c")
+        else:
+            assert after[key] == before[key]
+
+    ring.remove("a")
+    ring.remove("c")
+    assert ring.node_for(KEYS[0]) is None
+
+
+def kill(coordinator, worker):
+    coordinator.workers[worker]["last_seen"] = time.monotonic() - coordinator.heartbeat_timeout - 1
+
+
+def owned_by(coordinator, worker):
+    """A fingerprint the ring assigns to `worker`."""
+    return next(key for key in KEYS if coordinator.ring.node_for(key) == worker)
+
+
+def test_dead_workers_job_goes_to_a_survivor(tmp_path):
+    coordinator = Coordinator(tmp_path, steal_after=None)
+    coordinator.heartbeat("w1")
+    coordinator.heartbeat("w2")
+    fingerprint = owned_by(coordinator, "w1")
+    job = coordinator.submit("video", fingerprint, {}, "720p30")
+
+    assert coordinator.pull("w2", wait=0) is None
+    assert coordinator.pull("w1", wait=0) is job
+    kill(coordinator, "w1")
+    assert coordinator.reap() == ["w1"]
+    assert job.status == "queued" and job.worker is None
+    assert coordinator.ring.node_for(fingerprint) == "w2"
+
+    assert coordinator.pull("w2", wait=0) is job
+    assert job.attempts == 2
+    # The dead worker's late result is ignored
+    upload = tmp_path / "late.mp4"
+    upload.write_bytes(b"0")
+    assert not coordinator.complete(job.id, "w1", upload)
+    assert not upload.exists()
+    stats = coordinator.stats()
+    assert (stats["requeued"], stats["dead_workers"]) == (1, 1)
+
+
+def test_job_fails_after_killing_too_many_workers(tmp_path):
+    coordinator = Coordinator(tmp_path, steal_after=None)
+    job = coordinator.submit("video", "fingerprint", {}, "720p30")
+    for attempt in range(render_farm.MAX_ATTEMPTS):
+        worker = f"w{attempt}"
+        assert coordinator.pull(worker, wait=0) is job
+        kill(coordinator, worker)
+        coordinator.reap()
+    assert job.status == "failed"
+    assert "died 3 times" in job.error
+    # A new request for the same video starts over
+    assert coordinator.submit("video", "fingerprint", {}, "720p30") is not job
+
+
+def test_worker_keeps_its_animation_cache_between_jobs(tmp_path):
+    coordinator, server = serve_coordinator(0, "127.0.0.1", tmp_path / "store")
+    calls = []
+
+    def render(json_path, quality, fps, out_name, on_progress, media_dir, caching):
+        calls.append((media_dir, caching))
+        (media_dir / "partial_movie_files").mkdir(parents=True, exist_ok=True)
+        video = media_dir / f"{out_name}.mp4"
+        video.write_bytes(b"video")
+        video.with_suffix(".poster.jpg").write_bytes(b"poster")
+        return video
+
+    worker = RenderWorker(f"http://127.0.0.1:{server.server_address[1]}", "host 1", render=render)
+    try:
+        job = coordinator.submit("video", "fingerprint", {"title": "T", "steps": ["x"]}, "h", 60)
+        worker._render(coordinator.pull(worker.id, wait=0).assignment())
+        assert job.status == "done"
+        assert coordinator.cache.lookup("video").read_bytes() == b"video"
+        assert coordinator.cache.sidecar_path("video", ".poster.jpg").read_bytes() == b"poster"
+        # The job's files are gone, the animation cache stays for the next one
+        assert calls == [(worker.media_dir, True)]
+        assert [p.name for p in worker.media_dir.iterdir()] == ["partial_movie_files"]
+    finally:
+        server.shutdown()
+        shutil.rmtree(worker.media_dir, ignore_errors=True)
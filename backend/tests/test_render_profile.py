@@ -0,0 +1,26 @@
+from lesson_canon import canonicalize_lesson
+from lesson_schema import Lesson
+from render_profile import choose_render_profile, default_profile
+
+TEXT = {"title": "Sum", "steps": ["1+1=2"]}
+PLOT = {**TEXT, "function_plots": [{"expression": "x**2", "label": "f(x)"}]}
+SHAPES = {**TEXT, "geometric_shapes": [{"shape_type": "circle", "label": "r=1", "position": [0, 0]}]}
+
+
+def profile(data, quality="h", auto=True):
+    return choose_render_profile(canonicalize_lesson(Lesson.model_validate(data)), quality, auto)
+
+
+def test_frame_rate_follows_content():
+    assert profile(PLOT).tag == "1080p60"
+    assert profile(TEXT).tag == "1080p30"
+    assert profile(SHAPES).tag == "1080p30"
+
+
+def test_frame_rate_capped_by_quality():
+    assert profile(PLOT, "l").tag == "480p15"
+    assert profile(TEXT, "m").tag == "720p30"
+
+
+def test_auto_off_uses_quality_default():
+    assert profile(TEXT, auto=False) == default_profile("h")
@@ -0,0 +1,73 @@
+import shutil
+
+import pytest
+
+pytest.importorskip("manim")
+
+import numpy as np
+from manim import BLUE, RED, Dot, MathTex, color_to_rgb
+
+import render_scene
+from lesson_schema import GeometricShape
+from render_scene import SHAPE_SCALE, _split_rows, batch_math_tex, create_geometric_shape
+
+
+def shape(shape_type, **fields):
+    return GeometricShape(shape_type=shape_type, label="S", position=fields.pop("position", [0, 0]), **fields)
+
+
+def test_template_shapes_match_their_size():
+    square = create_geometric_shape(shape("square", size=2, position=[10, -10]))
+    assert square.width == pytest.approx(2 * SHAPE_SCALE)
+    assert square.get_center()[:2] == pytest.approx([3, -3])
+    circle = create_geometric_shape(shape("circle", size=2))
+    assert circle.width == pytest.approx(2 * 2 * SHAPE_SCALE)
+    rectangle = create_geometric_shape(shape("rectangle", width=5, height=2))
+    assert (rectangle.width, rectangle.height) == pytest.approx((5 * SHAPE_SCALE, 2 * SHAPE_SCALE))
+
+
+def test_template_copies_are_independent():
+    blue = create_geometric_shape(shape("square", color="BLUE", size=1))
+    red = create_geometric_shape(shape("square", color="RED", size=3))
+    assert blue.width == pytest.approx(SHAPE_SCALE)
+    assert np.allclose(color_to_rgb(blue.get_stroke_color()), color_to_rgb(BLUE))
+    assert np.allclose(color_to_rgb(red.get_stroke_color()), color_to_rgb(RED))
+    template = render_scene._SHAPE_TEMPLATES["square"]
+    assert template.width == pytest.approx(1.0) and template.get_center() == pytest.approx([0, 0, 0])
+
+
+def glyphs(*rows):
+    """Dots standing in for glyphs, one list of y positions (within a row) per row."""
+    return [Dot([x, y, 0]) for row in rows for x, y in enumerate(row)]
+
+
+def test_split_rows_by_vertical_gap():
+    rows = _split_rows(glyphs([2.0, 2.1, 1.95], [0.0, 0.05], [-2.0]), 3)
+    assert [len(row) for row in rows] == [3, 2, 1]
+    assert all(g.get_center()[1] > 1 for g in rows[0])
+
+
+def test_split_rows_gives_up_when_unclear():
+    assert _split_rows(glyphs([2.0, 1.0, 0.0, -1.0]), 2) is None
+    assert _split_rows(glyphs([2.0]), 2) is None
+
+
+def test_split_rows_reads_left_to_right():
+    # A superscript sits higher than its base but comes after it
+    rows = _split_rows(glyphs([0.0, 0.2, 0.0], [-3.0, -3.0]), 2)
+    assert [g.get_center()[0] for g in rows[0]] == pytest.approx([0, 1, 2])
+
+
+@pytest.mark.skipif(shutil.which("latex") is None, reason="latex is not installed")
+def test_batched_labels_match_separate_compiles():
+    labels = [r"\frac{a+1}{b}", "x^2 + 1", "y"]
+    for label, group in zip(labels, batch_math_tex(labels)):
+        xs = np.round([g.get_center()[0] for g in group], 2)
+        assert list(xs) == sorted(xs)
+        # The same glyphs as a separate compile, shifted as a whole
+        single = MathTex(label).family_members_with_points()
+        assert len(group) == len(single)
+        ours, theirs = (np.array(sorted(np.round(centers - centers.mean(axis=0), 2).tolist()))
+                        for centers in (np.array([g.get_center() for g in group]),
+                                        np.array([g.get_center() for g in single])))
+        assert np.allclose(ours, theirs, atol=0.02)
@@ -0,0 +1,62 @@
+import os
+import time
+
+import retention
+from retention import RenderArtifacts
+
+
+def test_render_artifacts_cleanup(tmp_path):
+    artifacts = RenderArtifacts("v1", tmp_path / "render")
+    artifacts.media_dir.mkdir()
+    (artifacts.media_dir / "partial.mp4").write_bytes(b"0" * 10)
+    lesson = artifacts.add(tmp_path / "lesson_v1.json")
+    lesson.write_text("{}")
+
+    assert artifacts.cleanup(keep_media=True) == 2
+    assert artifacts.media_dir.exists() and not lesson.exists()
+    assert artifacts.cleanup() == 10
+    assert not artifacts.media_dir.exists()
+
+
+def test_sweep_removes_only_stale_leftovers(tmp_path, monkeypatch):
+    renders, build = tmp_path / "renders", tmp_path / "build"
+    monkeypatch.setattr(retention, "RENDERS_DIR", renders)
+    monkeypatch.setattr(retention, "BUILD_DIR", build)
+    monkeypatch.setattr(retention, "VIDEO_CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(retention, "MEDIA_DIR", tmp_path)
+    monkeypatch.setattr(retention, "TEX_DIR", tmp_path / "Tex")
+    (renders / "crashed").mkdir(parents=True)
+    (renders / "running").mkdir()
+    build.mkdir()
+    (build / "lesson_crashed.json").write_text("{}")
+    old = time.time() - retention.STALE_AGE - 60
+    for path in (renders / "crashed", build / "lesson_crashed.json"):
+        os.utime(path, (old, old))
+
+    assert retention.sweep_stale()["removed"] == 2
+    assert [p.name for p in renders.iterdir()] == ["running"]
+    assert list(build.iterdir()) == []
+
+
+def test_sweep_keeps_render_dirs_that_are_still_written(tmp_path, monkeypatch):
+    renders = tmp_path / "renders"
+    monkeypatch.setattr(retention, "RENDERS_DIR", renders)
+    monkeypatch.setattr(retention, "BUILD_DIR", tmp_path / "build")
+    monkeypatch.setattr(retention, "VIDEO_CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(retention, "MEDIA_DIR", tmp_path)
+    monkeypatch.setattr(retention, "TEX_DIR", tmp_path / "Tex")
+    partials = renders / "long" / "videos" / "1080p60" / "partial_movie_files"
+    partials.mkdir(parents=True)
+    (partials / "part_0042.mp4").write_bytes(b"0")
+    (renders / "idle").mkdir()
+    old = time.time() - retention.STALE_AGE - 60
+    for path in (renders / "long", renders / "long" / "videos", renders / "idle"):
+        os.utime(path, (old, old))
+    # A render of this process that hasn't written anything yet is kept too
+    artifacts = RenderArtifacts("idle", renders / "idle")
+    os.utime(renders / "idle", (old, old))
+
+    assert retention.sweep_stale()["removed"] == 0
+    artifacts.cleanup(keep_media=True)
+    assert retention.sweep_stale()["removed"] == 1
+    assert [p.name for p in renders.iterdir()] == ["long"]
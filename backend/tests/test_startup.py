@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+
+from conftest import BACKEND_DIR
+
+
+def test_importing_pipeline_starts_nothing():
+    code = (
+        "import sys, threading\n"
+        "sys.path.append('video_generator')\n"
+        "from video_generator import pipeline\n"
+        "print(sorted(t.name for t in threading.enumerate()))\n"
+    )
+    env = dict(os.environ)
+    env.pop("RETENTION_SWEEP_SECONDS", None)
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "['MainThread']"
+
+
+def test_start_services_runs_once(monkeypatch):
+    from video_generator import pipeline
+
+    started = []
+    monkeypatch.setattr(pipeline, "_SERVICES_STARTED", False)
+    monkeypatch.setattr(pipeline, "start_sweeper", lambda: started.append("sweeper"))
+    pipeline.start_services()
+    pipeline.start_services()
+    assert started == ["sweeper"]
+
+
+def test_asgi_starts_services_with_the_server(monkeypatch):
+    from starlette.testclient import TestClient
+
+    import asgi
+
+    started = []
+    monkeypatch.setattr(asgi, "start_services", lambda: started.append(True))
+    with TestClient(asgi.app):
+        assert started == [True]
@@ -0,0 +1,59 @@
+import av
+import numpy as np
+from PIL import Image
+
+import stills
+from stills import POSTER_SUFFIX, PREVIEW_SUFFIX, StillsRecorder, still_paths
+
+
+def frame(value, width=1920, height=1080):
+    return np.full((height, width, 4), value, dtype=np.uint8)
+
+
+def test_preview_samples_by_time():
+    recorder = StillsRecorder(frame_rate=30, preview_fps=4)
+    for i in range(60):
+        recorder.add_frame(frame(i))
+    # A held frame covers several sampling instants at once
+    recorder.add_frame(frame(200), num_frames=30)
+    assert len(recorder.preview) == 1 + 8 + 4
+    assert recorder.preview[0].size == (stills.PREVIEW_WIDTH, 180)
+
+
+def test_poster_defaults_to_last_frame(tmp_path):
+    recorder = StillsRecorder(frame_rate=15)
+    recorder.add_frame(frame(10))
+    recorder.add_frame(frame(250))
+    written = recorder.save(str(tmp_path / "lesson"))
+    assert written == {
+        "poster": str(tmp_path / ("lesson" + POSTER_SUFFIX)),
+        "preview": str(tmp_path / ("lesson" + PREVIEW_SUFFIX)),
+    }
+    with Image.open(written["poster"]) as poster:
+        assert poster.size == (stills.POSTER_WIDTH, 540)
+        assert poster.getpixel((0, 0))[0] > 240
+    paths = still_paths(tmp_path / "lesson.mp4")
+    assert {kind: str(path) for kind, path in paths.items()} == written
+
+
+def test_preview_is_capped(tmp_path):
+    recorder = StillsRecorder(frame_rate=1, preview_fps=1)
+    recorder.add_frame(frame(0, 640, 360), num_frames=stills.PREVIEW_MAX_FRAMES * 3)
+    recorder.save(str(tmp_path / "long"))
+    with Image.open(tmp_path / ("long" + PREVIEW_SUFFIX)) as preview:
+        assert preview.n_frames <= stills.PREVIEW_MAX_FRAMES
+
+
+def test_cached_animation_is_sampled(tmp_path):
+    path = tmp_path / "cached.mp4"
+    with av.open(str(path), "w") as container:
+        stream = container.add_stream("libx264", rate=30)
+        stream.width, stream.height, stream.pix_fmt = 320, 180, "yuv420p"
+        for i in range(30):
+            container.mux(stream.encode(av.VideoFrame.from_ndarray(frame(i * 8, 320, 180)[..., :3], format="rgb24")))
+        container.mux(stream.encode())
+
+    recorder = StillsRecorder(frame_rate=30, preview_fps=4)
+    recorder.add_video(str(path))
+    assert recorder.frames_seen == 30
+    assert len(recorder.preview) == 1 + 4
@@ -0,0 +1,246 @@
+# few_shot.py
+"""
+Example lessons for the LLM prompt and a small index to pick from them.
+
+The first three examples are the classic few-shot set that is sent in full
+mode. Lean mode sends only the examples that share the most (IDF weighted)
+keywords with the question, which keeps the prompt short while still showing
+the model a lesson of the right kind (plot, shapes or plain steps).
+"""
+import json
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List
+
+EXAMPLES: List[Dict[str, Any]] = [
+    {
+        "question": "Find the derivative of e^x + 3x^2",
+        "tags": ["derivative", "differentiate", "function", "plot"],
+        "lesson": {
+            "title": r"Derivative of $e^x + 3x^2$",
+            "steps": [
+                r"f(x)=e^x+3x^2",
+                r"f'(x)=\frac{d}{dx}(e^x)+\frac{d}{dx}(3x^2)",
+                r"f'(x)=e^x+6x"
+            ],
+            "function_plots": [
+                {"expression": "e**x + 3*x**2", "label": "f(x)"},
+                {"expression": "e**x + 6*x", "label": "f'(x)"}
+            ],
+            "x_min": -2,
+            "x_max": 2
+        },
+    },
+    {
+        "question": "Solve for x: x^2 - 5x + 6 = 0",
+        "tags": ["solve", "roots", "quadratic", "equation", "zeros"],
+        "lesson": {
+            "title": r"Roots of $x^2-5x+6$",
+            "steps": [
+                r"x^2-5x+6=0",
+                r"(x-2)(x-3)=0",
+                r"x=2 \text{ or } x=3"
+            ],
+            "function_plots": [
+                {"expression": "x**2 - 5*x + 6", "label": "f(x) = x^2 - 5x + 6"}
+            ],
+            "x_min": 0,
+            "x_max": 5
+        },
+    },
+    {
+        "question": "Find the area of a square with side length 4",
+        "tags": ["area", "square", "side", "geometry", "shape"],
+        "lesson": {
+            "title": r"Area of a Square",
+            "steps": [
+                r"A = s^2",
+                r"A = 4^2 = 16",
+                r"A = 16 \text{ square units}"
+            ],
+            "geometric_shapes": [
+                {
+                    "shape_type": "square",
+                    "label": "Square (s=4)",
+                    "position": [0, 0],
+                    "size": 2.0,
+                    "color": "BLUE",
+                    "fill_opacity": 0.3
+                }
+            ]
+        },
+    },
+    {
+        "question": "Find the indefinite integral of 3x^2 + 2x",
+        "tags": ["integral", "integrate", "antiderivative", "function", "plot"],
+        "lesson": {
+            "title": r"Integral of $3x^2 + 2x$",
+            "steps": [
+                r"\int (3x^2+2x)\,dx",
+                r"=3\cdot\frac{x^3}{3}+2\cdot\frac{x^2}{2}+C",
+                r"=x^3+x^2+C"
+            ],
+            "function_plots": [
+                {"expression": "3*x**2 + 2*x", "label": "f(x)"},
+                {"expression": "x**3 + x**2", "label": "F(x)"}
+            ],
+            "x_min": -2,
+            "x_max": 2
+        },
+    },
+    {
+        "question": "Find the x-intercepts of y = x^2 - 4",
+        "tags": ["intercept", "intercepts", "roots", "zeros", "graph"],
+        "lesson": {
+            "title": r"Intercepts of $y=x^2-4$",
+            "steps": [
+                r"x^2-4=0",
+                r"(x-2)(x+2)=0",
+                r"x=-2 \text{ or } x=2"
+            ],
+            "function_plots": [
+                {"expression": "x**2 - 4", "label": "y = x^2 - 4"}
+            ],
+            "x_min": -3,
+            "x_max": 3
+        },
+    },
+    {
+        "question": "Find the area of a circle with radius 3",
+        "tags": ["area", "circle", "radius", "diameter", "circumference", "geometry", "shape"],
+        "lesson": {
+            "title": r"Area of a Circle",
+            "steps": [
+                r"A = \pi r^2",
+                r"A = \pi \cdot 3^2",
+                r"A = 9\pi \approx 28.27"
+            ],
+            "geometric_shapes": [
+                {
+                    "shape_type": "circle",
+                    "label": "r = 3",
+                    "position": [0, 0],
+                    "size": 1.5,
+                    "color": "GREEN",
+                    "fill_opacity": 0.3
+                }
+            ]
+        },
+    },
+    {
+        "question": "Find the area of a right triangle with legs 3 and 4",
+        "tags": ["area", "triangle", "legs", "base", "height", "hypotenuse", "geometry", "shape"],
+        "lesson": {
+            "title": r"Area of a Right Triangle",
+            "steps": [
+                r"A = \frac{1}{2}bh",
+                r"A = \frac{1}{2}\cdot 3 \cdot 4",
+                r"A = 6 \text{ square units}"
+            ],
+            "geometric_shapes": [
+                {
+                    "shape_type": "polygon",
+                    "label": "Triangle (3, 4)",
+                    "position": [0, 0],
+                    "vertices": [[-1.5, -1], [1.5, -1], [-1.5, 1.5]],
+                    "color": "ORANGE",
+                    "fill_opacity": 0.3
+                }
+            ]
+        },
+    },
+    {
+        "question": "Find the perimeter of a rectangle with length 5 and width 3",
+        "tags": ["perimeter", "rectangle", "length", "width", "geometry", "shape"],
+        "lesson": {
+            "title": r"Perimeter of a Rectangle",
+            "steps": [
+                r"P = 2(l+w)",
+                r"P = 2(5+3)",
+                r"P = 16 \text{ units}"
+            ],
+            "geometric_shapes": [
+                {
+                    "shape_type": "rectangle",
+                    "label": "5 \\times 3",
+                    "position": [0, 0],
+                    "width": 2.5,
+                    "height": 1.5,
+                    "color": "PURPLE",
+                    "fill_opacity": 0.3
+                }
+            ]
+        },
+    },
+    {
+        "question": "Simplify (2x^3)(3x^2)",
+        "tags": ["simplify", "expand", "product", "exponents", "algebra"],
+        "lesson": {
+            "title": r"Simplify $(2x^3)(3x^2)$",
+            "steps": [
+                r"(2x^3)(3x^2)=(2\cdot 3)(x^3\cdot x^2)",
+                r"=6x^{3+2}",
+                r"=6x^5"
+            ]
+        },
+    },
+    {
+        "question": "Evaluate the limit of (x^2 - 1)/(x - 1) as x approaches 1",
+        "tags": ["limit", "lim", "approaches", "evaluate", "continuity"],
+        "lesson": {
+            "title": r"Limit of $\frac{x^2-1}{x-1}$ at $x=1$",
+            "steps": [
+                r"\lim_{x\to 1}\frac{x^2-1}{x-1}=\lim_{x\to 1}\frac{(x-1)(x+1)}{x-1}",
+                r"=\lim_{x\to 1}(x+1)",
+                r"=2"
+            ]
+        },
+    },
+]
+
+# The examples sent in full mode
+DEFAULT_EXAMPLES = EXAMPLES[:3]
+
+_STOPWORDS = {
+    "a", "an", "and", "as", "at", "by", "find", "for", "from", "how", "i", "in", "is",
+    "it", "me", "of", "on", "the", "to", "what", "when", "with", "x", "y",
+}
+_WORD = re.compile(r"[a-z]+")
+
+
+def _tokens(text: str) -> List[str]:
+    return [w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS and len(w) > 1]
+
+
+def example_turns(examples) -> List[Dict[str, Any]]:
+    """User/model turns for the given examples, in the Gemini `contents` format."""
+    turns = []
+    for example in examples:
+        turns.append({"role": "user", "parts": [{"text": example["question"]}]})
+        turns.append({"role": "model", "parts": [{"text": json.dumps(example["lesson"])}]})
+    return turns
+
+
+class ExampleIndex:
+    """Scores examples by the IDF weight of the keywords they share with a question."""
+
+    def __init__(self, examples=EXAMPLES):
+        self.examples = list(examples)
+        self._keywords = [set(_tokens(e["question"])) | set(e.get("tags", ())) for e in self.examples]
+        df = Counter(word for words in self._keywords for word in words)
+        n = len(self.examples)
+        self._idf = {word: math.log((n + 1) / (count + 0.5)) for word, count in df.items()}
+
+    def score(self, question: str) -> List[float]:
+        words = set(_tokens(question))
+        return [sum(self._idf[w] for w in words & keywords) for keywords in self._keywords]
+
+    def select(self, question: str, k: int = 1) -> List[Dict[str, Any]]:
+        """The k most relevant examples (in index order); the defaults when nothing matches."""
+        scores = self.score(question)
+        ranked = sorted(range(len(self.examples)), key=lambda i: -scores[i])
+        chosen = [i for i in ranked[:k] if scores[i] > 0]
+        if not chosen:
+            return DEFAULT_EXAMPLES[:k]
+        return [self.examples[i] for i in sorted(chosen)]
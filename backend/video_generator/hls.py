@@ -0,0 +1,247 @@
+# hls.py
+"""
+Adaptive-bitrate HLS packaging of lesson videos.
+
+With HLS_PACKAGING=1 a lesson is also rendered at every rung of HLS_LADDER
+below its own resolution (Manim -ql/-qm at the same frame rate). Text stays
+sharp that way instead of being scaled down from 1080p, and a 480p render
+costs a fraction of the 1080p one. Every rendition, the main MP4 included,
+is cut into ~HLS_SEGMENT_SECONDS fragmented MP4 segments at its keyframes
+with PyAV's HLS muxer. This copies the H.264 stream, so nothing is
+re-encoded. The segments are fMP4 rather than MPEG-TS: at these low
+bitrates TS packet overhead added 30% to the 1080p rendition and doubled
+the 480p one. A master playlist lists the renditions by bandwidth.
+
+The package is published as the <key>.hls/ directory next to <key>.mp4 in
+the render cache and is evicted with it:
+
+    <key>.hls/master.m3u8
+    <key>.hls/480p.m3u8, 480p_init.mp4, 480p_00000.m4s, ...
+"""
+import asyncio
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple
+
+import av
+
+from manim_runner import compile_manim, compile_manim_async
+from render_profile import QUALITY_HEIGHTS, RenderProfile
+
+# Set HLS_PACKAGING=1 to package every new render for adaptive streaming
+HLS_PACKAGING = os.getenv("HLS_PACKAGING", "0") == "1"
+# Manim qualities of the ladder; rungs above the lesson's own quality are skipped
+HLS_LADDER = [q.strip() for q in os.getenv("HLS_LADDER", "l,m,h").split(",") if q.strip() in QUALITY_HEIGHTS]
+SEGMENT_SECONDS = float(os.getenv("HLS_SEGMENT_SECONDS", "4"))
+
+HLS_SUFFIX = ".hls"
+MASTER_PLAYLIST = "master.m3u8"
+HLS_MIMETYPES = {".m3u8": "application/vnd.apple.mpegurl", ".mp4": "video/mp4", ".m4s": "video/iso.segment"}
+
+
+class Rendition(NamedTuple):
+    name: str
+    width: int
+    height: int
+    fps: float
+    codecs: str
+    bandwidth: int  # peak over the segments, bits/s
+    average_bandwidth: int
+    duration: float
+    bytes: int
+
+
+class HlsStats:
+    """Packages built, and what the extra renditions cost."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.packages = 0
+        self.failures = 0
+        self.render_seconds = 0.0
+        self.segment_seconds = 0.0
+        self.bytes = 0
+
+    def record(self, render_s: float, segment_s: float, size: int) -> None:
+        with self._lock:
+            self.packages += 1
+            self.render_seconds += render_s
+            self.segment_seconds += segment_s
+            self.bytes += size
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": HLS_PACKAGING,
+                "ladder": [f"{QUALITY_HEIGHTS[q]}p" for q in HLS_LADDER],
+                "packages": self.packages,
+                "failures": self.failures,
+                "avg_rung_render_seconds": self.render_seconds / self.packages if self.packages else 0.0,
+                "avg_segment_seconds": self.segment_seconds / self.packages if self.packages else 0.0,
+                "bytes": self.bytes,
+            }
+
+
+HLS_STATS = HlsStats()
+
+
+def ladder(profile: RenderProfile) -> List[RenderProfile]:
+    """Renditions to render besides `profile` itself, lowest first."""
+    heights = {QUALITY_HEIGHTS[q]: q for q in HLS_LADDER if QUALITY_HEIGHTS[q] < profile.height}
+    return [RenderProfile(heights[h], profile.fps) for h in sorted(heights)]
+
+
+def _codecs(stream) -> str:
+    """RFC 6381 codec string (e.g. avc1.64001f), read from the avcC header."""
+    extradata = stream.codec_context.extradata or b""
+    if len(extradata) >= 4 and extradata[0] == 1:
+        return "avc1." + extradata[1:4].hex()
+    # High profile, level 4.0: what x264 picks for 1080p
+    return "avc1.640028"
+
+
+def _segments(playlist: Path) -> List[tuple]:
+    """(duration, filename) of every segment in a media playlist, the init segment first with duration 0."""
+    segments = []
+    duration = None
+    for line in playlist.read_text().splitlines():
+        if line.startswith("#EXT-X-MAP:URI="):
+            segments.append((0.0, line.split("=", 1)[1].strip('"')))
+        elif line.startswith("#EXTINF:"):
+            duration = float(line[len("#EXTINF:"):].split(",", 1)[0])
+        elif line and not line.startswith("#") and duration is not None:
+            segments.append((duration, line))
+            duration = None
+    return segments
+
+
+def segment(video_path: Path, out_dir: Path, name: str, seconds: float = SEGMENT_SECONDS) -> Rendition:
+    """Cuts an H.264 MP4 into <name>_init.mp4 + <name>_NNNNN.m4s, listed in <name>.m3u8."""
+    playlist = out_dir / f"{name}.m3u8"
+    options = {
+        "hls_time": str(seconds),
+        "hls_playlist_type": "vod",
+        "hls_segment_type": "fmp4",
+        "hls_fmp4_init_filename": f"{name}_init.mp4",
+        "hls_segment_filename": str(out_dir / f"{name}_%05d.m4s"),
+        "hls_flags": "independent_segments",
+    }
+    with av.open(str(video_path)) as src:
+        video = src.streams.video[0]
+        with av.open(str(playlist), "w", format="hls", options=options) as dst:
+            # PyAV 14 moved add_stream(template=...) to its own method
+            if hasattr(dst, "add_stream_from_template"):
+                out = dst.add_stream_from_template(video)
+            else:
+                out = dst.add_stream(template=video)
+            for packet in src.demux(video):
+                # The demuxer ends with an empty flush packet
+                if packet.dts is None:
+                    continue
+                packet.stream = out
+                dst.mux(packet)
+        width, height, fps, codecs = video.width, video.height, float(video.average_rate), _codecs(video)
+
+    segments = [(duration, (out_dir / filename).stat().st_size) for duration, filename in _segments(playlist)]
+    duration = sum(d for d, _ in segments)
+    size = sum(s for _, s in segments)
+    return Rendition(
+        name=name, width=width, height=height, fps=fps, codecs=codecs,
+        bandwidth=int(max(s * 8 / d for d, s in segments if d > 0)),
+        average_bandwidth=int(size * 8 / duration),
+        duration=duration, bytes=size,
+    )
+
+
+def write_master_playlist(path: Path, renditions: List[Rendition]) -> None:
+    """Lowest bandwidth first: Safari starts with the first entry, other players measure first."""
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for r in sorted(renditions, key=lambda r: r.bandwidth):
+        lines.append(
+            f"#EXT-X-STREAM-INF:BANDWIDTH={r.bandwidth},AVERAGE-BANDWIDTH={r.average_bandwidth},"
+            f'RESOLUTION={r.width}x{r.height},FRAME-RATE={r.fps:.3f},CODECS="{r.codecs}"'
+        )
+        lines.append(f"{r.name}.m3u8")
+    path.write_text("\n".join(lines) + "\n")
+
+
+def _rung_options(rung: RenderProfile, work_dir: Path) -> Dict[str, Any]:
+    return {"quality": rung.quality, "fps": rung.fps, "out_name": f"{rung.height}p",
+            "media_dir": work_dir / rung.tag, "stills": False}
+
+
+@contextmanager
+def _staging(dest: Path):
+    """A scratch directory next to `dest`, removed (and counted as a failure) if packaging raises."""
+    staging = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    try:
+        yield staging
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        HLS_STATS.record_failure()
+        raise
+
+
+def _publish(staging: Path, dest: Path, rungs: List[RenderProfile], rung_videos: List[Path],
+             video_path: Path, profile: RenderProfile, render_s: float) -> List[Rendition]:
+    """Segments every rendition into `staging`, then swaps it in as `dest`."""
+    t0 = time.perf_counter()
+    renditions = [segment(path, staging, f"{rung.height}p") for rung, path in zip(rungs, rung_videos)]
+    renditions.append(segment(video_path, staging, f"{profile.height}p"))
+    write_master_playlist(staging / MASTER_PLAYLIST, renditions)
+    segment_s = time.perf_counter() - t0
+
+    # Re-packaging (e.g. after a partial eviction) replaces the old package
+    if dest.exists():
+        shutil.rmtree(dest, ignore_errors=True)
+    os.replace(staging, dest)
+    HLS_STATS.record(render_s, segment_s, sum(r.bytes for r in renditions))
+    return renditions
+
+
+def package_hls(json_path: Path, video_path: Path, profile: RenderProfile, dest: Path,
+                work_dir: Path, render: Callable[..., Path] = compile_manim) -> List[Rendition]:
+    """
+    Renders the lower rungs of the ladder from the lesson JSON, segments
+    them and the finished `video_path`, and publishes the package directory
+    at `dest`. Rung renders go to `work_dir`, which the caller cleans up.
+    `render` is called once per rung, each from its own thread.
+    """
+    rungs = ladder(profile)
+    with _staging(dest) as staging:
+        t0 = time.perf_counter()
+        # Separate Manim processes, so the rungs render in parallel
+        with ThreadPoolExecutor(max_workers=max(len(rungs), 1)) as pool:
+            rung_videos = list(pool.map(lambda rung: render(json_path, **_rung_options(rung, work_dir)), rungs))
+        return _publish(staging, dest, rungs, rung_videos, video_path, profile, time.perf_counter() - t0)
+
+
+async def package_hls_async(json_path: Path, video_path: Path, profile: RenderProfile, dest: Path,
+                            work_dir: Path, render: Callable[..., Awaitable[Path]] = compile_manim_async
+                            ) -> List[Rendition]:
+    """Same as `package_hls`, with the rungs awaited on the event loop."""
+    rungs = ladder(profile)
+    with _staging(dest) as staging:
+        t0 = time.perf_counter()
+        results = await asyncio.gather(
+            *(render(json_path, **_rung_options(rung, work_dir)) for rung in rungs), return_exceptions=True,
+        )
+        # Only raise once every rung is done, so none still writes to work_dir
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return await asyncio.to_thread(
+            _publish, staging, dest, rungs, results, video_path, profile, time.perf_counter() - t0,
+        )
@@ -0,0 +1,159 @@
+# jobs.py
+import asyncio
+import json
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+# Events after which a job's stream is closed
+TERMINAL_EVENTS = {"done", "failed"}
+
+# Lines the render subprocess prints with this prefix are progress reports
+PROGRESS_PREFIX = "CLULUS_PROGRESS "
+# ... and with this one, what broke a render (e.g. the step whose LaTeX failed)
+FAILURE_PREFIX = "CLULUS_FAILURE "
+
+# Finished jobs are forgotten after this many seconds
+JOB_TTL_SECONDS = 3600
+
+
+class Job:
+    """
+    An in-flight lesson generation with an append-only event log.
+    Events are emitted from the worker thread and can be consumed either by
+    blocking readers (WSGI) or by asyncio readers without holding a thread.
+    """
+
+    def __init__(self, question: str):
+        self.id = str(uuid.uuid4())
+        self.question = question
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+
+        self._events: List[Dict[str, Any]] = []
+        self._cond = threading.Condition()
+        self._async_waiters = set()  # (loop, asyncio.Event)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in TERMINAL_EVENTS
+
+    def emit(self, event: str, data: Optional[Dict[str, Any]] = None) -> None:
+        """Appends an event and wakes up every reader."""
+        with self._cond:
+            if event == "llm_started" and self.started_at is None:
+                self.started_at = time.time()
+            if event in TERMINAL_EVENTS:
+                self.status = event
+                self.finished_at = time.time()
+                if event == "done":
+                    self.result = data
+                else:
+                    self.error = (data or {}).get("error")
+            elif self.status == "queued":
+                self.status = "running"
+
+            self._events.append({
+                "id": len(self._events),
+                "event": event,
+                "data": data or {},
+                "time": time.time(),
+            })
+            self._cond.notify_all()
+            waiters = list(self._async_waiters)
+
+        for loop, ev in waiters:
+            loop.call_soon_threadsafe(ev.set)
+
+    def events_since(self, last_id: int = -1) -> List[Dict[str, Any]]:
+        with self._cond:
+            return self._events[last_id + 1:]
+
+    def wait(self, last_id: int = -1, timeout: float = 15.0) -> List[Dict[str, Any]]:
+        """Blocks until there are events after `last_id` (or the timeout expires)."""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self._events) > last_id + 1 or self.finished, timeout)
+            return self._events[last_id + 1:]
+
+    async def wait_async(self, last_id: int = -1, timeout: float = 15.0) -> List[Dict[str, Any]]:
+        """Same as `wait`, but parks the coroutine instead of a thread."""
+        loop = asyncio.get_running_loop()
+        ev = asyncio.Event()
+        waiter = (loop, ev)
+        with self._cond:
+            pending = self._events[last_id + 1:]
+            if pending or self.finished:
+                return pending
+            self._async_waiters.add(waiter)
+        try:
+            await asyncio.wait_for(ev.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+        return self.events_since(last_id)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "question": self.question,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobRegistry:
+    """Thread-safe in-memory registry of jobs."""
+
+    def __init__(self, ttl: float = JOB_TTL_SECONDS):
+        self.ttl = ttl
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def create(self, question: str) -> Job:
+        job = Job(question)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._jobs)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.ttl
+        stale = [jid for jid, j in self._jobs.items() if j.finished and j.finished_at < cutoff]
+        for jid in stale:
+            del self._jobs[jid]
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Serializes a job event as a Server-Sent Events frame."""
+    payload = json.dumps(event["data"])
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {payload}\n\n"
+
+
+# Sent periodically so proxies don't close idle streams
+SSE_KEEPALIVE = ": keep-alive\n\n"
+
+
+def parse_last_event_id(value: Optional[str]) -> int:
+    try:
+        return int(value) if value is not None else -1
+    except ValueError:
+        return -1
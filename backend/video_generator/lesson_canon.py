@@ -0,0 +1,232 @@
+# lesson_canon.py
+"""
+Canonical form of a Lesson.
+
+Two questions phrased differently often produce lessons that render to the
+same video but differ in LaTeX whitespace, the order of terms in a plotted
+expression or fields LessonScene ignores. `canonicalize_lesson` maps all of
+those to one lesson and `lesson_fingerprint` hashes it for the render cache.
+"""
+import re
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+import sympy as sp
+
+from lesson_compact import CompactLesson, hash_data
+from lesson_schema import GeometricShape, Lesson, SHAPE_COLORS
+from math_parse import to_sympy_expr
+
+# Decimal places kept for shape geometry (positions are scaled by 0.3 on screen)
+GEOMETRY_DECIMALS = 2
+AXIS_DECIMALS = 4
+# LessonScene draws at most this many plots
+MAX_PLOTS = 2
+# Longer expressions are only parsed; even the bounded rewrites below grow with size
+MAX_SIMPLIFY_CHARS = 120
+# trigsimp takes about half a second at a dozen operations, so only small expressions get it
+MAX_TRIGSIMP_OPS = 8
+_TRIG = (sp.sin, sp.cos, sp.tan, sp.cot, sp.sec, sp.csc)
+
+_DEFAULT_X_MIN = Lesson.model_fields["x_min"].default
+_DEFAULT_X_MAX = Lesson.model_fields["x_max"].default
+
+# Commands whose argument is typeset as text, so spaces inside are significant
+_TEXT_COMMAND = re.compile(r"\\(?:text|textrm|textbf|textit|mathrm|mbox|operatorname)\s*\{")
+# Whitespace next to these is ignored in math mode
+_MATH_SYMBOLS = r"=+\-*/^_(){}\[\],.;:<>|&!'"
+_SPACE_BEFORE_SYMBOL = re.compile(rf"(?<!\\)\s+(?=[{_MATH_SYMBOLS}\\])")
+_SPACE_AFTER_SYMBOL = re.compile(rf"(?<=[{_MATH_SYMBOLS}])\s+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _squeeze_math(s: str) -> str:
+    s = _WHITESPACE.sub(" ", s)
+    s = _SPACE_BEFORE_SYMBOL.sub("", s)
+    return _SPACE_AFTER_SYMBOL.sub("", s)
+
+
+def _closing_brace(s: str, start: int) -> int:
+    """Index just past the brace matching the one at `start` (or len(s))."""
+    depth = 0
+    i = start
+    while i < len(s):
+        c = s[i]
+        if c == "\\":
+            i += 2
+            continue
+        if c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return len(s)
+
+
+def normalize_math_latex(s: str) -> str:
+    """Drops whitespace that doesn't change how a math-mode LaTeX string renders."""
+    out = []
+    i = 0
+    while i < len(s):
+        m = _TEXT_COMMAND.search(s, i)
+        if not m:
+            out.append(_squeeze_math(s[i:]))
+            break
+        out.append(_squeeze_math(s[i:m.start()]))
+        end = _closing_brace(s, m.end() - 1)
+        command = m.group(0).replace(" ", "")
+        out.append(command + _WHITESPACE.sub(" ", s[m.end():end]))
+        i = end
+    return "".join(out).strip()
+
+
+def normalize_text_latex(s: str) -> str:
+    """Text-mode LaTeX (the title): only runs of whitespace are insignificant."""
+    return _WHITESPACE.sub(" ", s).strip()
+
+
+def _rewrite(expr: sp.Expr) -> sp.Expr:
+    """
+    Stands in for sympy.simplify, whose run time on the request path is open
+    ended: puts rational expressions over a common denominator and applies
+    trig identities to small ones. The expanded form wins when the rewrite
+    comes out longer, so the plotted expression stays readable.
+    """
+    expanded = sp.expand(expr)
+    rewritten = sp.cancel(sp.together(expr))
+    if rewritten.has(*_TRIG) and sp.count_ops(rewritten) <= MAX_TRIGSIMP_OPS:
+        rewritten = sp.trigsimp(rewritten)
+    return rewritten if sp.count_ops(rewritten) <= sp.count_ops(expanded) else expanded
+
+
+@lru_cache(maxsize=4096)
+def canonical_expression(expression: str) -> str:
+    """
+    Canonical plain-math form of a plot expression, so 'e**x + 6*x' and
+    '6x+e^x' compare equal. Unparseable input is only whitespace-normalized
+    and left for LessonScene to report.
+    """
+    try:
+        expr = to_sympy_expr(expression)
+        if expr.is_polynomial(sp.Symbol("x")):
+            # Factored and expanded polynomials should compare equal
+            expr = sp.expand(expr)
+        elif len(expression) <= MAX_SIMPLIFY_CHARS:
+            expr = _rewrite(expr)
+        return sp.sstr(expr)
+    except Exception:
+        return _WHITESPACE.sub("", expression)
+
+
+def _round(value: float, decimals: int) -> float:
+    # + 0.0 turns -0.0 into 0.0
+    return round(float(value), decimals) + 0.0
+
+
+def _canonical_shape(shape) -> Dict[str, Any]:
+    defaults = GeometricShape.model_fields
+    data = {
+        "shape_type": shape.shape_type,
+        "label": normalize_math_latex(shape.label),
+        "position": [_round(v, GEOMETRY_DECIMALS) for v in shape.position],
+        # LessonScene treats falsy size/opacity/stroke as the default
+        "size": _round(shape.size or defaults["size"].default, GEOMETRY_DECIMALS),
+        "color": shape.color if shape.color in SHAPE_COLORS else "BLUE",
+        "fill_opacity": _round(shape.fill_opacity or defaults["fill_opacity"].default, GEOMETRY_DECIMALS),
+        "stroke_width": _round(shape.stroke_width or defaults["stroke_width"].default, GEOMETRY_DECIMALS),
+    }
+    # width/height only apply to rectangles, vertices only to polygons
+    if shape.shape_type == "rectangle":
+        data["width"] = _round(shape.width, GEOMETRY_DECIMALS) if shape.width else None
+        data["height"] = _round(shape.height, GEOMETRY_DECIMALS) if shape.height else None
+    if shape.shape_type == "polygon" and shape.vertices:
+        data["vertices"] = [[_round(c, GEOMETRY_DECIMALS) for c in v] for v in shape.vertices]
+    # Lines and arrows are never filled
+    if shape.shape_type in ("line", "arrow"):
+        data["fill_opacity"] = defaults["fill_opacity"].default
+    return data
+
+
+def canonicalize_lesson(lesson) -> CompactLesson:
+    """
+    Returns the canonical lesson; rendering it gives the same video as `lesson`.
+    Takes a validated Lesson (or a CompactLesson) and doesn't validate again.
+    """
+    plots = [
+        {"expression": canonical_expression(p.expression), "label": normalize_math_latex(p.label)}
+        for p in (lesson.function_plots or [])[:MAX_PLOTS]
+    ]
+    shapes = [_canonical_shape(s) for s in (lesson.geometric_shapes or [])]
+
+    data = {
+        "title": normalize_text_latex(lesson.title),
+        "steps": [normalize_math_latex(s) for s in lesson.steps],
+        "function_plots": plots or None,
+        "geometric_shapes": shapes or None,
+        # The axis range only matters when something is plotted
+        "x_min": _round(lesson.x_min, AXIS_DECIMALS) if plots else _DEFAULT_X_MIN,
+        "x_max": _round(lesson.x_max, AXIS_DECIMALS) if plots else _DEFAULT_X_MAX,
+    }
+    return CompactLesson.from_dict(data)
+
+
+def lesson_fingerprint(lesson, canonical: bool = False) -> str:
+    """
+    Stable hash of the lesson's canonical form. Pass `canonical=True` if the
+    lesson already came out of `canonicalize_lesson`; its cached fingerprint
+    is returned then.
+    """
+    if not canonical:
+        lesson = canonicalize_lesson(lesson)
+    return lesson.fingerprint
+
+
+class DedupStats:
+    """
+    Counts how often a lesson repeats, comparing a naive hash of the raw
+    lesson with the canonical fingerprint. Seen keys are capped so a long
+    running process doesn't grow without bound.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.lessons = 0
+        self.naive_hits = 0
+        self.canonical_hits = 0
+        self._naive_seen = set()
+        self._canonical_seen = set()
+
+    def record(self, raw: Lesson, fingerprint: Optional[str] = None) -> str:
+        """Records one lesson and returns its canonical fingerprint."""
+        naive = hash_data(raw.model_dump())
+        fingerprint = fingerprint or lesson_fingerprint(raw)
+        with self._lock:
+            if len(self._canonical_seen) >= self.max_keys:
+                self._naive_seen.clear()
+                self._canonical_seen.clear()
+            self.lessons += 1
+            if naive in self._naive_seen:
+                self.naive_hits += 1
+            if fingerprint in self._canonical_seen:
+                self.canonical_hits += 1
+            self._naive_seen.add(naive)
+            self._canonical_seen.add(fingerprint)
+        return fingerprint
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            n = self.lessons
+            return {
+                "lessons": n,
+                "unique_naive": len(self._naive_seen),
+                "unique_canonical": len(self._canonical_seen),
+                "naive_hit_rate": self.naive_hits / n if n else 0.0,
+                "canonical_hit_rate": self.canonical_hits / n if n else 0.0,
+            }
@@ -0,0 +1,233 @@
+# lesson_compact.py
+"""
+Immutable, compact form of a lesson that has already been validated.
+
+A lesson is validated once, where it enters the pipeline (the LLM response
+or the local solver). After canonicalization it travels as a CompactLesson:
+strings in tuples, shape geometry in one read-only float array, and the
+fingerprint is computed once. It is hashable by that fingerprint, so it can
+key dicts and sets directly. `from_dict` trusts its input and does no
+validation. Only use it on dicts that came out of `to_dict` or a validated
+Lesson.
+"""
+import hashlib
+import json
+import math
+import sys
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+import sympy as sp
+
+from lesson_schema import Lesson
+from math_parse import to_sympy_expr
+
+# Columns of CompactLesson.shape_geometry (NaN where the field is None)
+SHAPE_COLUMNS = ("x", "y", "size", "width", "height", "fill_opacity", "stroke_width")
+_X, _Y, _SIZE, _WIDTH, _HEIGHT, _FILL, _STROKE = range(len(SHAPE_COLUMNS))
+
+_DEFAULT_X_MIN = Lesson.model_fields["x_min"].default
+_DEFAULT_X_MAX = Lesson.model_fields["x_max"].default
+
+
+class PlotSpec(NamedTuple):
+    expression: str
+    label: str
+
+
+class ShapeSpec(NamedTuple):
+    """One geometric shape, with the same attribute names as GeometricShape."""
+    shape_type: str
+    label: str
+    position: Tuple[float, float]
+    size: Optional[float]
+    width: Optional[float]
+    height: Optional[float]
+    vertices: Optional[Tuple[Tuple[float, float], ...]]
+    color: Optional[str]
+    fill_opacity: Optional[float]
+    stroke_width: Optional[float]
+
+
+def hash_data(data: Dict[str, Any]) -> str:
+    payload = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def _frozen(array: np.ndarray) -> np.ndarray:
+    array.flags.writeable = False
+    return array
+
+
+def _nan_to_none(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+def _float(value) -> float:
+    return math.nan if value is None else float(value)
+
+
+class CompactLesson:
+    __slots__ = (
+        "title", "steps", "x_min", "x_max",
+        "plot_expressions", "plot_labels",
+        "shape_types", "shape_labels", "shape_colors", "shape_geometry", "shape_vertices",
+        "_fingerprint", "_functions", "_samples",
+    )
+
+    def __init__(self, title, steps, x_min=_DEFAULT_X_MIN, x_max=_DEFAULT_X_MAX,
+                 plot_expressions=(), plot_labels=(),
+                 shape_types=(), shape_labels=(), shape_colors=(), shape_geometry=None, shape_vertices=()):
+        setattr_ = object.__setattr__
+        setattr_(self, "title", title)
+        setattr_(self, "steps", tuple(steps))
+        setattr_(self, "x_min", float(x_min))
+        setattr_(self, "x_max", float(x_max))
+        setattr_(self, "plot_expressions", tuple(plot_expressions))
+        setattr_(self, "plot_labels", tuple(sys.intern(s) for s in plot_labels))
+        setattr_(self, "shape_types", tuple(sys.intern(s) for s in shape_types))
+        setattr_(self, "shape_labels", tuple(shape_labels))
+        setattr_(self, "shape_colors", tuple(None if c is None else sys.intern(c) for c in shape_colors))
+        setattr_(self, "shape_geometry", shape_geometry)
+        setattr_(self, "shape_vertices", tuple(shape_vertices))
+        setattr_(self, "_fingerprint", None)
+        setattr_(self, "_functions", None)
+        setattr_(self, "_samples", None)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CompactLesson":
+        """Builds the compact form of a Lesson dict (e.g. `model_dump()`), without validation."""
+        plots = data.get("function_plots") or ()
+        shapes = data.get("geometric_shapes") or ()
+        geometry = None
+        if shapes:
+            geometry = _frozen(np.array([
+                [_float(s["position"][0]), _float(s["position"][1]), _float(s.get("size")),
+                 _float(s.get("width")), _float(s.get("height")),
+                 _float(s.get("fill_opacity")), _float(s.get("stroke_width"))]
+                for s in shapes
+            ], dtype=np.float64))
+        return cls(
+            title=data["title"],
+            steps=data["steps"],
+            x_min=data.get("x_min", _DEFAULT_X_MIN),
+            x_max=data.get("x_max", _DEFAULT_X_MAX),
+            plot_expressions=[p["expression"] for p in plots],
+            plot_labels=[p["label"] for p in plots],
+            shape_types=[s["shape_type"] for s in shapes],
+            shape_labels=[s["label"] for s in shapes],
+            shape_colors=[s.get("color") for s in shapes],
+            shape_geometry=geometry,
+            shape_vertices=[
+                None if s.get("vertices") is None else _frozen(np.array(s["vertices"], dtype=np.float64))
+                for s in shapes
+            ],
+        )
+
+    @classmethod
+    def from_lesson(cls, lesson) -> "CompactLesson":
+        return cls.from_dict(lesson.model_dump())
+
+    # --- Immutability / identity ---
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CompactLesson is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("CompactLesson is immutable")
+
+    def __reduce__(self):
+        return CompactLesson.from_dict, (self.to_dict(),)
+
+    @property
+    def fingerprint(self) -> str:
+        """Hash of the lesson's fields; equals `lesson_fingerprint` when the lesson is canonical."""
+        if self._fingerprint is None:
+            object.__setattr__(self, "_fingerprint", hash_data(self.to_dict(exclude_none=True)))
+        return self._fingerprint
+
+    def __hash__(self):
+        return hash(self.fingerprint)
+
+    def __eq__(self, other):
+        if not isinstance(other, CompactLesson):
+            return NotImplemented
+        return self.fingerprint == other.fingerprint
+
+    def __repr__(self):
+        return (f"CompactLesson({self.title!r}, steps={len(self.steps)}, "
+                f"plots={len(self.plot_expressions)}, shapes={len(self.shape_types)})")
+
+    # --- Views ---
+
+    @property
+    def function_plots(self) -> Tuple[PlotSpec, ...]:
+        return tuple(PlotSpec(e, l) for e, l in zip(self.plot_expressions, self.plot_labels))
+
+    @property
+    def geometric_shapes(self) -> Tuple[ShapeSpec, ...]:
+        shapes = []
+        for i, shape_type in enumerate(self.shape_types):
+            row = self.shape_geometry[i].tolist()
+            vertices = self.shape_vertices[i]
+            shapes.append(ShapeSpec(
+                shape_type=shape_type,
+                label=self.shape_labels[i],
+                position=(row[_X], row[_Y]),
+                size=_nan_to_none(row[_SIZE]),
+                width=_nan_to_none(row[_WIDTH]),
+                height=_nan_to_none(row[_HEIGHT]),
+                vertices=None if vertices is None else tuple(map(tuple, vertices.tolist())),
+                color=self.shape_colors[i],
+                fill_opacity=_nan_to_none(row[_FILL]),
+                stroke_width=_nan_to_none(row[_STROKE]),
+            ))
+        return tuple(shapes)
+
+    def to_dict(self, exclude_none: bool = False) -> Dict[str, Any]:
+        """Same dict as `Lesson.model_dump()` (or `model_dump(exclude_none=True)`)."""
+        plots = [{"expression": p.expression, "label": p.label} for p in self.function_plots]
+        shapes = []
+        for s in self.geometric_shapes:
+            shape = s._asdict()
+            shape["position"] = list(s.position)
+            if s.vertices is not None:
+                shape["vertices"] = [list(v) for v in s.vertices]
+            if exclude_none:
+                shape = {k: v for k, v in shape.items() if v is not None}
+            shapes.append(shape)
+        data = {
+            "title": self.title,
+            "steps": list(self.steps),
+            "function_plots": plots or None,
+            "geometric_shapes": shapes or None,
+            "x_min": self.x_min,
+            "x_max": self.x_max,
+        }
+        if exclude_none:
+            data = {k: v for k, v in data.items() if v is not None}
+        return data
+
+    # --- Plot sampling (used by LessonScene) ---
+
+    def plot_functions(self):
+        """NumPy callables for the plot expressions, parsed once."""
+        if self._functions is None:
+            x = sp.Symbol("x")
+            functions = tuple(
+                sp.lambdify(x, to_sympy_expr(expression), modules=["numpy"])
+                for expression in self.plot_expressions
+            )
+            object.__setattr__(self, "_functions", functions)
+        return self._functions
+
+    def sample_plots(self, n: int = 400):
+        """(xs, ys) over [x_min, x_max], one row of ys per plot. Read-only and cached."""
+        if self._samples is None or len(self._samples[0]) != n:
+            xs = np.linspace(self.x_min, self.x_max, n)
+            ys = np.empty((len(self.plot_expressions), n))
+            for row, func in zip(ys, self.plot_functions()):
+                # Constant expressions come back as a scalar
+                row[:] = np.broadcast_to(np.asarray(func(xs), dtype=float), xs.shape)
+            object.__setattr__(self, "_samples", (_frozen(xs), _frozen(ys)))
+        return self._samples
@@ -2,6 +2,9 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional, Literal
 
+# Color names LessonScene knows how to draw; anything else is drawn in BLUE
+SHAPE_COLORS = ("BLUE", "RED", "GREEN", "YELLOW", "ORANGE", "PURPLE", "PINK", "GRAY", "WHITE", "BLACK")
+
 # --- NEW: A model for a single function plot ---
 class FunctionPlot(BaseModel):
     expression: str = Field(description="The mathematical expression to plot, e.g., 'x**2'.")
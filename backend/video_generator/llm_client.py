@@ -1,12 +1,19 @@
 # llm_client.py
+import asyncio
 import json
 import os
+import threading
+import time
 from typing import Any, Dict
 
 from dotenv import load_dotenv
 import google.generativeai as genai
-from google.generativeai.types import GenerationConfig, Tool, FunctionDeclaration
+from google.api_core import exceptions as api_exceptions
+from google.generativeai import caching, protos
+from google.generativeai import client as genai_client
+from google.generativeai.types import GenerationConfig, Tool, FunctionDeclaration, content_types, generation_types
 
+from few_shot import DEFAULT_EXAMPLES, ExampleIndex, example_turns
 from lesson_schema import Lesson
 
 # --- 1) Load your API key ---
@@ -109,130 +116,187 @@ SYSTEM_INSTRUCTION = (
     "8. The title can contain inline '$...$' math, but the steps cannot."
 )
 
-# --- 5) Few-shot examples (No changes needed, they perfectly demonstrate when to plot) ---
-FEW_SHOT = [
-    {
-        "role": "user",
-        "parts": [{"text": "Find the derivative of e^x + 3x^2"}],
-    },
-    {
-        "role": "model",
-        "parts": [{
-            "text": json.dumps({
-                "title": r"Derivative of $e^x + 3x^2$",
-                "steps": [
-                    r"f(x)=e^x+3x^2",
-                    r"f'(x)=\frac{d}{dx}(e^x)+\frac{d}{dx}(3x^2)",
-                    r"f'(x)=e^x+6x"
-                ],
-                "function_plots": [
-                    {
-                        "expression": "e**x + 3*x**2",
-                        "label": "f(x)"
-                    },
-                    {
-                        "expression": "e**x + 6*x",
-                        "label": "f'(x)"
-                    }
-                ],
-                "x_min": -2,
-                "x_max": 2
-            })
-        }],
-    },
-    {
-        "role": "user",
-        "parts": [{"text": "Solve for x: x^2 - 5x + 6 = 0"}],
-    },
-    {
-        "role": "model",
-        "parts": [{
-            "text": json.dumps({
-                "title": r"Roots of $x^2-5x+6$",
-                "steps": [
-                    r"x^2-5x+6=0",
-                    r"(x-2)(x-3)=0",
-                    r"x=2 \text{ or } x=3"
-                ],
-                "function_plots": [
-                    {
-                        "expression": "x**2 - 5*x + 6",
-                        "label": "f(x) = x^2 - 5x + 6"
-                    }
-                ],
-                "x_min": 0,
-                "x_max": 5
-            })
-        }],
-    },
-    {
-        "role": "user",
-        "parts": [{"text": "Find the area of a square with side length 4"}],
-    },
-    {
-        "role": "model",
-        "parts": [{
-            "text": json.dumps({
-                "title": r"Area of a Square",
-                "steps": [
-                    r"A = s^2",
-                    r"A = 4^2 = 16",
-                    r"A = 16 \text{ square units}"
-                ],
-                "geometric_shapes": [
-                    {
-                        "shape_type": "square",
-                        "label": "Square (s=4)",
-                        "position": [0, 0],
-                        "size": 2.0,
-                        "color": "BLUE",
-                        "fill_opacity": 0.3
-                    }
-                ]
-            })
-        }],
-    },
-]
+# --- 5) Few-shot examples (see few_shot.py; the first three are the classic set) ---
+FEW_SHOT = example_turns(DEFAULT_EXAMPLES)
+
+
+LESSON_TOOL = Tool(
+    function_declarations=[
+        FunctionDeclaration(
+            name="submit_lesson",
+            description="Submits a structured math lesson with a title, steps, and optional plotting info.",
+            parameters=JSON_SCHEMA,
+        )
+    ]
+)
+GENERATION_CONFIG = GenerationConfig(temperature=0.2, top_p=0.9, top_k=40)
+TOOL_CONFIG = {"function_calling_config": "any"}
 
 
 def _build_model():
     """Builds the GenerativeModel with the required tool."""
-    lesson_tool = Tool(
-        function_declarations=[
-            FunctionDeclaration(
-                name="submit_lesson",
-                description="Submits a structured math lesson with a title, steps, and optional plotting info.",
-                parameters=JSON_SCHEMA,
-            )
-        ]
-    )
-    generation_config = GenerationConfig(temperature=0.2, top_p=0.9, top_k=40)
     return genai.GenerativeModel(
         MODEL_NAME,
         system_instruction=SYSTEM_INSTRUCTION,
-        generation_config=generation_config,
-        tools=[lesson_tool],
+        generation_config=GENERATION_CONFIG,
+        tools=[LESSON_TOOL],
     )
 
 
 MODEL = _build_model()
 
 
-def _convert_to_json_serializable(obj):
-    """Recursively convert objects to JSON-serializable types."""
-    if hasattr(obj, '__class__') and 'RepeatedComposite' in str(obj.__class__):
-        return list(obj)
-    elif isinstance(obj, dict):
-        return {key: _convert_to_json_serializable(value) for key, value in obj.items()}
-    elif isinstance(obj, (list, tuple)):
-        return [_convert_to_json_serializable(item) for item in obj]
-    elif hasattr(obj, '__iter__') and not isinstance(obj, (str, bytes)):
-        try:
-            return list(obj)
-        except TypeError:
-            return str(obj)
+def build_request(contents, cached_content=None) -> protos.GenerateContentRequest:
+    """
+    The GenerateContentRequest MODEL would send for `contents`. With
+    `cached_content` (a CachedContent), the system instruction and tools
+    come from the cache instead.
+    """
+    request = protos.GenerateContentRequest(
+        model=MODEL.model_name,
+        contents=content_types.to_contents(contents),
+        generation_config=generation_types.to_generation_config_dict(GENERATION_CONFIG),
+    )
+    if cached_content is not None:
+        request.cached_content = cached_content.name
     else:
-        return obj
+        request.system_instruction = content_types.to_content(SYSTEM_INSTRUCTION)
+        request.tools = [LESSON_TOOL.to_proto()]
+        request.tool_config = content_types.to_tool_config(TOOL_CONFIG)
+    return request
+
+# --- 6) Prompt caching ---
+# "full" sends the classic three examples, "lean" only the most relevant ones
+FEW_SHOT_MODE = os.getenv("LLM_FEW_SHOT", "full")
+LEAN_EXAMPLES = int(os.getenv("LLM_FEW_SHOT_K", "1"))
+# Set LLM_CONTEXT_CACHE=0 to never store the prompt prefix in a Gemini context cache
+CONTEXT_CACHE = os.getenv("LLM_CONTEXT_CACHE", "1") != "0"
+CONTEXT_CACHE_TTL = int(os.getenv("LLM_CONTEXT_CACHE_TTL", "3600"))
+
+
+class PromptCache:
+    """
+    The static part of every request (system instruction, tool schema and
+    few-shot turns) is built once and reused. In full mode it is stored in a
+    Gemini context cache, so requests only carry the question and refer to
+    the cache by name. When the API refuses the cache (prefix below the
+    minimum size, model without caching) a prebuilt request is copied and
+    the question appended, so nothing is converted twice either way.
+    """
+
+    def __init__(self, mode: str = FEW_SHOT_MODE, k: int = LEAN_EXAMPLES, context_cache: bool = CONTEXT_CACHE):
+        self.mode = mode
+        self.k = max(1, k)
+        self.context_cache = context_cache and mode == "full"
+        self.index = ExampleIndex()
+        self._lock = threading.Lock()
+        self._templates = {}
+        self._cached_template = None
+        self._cache_expires = 0.0
+        self._creating_cache = False
+        self.requests = 0
+        self.request_bytes = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def examples(self, question: str):
+        if self.mode == "lean":
+            return self.index.select(question, self.k)
+        return DEFAULT_EXAMPLES
+
+    def _local_template(self, examples):
+        key = tuple(e["question"] for e in examples)
+        with self._lock:
+            template = self._templates.get(key)
+            if template is None:
+                request = build_request(example_turns(examples))
+                template = self._templates[key] = protos.GenerateContentRequest.pb(request)
+        return template
+
+    def _context_template(self):
+        """
+        Request template that points at the context cache, or None if there is
+        none. Creating the cache is an API call, made outside the lock; requests
+        that come in meanwhile use the local template rather than wait for it.
+        """
+        with self._lock:
+            if time.time() < self._cache_expires:
+                return self._cached_template
+            if self._creating_cache or not self.context_cache:
+                return None
+            self._creating_cache = True
+        try:
+            template = self._create_context_template()
+        finally:
+            with self._lock:
+                self._creating_cache = False
+        return template
+
+    def _create_context_template(self):
+        try:
+            cache = caching.CachedContent.create(
+                model=MODEL_NAME,
+                display_name="clulus-lesson-prompt",
+                system_instruction=SYSTEM_INSTRUCTION,
+                contents=FEW_SHOT,
+                tools=[LESSON_TOOL],
+                tool_config=TOOL_CONFIG,
+                ttl=CONTEXT_CACHE_TTL,
+            )
+        except Exception as e:
+            print(f"Context cache not available, sending the prompt prefix with every request: {e}")
+            with self._lock:
+                self.context_cache = False
+            return None
+        template = protos.GenerateContentRequest.pb(build_request([], cached_content=cache))
+        with self._lock:
+            self._cached_template = template
+            # Recreate a minute early so no request refers to an expired cache
+            self._cache_expires = time.time() + CONTEXT_CACHE_TTL - 60
+        return template
+
+    def stale(self) -> bool:
+        """True if the next request has to (re)create the context cache."""
+        return self.context_cache and time.time() >= self._cache_expires
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._cache_expires = 0.0
+
+    def request(self, question: str, turns) -> protos.GenerateContentRequest:
+        """The full request for `turns` (the question plus any repair messages)."""
+        template = self._context_template() if self.context_cache else None
+        if template is None:
+            template = self._local_template(self.examples(question))
+        pb = type(template)()
+        pb.CopyFrom(template)
+        for turn in turns:
+            pb.contents.append(protos.Content.pb(content_types.to_content(turn)))
+        return protos.GenerateContentRequest.wrap(pb)
+
+    def record(self, request, response) -> None:
+        usage = response.usage_metadata
+        with self._lock:
+            self.requests += 1
+            self.request_bytes += protos.GenerateContentRequest.pb(request).ByteSize()
+            self.prompt_tokens += usage.prompt_token_count
+            self.cached_tokens += usage.cached_content_token_count
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            n = self.requests
+            return {
+                "mode": self.mode,
+                "examples": self.k if self.mode == "lean" else len(DEFAULT_EXAMPLES),
+                "context_cache": self.context_cache,
+                "requests": n,
+                "avg_request_bytes": self.request_bytes / n if n else 0.0,
+                "avg_prompt_tokens": self.prompt_tokens / n if n else 0.0,
+                "cached_token_ratio": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+            }
+
+
+PROMPT = PromptCache()
 
 
 def _validate_or_raise(data: Dict[str, Any]) -> Lesson:
@@ -248,69 +312,211 @@ def _validate_or_raise(data: Dict[str, Any]) -> Lesson:
         raise ValueError(f"Pydantic validation failed: {e}")
 
 
-def ask_llm(question: str) -> str:
+DEBUG_QUESTION = "-debug previous"
+DEBUG_PATH = "./build/lesson.json"
+
+
+def _load_debug_lesson() -> Lesson:
+    """Returns the previously generated lesson (for the `-debug previous` question)."""
+    try:
+        with open(DEBUG_PATH, "r") as f:
+            data = json.load(f)
+        return _validate_or_raise(data)
+    except FileNotFoundError:
+        return Lesson(title="Error", steps=[f"Debug file not found: {DEBUG_PATH}"])
+    except Exception as e:
+        return Lesson(title="Error", steps=[f"Failed to load or validate debug file: {e}"])
+
+
+def _question_turn(question: str) -> Dict[str, Any]:
+    return {"role": "user", "parts": [{"text": question}]}
+
+
+def _generate(question: str, turns):
+    request = PROMPT.request(question, turns)
+    try:
+        resp = genai_client.get_default_generative_client().generate_content(request)
+    except api_exceptions.NotFound:
+        # The context cache expired or was deleted; rebuild it on the next call
+        PROMPT.invalidate()
+        raise
+    PROMPT.record(request, resp)
+    return generation_types.GenerateContentResponse.from_response(resp)
+
+
+async def _generate_async(question: str, turns):
+    if PROMPT.stale():
+        # Creating the context cache is a blocking API call
+        request = await asyncio.to_thread(PROMPT.request, question, turns)
+    else:
+        request = PROMPT.request(question, turns)
+    try:
+        resp = await genai_client.get_default_generative_async_client().generate_content(request)
+    except api_exceptions.NotFound:
+        PROMPT.invalidate()
+        raise
+    PROMPT.record(request, resp)
+    return generation_types.AsyncGenerateContentResponse.from_response(resp)
+
+
+def _repair_message(error: Exception) -> Dict[str, Any]:
+    repair_msg = (
+        "Your previous response was invalid or the API call failed. "
+        f"Error: {error}. "
+        "You MUST call the `submit_lesson` function with the correct parameters that fulfill the schema."
+    )
+    return {"role": "user", "parts": [{"text": repair_msg}]}
+
+
+def _lesson_from_response(resp, retry: bool = False) -> Lesson:
+    """Validates the model's function call and returns the lesson."""
+    function_call = resp.candidates[0].content.parts[0].function_call
+    if not function_call:
+        raise ValueError("Model did not return a function call" + (" on retry." if retry else "."))
+
+    # 1. Get raw dictionary-like object from the API
+    data = dict(function_call.args)
+
+    # 2. Validate and get a clean Pydantic model instance. This is the only
+    #    validation the lesson goes through; the pipeline carries it from here.
+    lesson_instance = _validate_or_raise(data)
+
+    # Save the clean, serializable data for `-debug previous`
+    os.makedirs("./build", exist_ok=True)
+    with open(DEBUG_PATH, "w") as f:
+        json.dump(lesson_instance.model_dump(), f, indent=2)
+    return lesson_instance
+
+
+def ask_llm_lesson(question: str) -> Lesson:
     """
-    Calls Gemini and returns a JSON string matching Lesson schema.
+    Calls Gemini and returns the validated Lesson.
     Uses the modern Tool Calling API for reliable, structured output.
     Will retry once with a repair message if the first output isn't valid.
     """
-    if question.strip() == "-debug previous":
-        debug_path = "./build/lesson.json"
-        try:
-            with open(debug_path, "r") as f:
-                data = json.load(f)
-            validated_data = _validate_or_raise(data)
-            return json.dumps(validated_data)
-        except FileNotFoundError:
-            return json.dumps({"title": "Error", "steps": [f"Debug file not found: {debug_path}"]})
-        except Exception as e:
-            return json.dumps({"title": "Error", "steps": [f"Failed to load or validate debug file: {e}"]})
-
-    convo = FEW_SHOT + [{"role": "user", "parts": [{"text": question}]}]
-    tool_config = {"function_calling_config": "any"}
+    if question.strip() == DEBUG_QUESTION:
+        return _load_debug_lesson()
 
+    convo = [_question_turn(question)]
     try:
-        resp = MODEL.generate_content(convo, tool_config=tool_config)
-        function_call = resp.candidates[0].content.parts[0].function_call
-        if not function_call:
-            raise ValueError("Model did not return a function call.")
-
-        # 1. Get raw dictionary-like object from the API
-        data = dict(function_call.args)
+        resp = _generate(question, convo)
+        return _lesson_from_response(resp)
+    except Exception as e1:
+        print(f"First attempt failed: {e1}. Retrying...")
+        convo.append(_repair_message(e1))
 
-        # 2. Validate and get a clean Pydantic model instance
-        lesson_instance = _validate_or_raise(data)
+        # Second attempt reuses the cached prefix, only the repair message is new
+        resp2 = _generate(question, convo)
+        return _lesson_from_response(resp2, retry=True)
 
-        # 3. Use .model_dump() to get a JSON-serializable dictionary
-        serializable_data = lesson_instance.model_dump()
 
-        # Save and return the clean, serializable data
-        os.makedirs("./build", exist_ok=True)
-        with open("./build/lesson.json", "w") as f:
-            json.dump(serializable_data, f, indent=2)
-        return json.dumps(serializable_data)
+async def ask_llm_lesson_async(question: str) -> Lesson:
+    """Same as `ask_llm_lesson`, but awaits Gemini over the async transport."""
+    if question.strip() == DEBUG_QUESTION:
+        return _load_debug_lesson()
 
+    convo = [_question_turn(question)]
+    try:
+        resp = await _generate_async(question, convo)
+        return _lesson_from_response(resp)
     except Exception as e1:
         print(f"First attempt failed: {e1}. Retrying...")
+        convo.append(_repair_message(e1))
+
+        resp2 = await _generate_async(question, convo)
+        return _lesson_from_response(resp2, retry=True)
+
 
-        repair_msg = (
-            "Your previous response was invalid or the API call failed. "
-            f"Error: {e1}. "
-            "You MUST call the `submit_lesson` function with the correct parameters that fulfill the schema."
+# --- 7) Targeted repairs ---
+# When one string of a lesson doesn't compile, only that string is sent back
+# (with the TeX error) instead of regenerating the lesson. The request is
+# small: no few-shot turns, a one-field tool.
+REPAIR_INSTRUCTION = (
+    "You fix single LaTeX strings of a math lesson that failed to compile.\n"
+    "You MUST call the `submit_fix` function with the corrected string only.\n"
+    "Change as little as possible and keep the meaning. Steps and plot or shape labels\n"
+    "are math-mode LaTeX WITHOUT '$' delimiters; steps are at most 85 characters long.\n"
+    "The title is text-mode LaTeX and may contain inline '$...$' math."
+)
+
+REPAIR_TOOL = Tool(
+    function_declarations=[
+        FunctionDeclaration(
+            name="submit_fix",
+            description="Submits the corrected LaTeX string.",
+            parameters={
+                "type": "object",
+                "properties": {"latex": {"type": "string", "description": "The corrected string, nothing else."}},
+                "required": ["latex"],
+            },
         )
-        convo.append({"role": "user", "parts": [{"text": repair_msg}]})
-
-        # Second attempt follows the same clean logic
-        resp2 = MODEL.generate_content(convo, tool_config=tool_config)
-        function_call_2 = resp2.candidates[0].content.parts[0].function_call
-        if not function_call_2:
-            raise ValueError("Model did not return a function call on retry.")
-
-        data2 = dict(function_call_2.args)
-        lesson_instance2 = _validate_or_raise(data2)
-        serializable_data2 = lesson_instance2.model_dump()
-
-        os.makedirs("./build", exist_ok=True)
-        with open("./build/lesson.json", "w") as f:
-            json.dump(serializable_data2, f, indent=2)
-        return json.dumps(serializable_data2)
\ No newline at end of file
+    ]
+)
+
+REPAIR_MODEL = genai.GenerativeModel(
+    MODEL_NAME,
+    system_instruction=REPAIR_INSTRUCTION,
+    generation_config=GENERATION_CONFIG,
+    tools=[REPAIR_TOOL],
+)
+
+
+def _repair_turn(lesson: Dict[str, Any], field: str, index, latex: str, error: str, question: str = None):
+    where = {
+        "title": "the title",
+        "steps": f"step {(index or 0) + 1}",
+        "function_plots": f"the label of plot {(index or 0) + 1}",
+        "geometric_shapes": f"the label of shape {(index or 0) + 1}",
+    }[field]
+    lines = [f"Question: {question}"] if question else []
+    lines.append(f"Lesson title: {lesson['title']}")
+    lines += [f"Step {i + 1}: {step}" for i, step in enumerate(lesson["steps"])]
+    if field == "function_plots":
+        lines += [f"Plot {i + 1}: {p['expression']}, label {p['label']}" for i, p in enumerate(lesson["function_plots"])]
+    lines.append(f"LaTeX failed to compile {where}: {latex}")
+    lines.append(f"TeX error:\n{error}")
+    lines.append(f"Return a corrected version of {where}.")
+    return _question_turn("\n".join(lines))
+
+
+def _fix_from_response(resp, field: str, latex: str) -> str:
+    function_call = resp.candidates[0].content.parts[0].function_call
+    if not function_call:
+        raise ValueError("Model did not return a fix.")
+    fix = str(dict(function_call.args).get("latex", "")).strip()
+    if field != "title":
+        fix = fix.strip("$").strip()
+    if not fix or fix == latex.strip():
+        raise ValueError("Model did not change the broken string.")
+    return fix
+
+
+def repair_latex(lesson: Dict[str, Any], field: str, index, latex: str, error: str, question: str = None) -> str:
+    """
+    Asks Gemini to fix one string of `lesson` (a lesson dict) that failed to
+    compile, and returns the replacement. `field` is "title", "steps",
+    "function_plots" or "geometric_shapes" (the label of item `index`).
+    """
+    turn = _repair_turn(lesson, field, index, latex, error, question)
+    resp = REPAIR_MODEL.generate_content([turn], tool_config=TOOL_CONFIG)
+    return _fix_from_response(resp, field, latex)
+
+
+async def repair_latex_async(lesson: Dict[str, Any], field: str, index, latex: str, error: str,
+                             question: str = None) -> str:
+    turn = _repair_turn(lesson, field, index, latex, error, question)
+    resp = await REPAIR_MODEL.generate_content_async([turn], tool_config=TOOL_CONFIG)
+    return _fix_from_response(resp, field, latex)
+
+
+def ask_llm(question: str) -> str:
+    """Calls Gemini and returns a JSON string matching Lesson schema."""
+    return json.dumps(ask_llm_lesson(question).model_dump())
+
+
+async def ask_llm_async(question: str) -> str:
+    return json.dumps((await ask_llm_lesson_async(question)).model_dump())
+
+
+def llm_stats() -> Dict[str, Any]:
+    return PROMPT.stats()
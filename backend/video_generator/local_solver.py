@@ -0,0 +1,506 @@
+# local_solver.py
+"""
+Deterministic lessons for routine questions, without a Gemini round-trip.
+
+Questions that fit one of a few templates (derivatives of polynomials and
+exponentials, roots of linear and quadratic equations, area and perimeter
+of squares, circles, rectangles and triangles) are parsed here, the steps are
+computed with SymPy and a Lesson is returned in a few milliseconds.
+Anything that doesn't match a template exactly returns None and goes to the
+LLM. Matching is deliberately strict: a question with an unfamiliar word is
+left to the model rather than answered wrongly.
+"""
+import math
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import sympy as sp
+from sympy.parsing.sympy_parser import parse_expr
+
+from lesson_schema import Lesson
+from math_parse import SAFE_LOCALS, TRANSFORMS
+
+X = sp.Symbol("x")
+
+# Same limits the LLM is given in SYSTEM_INSTRUCTION
+MAX_STEPS = 3
+MAX_STEP_CHARS = 85
+
+# Only these names may appear in an expression taken from a question;
+# parse_expr evaluates its input, so nothing else gets near it
+_EXPR_CHARS = re.compile(r"^[0-9a-z+\-*/^().\s]+$")
+_EXPR_NAMES = {"x", "e", "pi", "sin", "cos", "exp", "ln", "log", "sqrt"}
+_ROUTINE_FUNCTIONS = (sp.exp, sp.sin, sp.cos)
+
+_NUMBER = r"(\d+(?:\.\d+)?)"
+_WORD_NUMBERS = {"squared": "^2", "cubed": "^3"}
+
+
+def _normalize(question: str) -> str:
+    q = question.strip().lower().rstrip("?.! ")
+    for word, power in _WORD_NUMBERS.items():
+        q = re.sub(rf"\s*\b{word}\b", power, q)
+    return re.sub(r"\s+", " ", q)
+
+
+def _parse(text: str) -> Optional[sp.Expr]:
+    text = text.strip()
+    if not text or not _EXPR_CHARS.match(text):
+        return None
+    if any(name not in _EXPR_NAMES for name in re.findall(r"[a-z]+", text)):
+        return None
+    try:
+        expr = parse_expr(text, transformations=TRANSFORMS, local_dict={**SAFE_LOCALS, "x": X})
+    except Exception:
+        return None
+    if not isinstance(expr, sp.Expr) or expr.free_symbols - {X}:
+        return None
+    return expr
+
+
+def _tex(expr) -> str:
+    return sp.latex(expr)
+
+
+def _num(value) -> str:
+    """Integers as integers, everything else as a short decimal."""
+    value = sp.nsimplify(value)
+    if value.is_Integer:
+        return str(value)
+    return f"{float(value):g}"
+
+
+def _approx(value) -> str:
+    return f"{float(value):.2f}"
+
+
+# --- Derivatives ---
+
+_DERIVATIVE = [
+    re.compile(r"^(?:(?:find|compute|calculate|what is|what's)\s+)?(?:the\s+)?"
+               r"(?:derivative\s+of|differentiate)\s+(?:f\(x\)\s*=|y\s*=)?\s*(?P<expr>.+?)"
+               r"(?:\s+with respect to x)?$"),
+    re.compile(r"^d/dx\s*(?P<expr>.+)$"),
+]
+
+
+def _is_routine(expr: sp.Expr) -> bool:
+    """Polynomials, exponentials and sin/cos of linear arguments."""
+    for f in expr.atoms(sp.Function):
+        arg = f.args[0]
+        if f.func not in _ROUTINE_FUNCTIONS or not arg.is_polynomial(X) or sp.degree(arg, X) > 1:
+            return False
+    for p in expr.atoms(sp.Pow):
+        if not p.exp.is_Number or not p.base.is_polynomial(X):
+            return False
+    return expr.has(X)
+
+
+def _derivative(q: str) -> Optional[Dict[str, Any]]:
+    match = next((m for m in (p.match(q) for p in _DERIVATIVE) if m), None)
+    if not match:
+        return None
+    expr = _parse(match.group("expr"))
+    if expr is None or not _is_routine(expr):
+        return None
+
+    derivative = sp.diff(expr, X)
+    rule = "+".join(rf"\frac{{d}}{{dx}}({_tex(t)})" for t in expr.as_ordered_terms())
+    steps = [f"f(x)={_tex(expr)}", f"f'(x)={rule}", f"f'(x)={_tex(derivative)}"]
+    if len(steps[1]) > MAX_STEP_CHARS:
+        # The sum-rule step is the one that grows with the number of terms
+        del steps[1]
+    x_range = 2 if expr.has(sp.exp) else 3
+    return {
+        "title": f"Derivative of ${_tex(expr)}$",
+        "steps": steps,
+        "function_plots": [
+            {"expression": sp.sstr(expr), "label": "f(x)"},
+            {"expression": sp.sstr(derivative), "label": "f'(x)"},
+        ],
+        "x_min": -x_range,
+        "x_max": x_range,
+    }
+
+
+# --- Linear and quadratic equations ---
+
+_EQUATION = [
+    (re.compile(r"^solve(?:\s+for\s+x)?\s*:?\s+(?P<eq>.+)$"), "roots"),
+    (re.compile(r"^(?P<eq>.+?),?\s+solve(?:\s+for\s+x)?$"), "roots"),
+    (re.compile(r"^(?:find\s+)?(?:the\s+)?(?:roots|zeros|solutions)\s+of\s+(?:f\(x\)\s*=|y\s*=)?\s*(?P<eq>.+)$"),
+     "roots"),
+    (re.compile(r"^(?:find\s+)?(?:the\s+)?x[- ]?intercepts?\s+of\s+(?:f\(x\)\s*=|y\s*=)?\s*(?P<eq>.+)$"),
+     "intercepts"),
+]
+
+
+def _real_roots(poly: sp.Poly) -> Optional[List[sp.Expr]]:
+    roots = sp.roots(poly)
+    if sum(roots.values()) != poly.degree() or not all(r.is_real for r in roots):
+        return None
+    return sorted(roots, key=float)
+
+
+def _factored(poly: sp.Poly) -> Optional[str]:
+    """'(x-2)(x-3)' if the polynomial splits into rational linear factors."""
+    coeff, factors = sp.factor_list(poly.as_expr())
+    if any(sp.degree(f, X) != 1 for f, _ in factors):
+        return None
+    factors = sorted(factors, key=lambda fm: float(sp.solve(fm[0], X)[0]))
+    parts = [f"({_tex(f)})" + (f"^{m}" if m > 1 else "") for f, m in factors]
+    prefix = "" if coeff == 1 else ("-" if coeff == -1 else _tex(coeff))
+    return prefix + "".join(parts)
+
+
+def _equation(q: str) -> Optional[Dict[str, Any]]:
+    for pattern, kind in _EQUATION:
+        match = pattern.match(q)
+        if match:
+            break
+    else:
+        return None
+
+    sides = match.group("eq").split("=")
+    if len(sides) > 2:
+        return None
+    lhs = _parse(sides[0])
+    rhs = _parse(sides[1]) if len(sides) == 2 else sp.Integer(0)
+    if lhs is None or rhs is None:
+        return None
+    try:
+        poly = sp.Poly(sp.expand(lhs - rhs), X)
+    except sp.PolynomialError:
+        return None
+    if poly.degree() not in (1, 2) or not (poly.domain.is_ZZ or poly.domain.is_QQ):
+        return None
+    roots = _real_roots(poly)
+    if roots is None:
+        return None
+    answer = r" \text{ or } ".join(f"x={_tex(r)}" for r in roots)
+
+    if poly.degree() == 1:
+        if kind == "intercepts":
+            return None
+        a, b = poly.all_coeffs()
+        steps = [f"{_tex(lhs)}={_tex(rhs)}", f"{_tex(a * X)}={_tex(-b)}", answer]
+        # Drop steps that don't change anything, e.g. for '2x = 4'
+        steps = [s for i, s in enumerate(steps) if i == 0 or s != steps[i - 1]]
+        return {"title": f"Solve ${_tex(lhs)}={_tex(rhs)}$", "steps": steps}
+
+    expr = poly.as_expr()
+    factored = _factored(poly)
+    if factored:
+        middle = f"{factored}=0"
+    else:
+        a, b, c = poly.all_coeffs()
+        middle = rf"x=\frac{{{_tex(-b)}\pm\sqrt{{{_tex(b ** 2 - 4 * a * c)}}}}}{{{_tex(2 * a)}}}"
+    if kind == "intercepts":
+        title, label = f"Intercepts of $y={_tex(expr)}$", f"y = {_tex(expr)}"
+    else:
+        title, label = f"Roots of ${_tex(expr)}$", f"f(x) = {_tex(expr)}"
+    return {
+        "title": title,
+        "steps": [f"{_tex(expr)}=0", middle, answer],
+        "function_plots": [{"expression": sp.sstr(expr), "label": label}],
+        "x_min": math.floor(float(roots[0])) - 2,
+        "x_max": math.ceil(float(roots[-1])) + 2,
+    }
+
+
+# --- Area and perimeter of basic shapes ---
+
+_GEOMETRY_WORDS = {
+    "find", "the", "what", "whats", "is", "its", "of", "a", "an", "with", "has", "and", "by",
+    "calculate", "compute", "determine", "given", "if", "whose", "are", "each", "equal", "to",
+    "area", "perimeter", "circumference",
+    "square", "circle", "rectangle", "triangle", "right",
+    "side", "sides", "length", "lengths", "radius", "diameter", "width", "height", "base", "leg", "legs",
+    "long", "wide", "tall", "units", "unit", "cm", "m", "mm", "km", "in", "ft", "inches", "meters",
+}
+_SHAPES = ("square", "circle", "rectangle", "triangle")
+# Largest drawn dimension, in LessonScene units
+_DRAW_SIZE = 2.5
+
+
+# Dimension words and what they name; "long", "wide" and "tall" follow their number
+_DIMENSIONS = {
+    "side": "side", "sides": "side", "length": "length", "lengths": "length", "long": "length",
+    "radius": "radius", "diameter": "diameter", "width": "width", "wide": "width",
+    "height": "height", "tall": "height", "base": "base", "leg": "leg", "legs": "leg",
+    "area": "area", "perimeter": "perimeter", "circumference": "perimeter",
+}
+_ADJECTIVES = {"long", "wide", "tall"}
+# Plural words that take two numbers: "legs 3 and 4"
+_PAIRS = {"legs": ("base", "height"), "sides": ("length", "width"), "lengths": ("length", "width")}
+# Words that may sit between a dimension and its number: "area of a square is 25"
+_LINKS = {"of", "is", "equal", "equals", "to", "a", "an", "the", "its"}
+_UNITS = {"cm", "m", "mm", "km", "in", "ft", "inches", "meters"}
+
+
+def _bind(q: str) -> Optional[Tuple[Dict[str, Tuple[sp.Rational, Optional[str]]], List[str]]]:
+    """
+    ({dimension: (value, unit)}, [dimensions asked for]) with every number bound
+    to the dimension word next to it; None if a number can't be bound, or is bound twice.
+    """
+    tokens = re.findall(r"\d+(?:\.\d+)?|[a-z]+", q)
+    given: Dict[str, Tuple[sp.Rational, Optional[str]]] = {}
+    asked: List[str] = []
+    bound = set()
+
+    def number_at(i):
+        """(value, unit, index after it) if tokens[i] is a number, else None."""
+        if i >= len(tokens) or not tokens[i][0].isdigit():
+            return None
+        unit = tokens[i + 1] if i + 1 < len(tokens) and tokens[i + 1] in _UNITS else None
+        return sp.Rational(tokens[i]), unit, i + 1 + (unit is not None)
+
+    def named_after(i):
+        """True if the word after the number at i says what it is: '5 cm square', '3 by 5', '4 long'."""
+        _, _, after = number_at(i)
+        return after < len(tokens) and (tokens[after] in _SHAPES or tokens[after] in _ADJECTIVES
+                                        or tokens[after] == "by")
+
+    def give(name, i):
+        value, unit, _ = number_at(i)
+        if name in given:
+            return False
+        given[name] = (value, unit)
+        bound.add(i)
+        return True
+
+    i = 0
+    while i < len(tokens):
+        word = tokens[i]
+        if word in _DIMENSIONS and word not in _ADJECTIVES:
+            name = _DIMENSIONS[word]
+            if name == "side" and i + 1 < len(tokens) and tokens[i + 1] in ("length", "lengths"):
+                # "side length 4", "side lengths 3 and 4"
+                i += 1
+                word = word if word == "sides" else tokens[i]
+            j = i + 1
+            while j < len(tokens) and (tokens[j] in _LINKS or tokens[j] in _SHAPES):
+                j += 1
+            if number_at(j) is None or j in bound or named_after(j):
+                asked.append(name)
+                i += 1
+                continue
+            after = number_at(j)[2]
+            if word in _PAIRS and tokens[after:after + 1] == ["and"] and number_at(after + 1):
+                first, second = _PAIRS[word]
+                if not (give(first, j) and give(second, after + 1)):
+                    return None
+            elif not give(name, j):
+                return None
+        elif word[0].isdigit() and i not in bound:
+            _, _, after = number_at(i)
+            nxt = tokens[after] if after < len(tokens) else None
+            if nxt in _ADJECTIVES:
+                if not give(_DIMENSIONS[nxt], i):
+                    return None
+            elif nxt == "by" and number_at(after + 1):
+                if not (give("length", i) and give("width", after + 1)):
+                    return None
+            elif nxt in _SHAPES:
+                if not give("size", i):
+                    return None
+            else:
+                return None
+        i += 1
+    return given, asked
+
+
+def _draw(value, scale: float) -> float:
+    return round(float(value) * scale, 2)
+
+
+def _geometry(q: str) -> Optional[Dict[str, Any]]:
+    q = re.sub(rf"{_NUMBER}\s*[x×]\s*{_NUMBER}", r"\1 by \2", q)
+    words = re.findall(r"[a-z]+", q.replace("'", ""))
+    if not words or any(w not in _GEOMETRY_WORDS for w in words):
+        return None
+    shapes = [s for s in _SHAPES if s in words]
+    if len(shapes) != 1:
+        return None
+    binding = _bind(q.replace("'", ""))
+    if binding is None:
+        return None
+    given, asked = binding
+    # Only area or perimeter from the shape's dimensions; inverse questions
+    # ("the side of a square with area 16") go to the LLM
+    if len(set(asked)) != 1 or asked[0] not in ("area", "perimeter"):
+        return None
+    if not given or "area" in given or "perimeter" in given:
+        return None
+    values = {name: value for name, (value, _) in given.items()}
+    if any(v <= 0 for v in values.values()):
+        return None
+    if len({unit for _, unit in given.values() if unit}) > 1:
+        return None
+    builder = _GEOMETRY_BUILDERS[shapes[0]]
+    return builder(q, values, asked[0])
+
+
+def _square(q, given, quantity):
+    s = given.get("side", given.get("size"))
+    if s is None or len(given) != 1:
+        return None
+    if quantity == "area":
+        title, value = "Area of a Square", s ** 2
+        steps = ["A = s^2", f"A = {_num(s)}^2 = {_num(value)}", rf"A = {_num(value)} \text{{ square units}}"]
+    else:
+        title, value = "Perimeter of a Square", 4 * s
+        steps = ["P = 4s", rf"P = 4 \cdot {_num(s)} = {_num(value)}", rf"P = {_num(value)} \text{{ units}}"]
+    return {
+        "title": title,
+        "steps": steps,
+        "geometric_shapes": [{
+            "shape_type": "square", "label": f"Square (s={_num(s)})", "position": [0, 0],
+            "size": min(max(float(s) / 2, 1.0), 3.0), "color": "BLUE", "fill_opacity": 0.3,
+        }],
+    }
+
+
+def _circle(q, given, quantity):
+    r = given.get("radius")
+    d = given.get("diameter")
+    if len(given) != 1 or (r is None) == (d is None):
+        return None
+    steps = []
+    if d is not None:
+        r = d / 2
+        steps.append(rf"r = \frac{{d}}{{2}} = {_num(r)}")
+    if quantity == "area":
+        title, coeff = "Area of a Circle", r ** 2
+        steps += [r"A = \pi r^2", rf"A = \pi \cdot {_num(r)}^2", rf"A = {_num(coeff)}\pi \approx {_approx(coeff * sp.pi)}"]
+    else:
+        title, coeff = "Circumference of a Circle", 2 * r
+        steps += [r"C = 2\pi r", rf"C = 2\pi \cdot {_num(r)}", rf"C = {_num(coeff)}\pi \approx {_approx(coeff * sp.pi)}"]
+    if len(steps) > MAX_STEPS:
+        # Fold the formula into the substitution step when the radius had to be derived
+        steps = [steps[0]] + steps[2:]
+    return {
+        "title": title,
+        "steps": steps,
+        "geometric_shapes": [{
+            "shape_type": "circle", "label": f"r = {_num(r)}", "position": [0, 0],
+            "size": min(max(float(r) / 2, 1.0), 3.0), "color": "GREEN", "fill_opacity": 0.3,
+        }],
+    }
+
+
+def _rectangle(q, given, quantity):
+    length = given.get("length")
+    # A rectangle's height is its width
+    width = given.get("width", given.get("height"))
+    if length is None or width is None or len(given) != 2:
+        return None
+    if quantity == "area":
+        title, value = "Area of a Rectangle", length * width
+        steps = [r"A = l \cdot w", rf"A = {_num(length)} \cdot {_num(width)}", rf"A = {_num(value)} \text{{ square units}}"]
+    else:
+        title, value = "Perimeter of a Rectangle", 2 * (length + width)
+        steps = ["P = 2(l+w)", f"P = 2({_num(length)}+{_num(width)})", rf"P = {_num(value)} \text{{ units}}"]
+    scale = _DRAW_SIZE / float(max(length, width))
+    return {
+        "title": title,
+        "steps": steps,
+        "geometric_shapes": [{
+            "shape_type": "rectangle", "label": rf"{_num(length)} \times {_num(width)}", "position": [0, 0],
+            "width": _draw(length, scale), "height": _draw(width, scale), "color": "PURPLE", "fill_opacity": 0.3,
+        }],
+    }
+
+
+def _triangle(q, given, quantity):
+    # The perimeter needs all three sides, which is rarely how it's asked
+    base = given.get("base")
+    height = given.get("height")
+    if quantity != "area" or base is None or height is None or len(given) != 2:
+        return None
+    value = base * height / 2
+    scale = _DRAW_SIZE / float(max(base, height))
+    w, h = _draw(base, scale) / 2, _draw(height, scale) / 2
+    right = "right" in q or "leg" in q
+    return {
+        "title": "Area of a Right Triangle" if right else "Area of a Triangle",
+        "steps": [
+            r"A = \frac{1}{2}bh",
+            rf"A = \frac{{1}}{{2}}\cdot {_num(base)} \cdot {_num(height)}",
+            rf"A = {_num(value)} \text{{ square units}}",
+        ],
+        "geometric_shapes": [{
+            "shape_type": "polygon", "label": f"b={_num(base)}, h={_num(height)}", "position": [0, 0],
+            "vertices": [[-w, -h], [w, -h], [-w, h]], "color": "ORANGE", "fill_opacity": 0.3,
+        }],
+    }
+
+
+_GEOMETRY_BUILDERS = {"square": _square, "circle": _circle, "rectangle": _rectangle, "triangle": _triangle}
+
+TEMPLATES: List[Tuple[str, Callable[[str], Optional[Dict[str, Any]]]]] = [
+    ("derivative", _derivative),
+    ("equation", _equation),
+    ("geometry", _geometry),
+]
+
+
+def solve_locally(question: str) -> Optional[Tuple[str, Lesson]]:
+    """(template name, lesson) if a template answers the question, otherwise None."""
+    q = _normalize(question)
+    for name, template in TEMPLATES:
+        try:
+            data = template(q)
+        except Exception as e:
+            print(f"Local solver template {name} failed on {question!r}: {e}")
+            continue
+        if data is None:
+            continue
+        if len(data["steps"]) > MAX_STEPS or any(len(s) > MAX_STEP_CHARS for s in data["steps"]):
+            return None
+        return name, Lesson.model_validate(data)
+    return None
+
+
+class SolverStats:
+    """Template hit rate, and the LLM time saved by the hits."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.questions = 0
+        self.hits = {}
+        self.local_seconds = 0.0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+
+    def record_hit(self, template: str, seconds: float) -> None:
+        with self._lock:
+            self.questions += 1
+            self.hits[template] = self.hits.get(template, 0) + 1
+            self.local_seconds += seconds
+
+    def record_llm(self, seconds: float) -> None:
+        with self._lock:
+            self.questions += 1
+            self.llm_calls += 1
+            self.llm_seconds += seconds
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = sum(self.hits.values())
+            avg_llm = self.llm_seconds / self.llm_calls if self.llm_calls else None
+            avg_local = self.local_seconds / hits if hits else 0.0
+            return {
+                "questions": self.questions,
+                "template_hits": hits,
+                "hit_rate": hits / self.questions if self.questions else 0.0,
+                "hits_by_template": dict(self.hits),
+                "avg_local_ms": avg_local * 1000,
+                "avg_llm_ms": avg_llm * 1000 if avg_llm is not None else None,
+                # Estimated from the average LLM call seen by this process
+                "latency_saved_s": hits * (avg_llm - avg_local) if avg_llm is not None else None,
+            }
@@ -1,8 +1,7 @@
 # app.py
 import os, json, subprocess, sys
 from pathlib import Path
-from llm_client import ask_llm
-from lesson_schema import Lesson
+from llm_client import ask_llm_lesson
 
 BUILD = Path("build")
 BUILD.mkdir(exist_ok=True)
@@ -36,12 +35,8 @@ def main():
     else:
         question = input("Enter a math question: ").strip()
 
-    # (2) LLM → JSON
-    json_str = ask_llm(question)
-
-    # (3) Validate schema
-    data = json.loads(json_str)
-    lesson = Lesson.model_validate(data)
+    # (2) LLM → validated lesson
+    lesson = ask_llm_lesson(question)
 
     # Sacve JSON for the scene to read
     json_path = BUILD / "lesson.json"
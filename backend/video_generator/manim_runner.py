@@ -0,0 +1,169 @@
+# manim_runner.py
+import asyncio
+import json
+import os
+import subprocess
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from jobs import FAILURE_PREFIX, PROGRESS_PREFIX
+from render_profile import QUALITY_FPS, QUALITY_HEIGHTS
+
+VIDEO_GEN_DIR = Path(__file__).resolve().parent
+# Both can be moved, e.g. so a load test doesn't fill the real render cache
+BUILD_DIR = Path(os.getenv("CLULUS_BUILD_DIR", str(VIDEO_GEN_DIR / "build")))
+MEDIA_DIR = Path(os.getenv("CLULUS_MEDIA_DIR", str(VIDEO_GEN_DIR / "media")))
+# Manim creates videos in media/videos/render_scene/1080p60/ directory
+VIDEO_DIR = MEDIA_DIR / "videos" / "render_scene" / "1080p60"
+# Each pipeline render gets its own Manim media dir here (see retention.py)
+RENDERS_DIR = MEDIA_DIR / "renders"
+# TeX output is shared by all renders; identical labels compile to the same files
+TEX_DIR = Path(os.getenv("MANIM_TEX_DIR", str(MEDIA_DIR / "Tex")))
+
+ProgressCallback = Callable[[Dict], None]
+
+
+class RenderFailure(RuntimeError):
+    """
+    A failed render. `category` says what broke ("tex", "scene", "killed",
+    "crash" or "no_output"; "preflight" when tex_preflight caught it before
+    Manim ran); `reports` holds what LessonScene printed about it, e.g.
+    {"field": "steps", "index": 2, "latex": ..., "error": ...}.
+    """
+
+    def __init__(self, message: str, category: str, reports: Optional[List[Dict]] = None):
+        super().__init__(message)
+        self.category = category
+        self.reports = reports or []
+
+
+def output_dir(quality: str = "h", fps: Optional[int] = None, media_dir: Optional[Path] = None) -> Path:
+    """Directory Manim writes the video to, e.g. media/videos/render_scene/1080p30."""
+    fps = fps or QUALITY_FPS[quality]
+    return (media_dir or MEDIA_DIR) / "videos" / "render_scene" / f"{QUALITY_HEIGHTS[quality]}p{fps}"
+
+
+def _manim_command(json_path: Path, quality: str, out_name: str, fps: Optional[int] = None,
+                   media_dir: Optional[Path] = None, stills: bool = True,
+                   caching: bool = False) -> Tuple[List[str], Dict[str, str]]:
+    env = os.environ.copy()
+    # Make 100% sure TeX is on PATH for the manim subprocess
+    texbin = "/Library/TeX/texbin"
+    env["PATH"] = f"{texbin}:{env.get('PATH','')}"
+    env["LESSON_JSON"] = str(json_path.resolve())
+    # render_scene points config.tex_dir here (--media_dir would move it otherwise)
+    env["CLULUS_TEX_DIR"] = str(TEX_DIR)
+    # LessonScene writes the poster and preview next to the video (see stills.py)
+    if stills:
+        env["CLULUS_STILLS"] = str(output_dir(quality, fps, media_dir) / out_name)
+    else:
+        env.pop("CLULUS_STILLS", None)
+
+    cmd = [
+        "manim", f"-q{quality}", "-o", out_name,
+        "render_scene.py", "LessonScene",
+    ]
+    # With caching, finished animations stay in media_dir and a retry reuses them
+    if not caching:
+        cmd.append("--disable_caching")
+    if fps:
+        cmd += ["--fps", str(fps)]
+    if media_dir:
+        cmd += ["--media_dir", str(media_dir)]
+    print("Running:", " ".join(cmd))
+    print("LESSON_JSON:", env["LESSON_JSON"])
+    return cmd, env
+
+
+def _handle_line(line: str, output: List[str], on_progress: Optional[ProgressCallback],
+                 reports: List[Dict]) -> None:
+    if line.startswith(FAILURE_PREFIX):
+        try:
+            reports.append(json.loads(line[len(FAILURE_PREFIX):]))
+        except ValueError:
+            pass
+        return
+    if line.startswith(PROGRESS_PREFIX):
+        if on_progress:
+            try:
+                on_progress(json.loads(line[len(PROGRESS_PREFIX):]))
+            except ValueError:
+                pass
+        return
+    output.append(line)
+
+
+def _finish(returncode: int, output: List[str], out_path: Path, reports: List[Dict]) -> Path:
+    text = "".join(output)
+    print("Manim output:", text)
+    if returncode != 0:
+        if reports:
+            category = reports[0].get("category", "scene")
+        else:
+            category = "killed" if returncode < 0 else "crash"
+        raise RenderFailure(
+            f"Manim render failed. Return code: {returncode}, output: {text[-2000:]}", category, reports,
+        )
+
+    # Check if the video was actually created
+    if not out_path.exists():
+        raise RenderFailure(f"Video file was not created at {out_path}", "no_output")
+    return out_path
+
+
+def compile_manim(json_path: Path, quality: str = "h", out_name: str = None,
+                  on_progress: Optional[ProgressCallback] = None,
+                  fps: Optional[int] = None, media_dir: Optional[Path] = None,
+                  stills: bool = True, caching: bool = False) -> Path:
+    """Compile Manim video from lesson JSON.
+
+    If `on_progress` is given it is called with a dict for every animation
+    the scene finishes, as reported by LessonScene on stdout. `fps`
+    overrides the frame rate of the quality preset. `media_dir` gives the
+    render its own Manim media directory instead of the shared media/.
+    `stills=False` skips the poster and preview (e.g. for HLS rungs).
+    `caching=True` keeps Manim's per-animation cache in `media_dir`, so a
+    retry in the same directory only renders what changed. Failures raise
+    RenderFailure.
+    """
+    assert json_path.exists()
+    out_name = out_name or "lesson"
+    cmd, env = _manim_command(json_path, quality, out_name, fps, media_dir, stills, caching)
+
+    # Run manim from the video_generator directory. Passing cwd instead of
+    # os.chdir keeps concurrent renders from racing on the working directory.
+    proc = subprocess.Popen(
+        cmd, env=env, cwd=VIDEO_GEN_DIR,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1,
+    )
+    output: List[str] = []
+    reports: List[Dict] = []
+    for line in proc.stdout:
+        _handle_line(line, output, on_progress, reports)
+    proc.wait()
+    return _finish(proc.returncode, output, output_dir(quality, fps, media_dir) / f"{out_name}.mp4", reports)
+
+
+async def compile_manim_async(json_path: Path, quality: str = "h", out_name: str = None,
+                              on_progress: Optional[ProgressCallback] = None,
+                              fps: Optional[int] = None, media_dir: Optional[Path] = None,
+                              stills: bool = True, caching: bool = False) -> Path:
+    """Same as `compile_manim`, but awaits the subprocess on the event loop."""
+    assert json_path.exists()
+    out_name = out_name or "lesson"
+    cmd, env = _manim_command(json_path, quality, out_name, fps, media_dir, stills, caching)
+
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, env=env, cwd=VIDEO_GEN_DIR,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+        limit=1 << 20,  # tqdm redraws can make very long "lines"
+    )
+    output: List[str] = []
+    reports: List[Dict] = []
+    while True:
+        raw = await proc.stdout.readline()
+        if not raw:
+            break
+        _handle_line(raw.decode(errors="replace"), output, on_progress, reports)
+    await proc.wait()
+    return _finish(proc.returncode, output, output_dir(quality, fps, media_dir) / f"{out_name}.mp4", reports)
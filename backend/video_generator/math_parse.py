@@ -0,0 +1,85 @@
+# math_parse.py
+import re
+import sympy as sp
+from sympy.parsing.sympy_parser import (
+    parse_expr,
+    standard_transformations,
+    implicit_multiplication_application,
+    convert_xor,
+)
+
+# Try LaTeX parser if available
+try:
+    from sympy.parsing.latex import parse_latex
+    _HAS_PARSE_LATEX = True
+except Exception:
+    _HAS_PARSE_LATEX = False
+
+TRANSFORMS = standard_transformations + (
+    implicit_multiplication_application,  # "3x" -> 3*x
+    convert_xor,                          # "^"   -> "**"
+)
+
+SAFE_LOCALS = {
+    "e": sp.E, "E": sp.E, "pi": sp.pi,
+    "sin": sp.sin, "cos": sp.cos, "tan": sp.tan,
+    "asin": sp.asin, "acos": sp.acos, "atan": sp.atan,
+    "sinh": sp.sinh, "cosh": sp.cosh, "tanh": sp.tanh,
+    "sec": sp.sec, "csc": sp.csc, "cot": sp.cot,
+    "exp": sp.exp, "log": sp.log, "ln": sp.log, "sqrt": sp.sqrt,
+    "abs": sp.Abs,
+}
+
+_LATEX_SPACING = re.compile(r"\\[,\!\;\:\s]")
+
+def _normalize_latex(s: str) -> str:
+    # Handle \frac{a}{b} -> (a)/(b) (repeat to unwrap nested)
+    frac_pat = re.compile(r"\\frac\s*\{([^{}]+)\}\s*\{([^{}]+)\}")
+    while True:
+        s2 = re.sub(frac_pat, r"(\1)/(\2)", s)
+        if s2 == s:
+            break
+        s = s2
+
+    # \sin^2 x, \cos^{3}(x) -> (sin(x))**2, (cos(x))**3
+    s = re.sub(
+        r"\\(?P<fn>sin|cos|tan|sec|csc|cot|sinh|cosh|tanh)\s*\^\s*(?P<p>\d+)\s*\(?\s*(?P<a>[A-Za-z0-9_]+)\s*\)?",
+        r"(\g<fn>(\g<a>))**\g<p>", s)
+
+    # Convert \fn(x) / \fn x -> fn(x)
+    for fn in ["sin","cos","tan","sec","csc","cot","sinh","cosh","tanh","exp","log","ln","sqrt","abs"]:
+        s = re.sub(rf"\\{fn}\s*\(", f"{fn}(", s)
+        s = re.sub(rf"\\{fn}\s+([A-Za-z0-9_]+)", rf"{fn}(\1)", s)
+
+    # Constants, operators, wrappers
+    s = s.replace(r"\pi", "pi").replace(r"\mathrm{e}", "e")
+    s = s.replace(r"\cdot", "*").replace(r"\times", "*")
+    s = s.replace(r"\left", "").replace(r"\right", "")
+    s = _LATEX_SPACING.sub("", s)
+
+    # As a last step, brace → parenthesis (helps with x^{2} etc.)
+    s = s.replace("{", "(").replace("}", ")")
+    return s.strip()
+
+def to_sympy_expr(s: str) -> sp.Expr:
+    s = s.strip()
+    x = sp.symbols("x")
+
+    # 1) Try proper LaTeX parse
+    if _HAS_PARSE_LATEX:
+        try:
+            return parse_latex(s)
+        except Exception:
+            pass  # fall back below
+
+    # 2) Normalize common LaTeX → plain math
+    s = _normalize_latex(s)
+
+    # 3) Minor conveniences: e^x → e**x is handled by convert_xor; we map e→E
+    expr = parse_expr(
+        s,
+        transformations=TRANSFORMS,
+        local_dict={**SAFE_LOCALS, "x": x},
+        evaluate=True,
+    )
+    return expr
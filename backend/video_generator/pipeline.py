@@ -0,0 +1,488 @@
+# pipeline.py
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+
+from lesson_canon import DedupStats, canonicalize_lesson
+from lesson_compact import CompactLesson
+from hls import HLS_PACKAGING, HLS_STATS, HLS_SUFFIX, MASTER_PLAYLIST, package_hls, package_hls_async
+from lesson_schema import Lesson
+from llm_client import ask_llm_lesson, ask_llm_lesson_async, llm_stats
+from local_solver import SolverStats, solve_locally
+from manim_runner import BUILD_DIR, RenderFailure, compile_manim, compile_manim_async
+from recovery import (
+    RECOVERY_STATS, RENDER_CHECKPOINTS, RENDER_REPAIRS, CheckpointStore, repair_lesson,
+    repair_lesson_async, repairable,
+)
+from render_cache import RenderCache, cache_key
+from render_farm import COORDINATOR_URL, FarmClient
+from render_profile import choose_render_profile
+from retention import RenderArtifacts, disk_usage, start_sweeper
+from stills import STILL_SUFFIXES, still_paths
+from tex_preflight import PREFLIGHT_STATS, PREFLIGHT_TEX, TEX_WARM, TexPreflight, TexWarmer, check_lesson
+
+BUILD_DIR.mkdir(parents=True, exist_ok=True)
+
+# Manim quality preset; the frame rate is picked per lesson (see render_profile)
+RENDER_QUALITY = "h"
+# Manim processes rendering at once, HLS rungs included (asgi.py sizes its semaphore the same way)
+RENDER_CONCURRENCY = int(os.getenv("RENDER_CONCURRENCY", str(os.cpu_count() or 2)))
+RENDER_SLOTS = threading.BoundedSemaphore(RENDER_CONCURRENCY)
+# HLS packages are built after the MP4 is returned; the executor only starts threads when used
+_HLS_EXECUTOR = ThreadPoolExecutor(max_workers=RENDER_CONCURRENCY, thread_name_prefix="hls-package")
+_HLS_TASKS = set()
+RENDER_CACHE = RenderCache()
+DEDUP_STATS = DedupStats()
+# Set LOCAL_SOLVER=0 to send every question to the LLM
+LOCAL_SOLVER = os.getenv("LOCAL_SOLVER", "1") != "0"
+SOLVER_STATS = SolverStats()
+# With CLULUS_COORDINATOR_URL set, renders run on render farm workers (see render_farm.py)
+FARM = FarmClient(COORDINATOR_URL, RENDER_CACHE) if COORDINATOR_URL else None
+# Validated lessons of unfinished jobs, so a retry skips the LLM (see recovery.py)
+CHECKPOINTS = CheckpointStore()
+# Typesets a lesson's LaTeX before it goes to Manim, and precompiles its SVGs (see tex_preflight)
+PREFLIGHT = TexPreflight() if PREFLIGHT_TEX else None
+TEX_WARMER = TexWarmer() if TEX_WARM else None
+_SERVICES_STARTED = False
+
+
+def start_services() -> None:
+    """
+    Starts a server's background work: the sweeper that clears out what
+    crashed renders left behind, and the pre-flight TeX processes. Called from
+    app.py and asgi.py at startup, so importing the pipeline (benchmarks,
+    tests) leaves the media dir alone and spawns nothing.
+    """
+    global _SERVICES_STARTED
+    if _SERVICES_STARTED:
+        return
+    _SERVICES_STARTED = True
+    start_sweeper()
+    if PREFLIGHT:
+        PREFLIGHT.start()
+
+
+def _canonical(raw: Lesson) -> CompactLesson:
+    lesson = canonicalize_lesson(raw)
+    DEDUP_STATS.record(raw, lesson.fingerprint)
+    return lesson
+
+
+def _solve_locally(question: str):
+    """Lesson from a local template, or None if the question needs the LLM."""
+    if not LOCAL_SOLVER:
+        return None
+    t0 = time.perf_counter()
+    match = solve_locally(question)
+    if match is None:
+        return None
+    template, lesson = match
+    SOLVER_STATS.record_hit(template, time.perf_counter() - t0)
+    return lesson
+
+
+def _resume(question: str):
+    """Lesson checkpointed by an earlier job for this question that failed, or None."""
+    if not RENDER_CHECKPOINTS:
+        return None
+    lesson = CHECKPOINTS.load(question)
+    if lesson is not None:
+        RECOVERY_STATS.record_resume()
+    return lesson
+
+
+def _checkpoint(question: str, lesson: CompactLesson) -> CompactLesson:
+    if RENDER_CHECKPOINTS:
+        CHECKPOINTS.save(question, lesson, "lesson")
+    return lesson
+
+
+def generate_lesson(question: str) -> CompactLesson:
+    """
+    Answers routine questions locally, otherwise asks the LLM for a lesson
+    (validated once, in llm_client). Returns the canonical, compact form.
+    LLM lessons are checkpointed until their video is rendered.
+    """
+    lesson = _solve_locally(question)
+    if lesson is not None:
+        return _canonical(lesson)
+    resumed = _resume(question)
+    if resumed is not None:
+        return resumed
+    t0 = time.perf_counter()
+    lesson = ask_llm_lesson(question)
+    SOLVER_STATS.record_llm(time.perf_counter() - t0)
+    return _checkpoint(question, _canonical(lesson))
+
+
+async def generate_lesson_async(question: str) -> CompactLesson:
+    lesson = _solve_locally(question)
+    if lesson is not None:
+        return _canonical(lesson)
+    resumed = _resume(question)
+    if resumed is not None:
+        return resumed
+    t0 = time.perf_counter()
+    lesson = await ask_llm_lesson_async(question)
+    SOLVER_STATS.record_llm(time.perf_counter() - t0)
+    return _checkpoint(question, _canonical(lesson))
+
+
+def write_lesson_json(lesson: CompactLesson, video_id: str) -> Path:
+    """Saves the lesson where LessonScene can read it."""
+    json_path = BUILD_DIR / f"lesson_{video_id}.json"
+    with open(json_path, "w") as f:
+        json.dump(lesson.to_dict(), f, indent=2)
+    return json_path
+
+
+def rendered_stills(mp4_path: Path) -> dict:
+    """Poster/preview LessonScene wrote next to the video, by cache suffix."""
+    return {
+        STILL_SUFFIXES[kind]: path for kind, path in still_paths(mp4_path).items() if path.exists()
+    }
+
+
+def _render_rung(json_path: Path, **options) -> Path:
+    """Renders an HLS rung, taking a slot like any other render."""
+    with RENDER_SLOTS:
+        return compile_manim(json_path, **options)
+
+
+def _package_hls(lesson: CompactLesson, video: Path, profile, key: str, video_id: str) -> None:
+    """
+    Adds the HLS ladder to a fresh render, in the background. Until the
+    package is published its URLs return 404 and only the MP4 plays; the MP4
+    alone stays if this fails.
+    """
+    artifacts = RenderArtifacts(f"{video_id}_hls")
+    try:
+        json_path = artifacts.add(write_lesson_json(lesson, f"{video_id}_hls"))
+        package_hls(json_path, video, profile, RENDER_CACHE.sidecar_path(key, HLS_SUFFIX),
+                    artifacts.media_dir, render=_render_rung)
+    except Exception as e:
+        print(f"HLS packaging failed for {key}: {e}")
+    finally:
+        artifacts.cleanup()
+
+
+async def _package_hls_async(lesson: CompactLesson, video: Path, profile, key: str, video_id: str,
+                             render_slots) -> None:
+    async def render_rung(json_path: Path, **options) -> Path:
+        async with render_slots or nullcontext():
+            return await compile_manim_async(json_path, **options)
+
+    artifacts = RenderArtifacts(f"{video_id}_hls")
+    try:
+        json_path = artifacts.add(write_lesson_json(lesson, f"{video_id}_hls"))
+        await package_hls_async(json_path, video, profile, RENDER_CACHE.sidecar_path(key, HLS_SUFFIX),
+                                artifacts.media_dir, render=render_rung)
+    except Exception as e:
+        print(f"HLS packaging failed for {key}: {e}")
+    finally:
+        await asyncio.to_thread(artifacts.cleanup)
+
+
+def _schedule_hls_async(*args) -> None:
+    task = asyncio.create_task(_package_hls_async(*args))
+    # The loop only keeps weak references to tasks
+    _HLS_TASKS.add(task)
+    task.add_done_callback(_HLS_TASKS.discard)
+
+
+def _preflight(lesson: CompactLesson, warm: bool, strict: bool = True) -> None:
+    """
+    Raises RenderFailure for every string that doesn't compile, before
+    anything renders. Not `strict` (no repair left), it only warns: Manim
+    tolerates some LaTeX the check rejects, e.g. in labels. With `warm`, a
+    lesson that passes has its SVGs compiled in the background while the
+    render starts.
+    """
+    if PREFLIGHT is not None:
+        reports = check_lesson(PREFLIGHT, lesson)
+        if reports and strict:
+            raise RenderFailure(f"LaTeX doesn't compile: {reports[0]['latex']}", "preflight", reports)
+        if reports:
+            print(f"Pre-flight rejected {len(reports)} string(s), rendering anyway: {reports[0]['latex']}")
+            return
+    if warm and TEX_WARMER is not None:
+        TEX_WARMER.warm(lesson)
+
+
+def _checkpointed(question) -> bool:
+    return question is not None and RENDER_CHECKPOINTS
+
+
+def _lenient(failure: RenderFailure) -> bool:
+    """
+    True for a pre-flight rejection with no repair left: the render goes to
+    Manim anyway, as it did before the check, and only fails if Manim does.
+    """
+    return failure.category == "preflight"
+
+
+def _job_failed(question) -> None:
+    """Counts the failure against the checkpoint the job resumed (or wrote)."""
+    if _checkpointed(question):
+        CHECKPOINTS.record_failure(question)
+
+
+def _count_reused(on_progress):
+    """Wraps a progress callback to count the animations Manim took from its cache."""
+    def wrapped(progress):
+        if progress.get("cached"):
+            RECOVERY_STATS.record_cached(progress.get("seconds", 0.0))
+        if on_progress:
+            on_progress(progress)
+    return wrapped
+
+
+def _render_once(lesson: CompactLesson, video_id: str, on_progress, question, strict=True) -> Path:
+    profile = choose_render_profile(lesson, RENDER_QUALITY)
+    key = cache_key(lesson.fingerprint, profile.tag)
+    cached = RENDER_CACHE.get(key)
+    if cached:
+        return cached
+
+    with RENDER_CACHE.key_lock(key):
+        # Someone else may have rendered it while we waited
+        cached = RENDER_CACHE.lookup(key)
+        if cached:
+            return cached
+        # Farm workers have TeX caches of their own
+        _preflight(lesson, warm=not FARM, strict=strict)
+        if FARM:
+            # The coordinator stores the video and enforces the quota
+            return FARM.render(key, lesson, profile, on_progress)
+        checkpointed = _checkpointed(question)
+        # A checkpointed render reuses the question's media dir (and its animation cache)
+        media = CHECKPOINTS.using_media_dir(question) if checkpointed else nullcontext()
+        with media as media_dir:
+            artifacts = RenderArtifacts(video_id, media_dir)
+            rendered = False
+            try:
+                json_path = artifacts.add(write_lesson_json(lesson, video_id))
+                with RENDER_SLOTS:
+                    mp4_path = compile_manim(
+                        json_path, quality=profile.quality, fps=profile.fps,
+                        out_name=f"lesson_{video_id}", on_progress=on_progress,
+                        media_dir=artifacts.media_dir, caching=checkpointed,
+                    )
+                video = RENDER_CACHE.put(key, mp4_path, rendered_stills(mp4_path))
+                rendered = True
+            finally:
+                # A failed checkpointed render keeps its animation cache for the retry
+                artifacts.cleanup(keep_media=checkpointed and not rendered)
+    RENDER_CACHE.enforce_quota(keep=[key])
+    if HLS_PACKAGING:
+        _HLS_EXECUTOR.submit(_package_hls, lesson, video, profile, key, video_id)
+    return video
+
+
+def render_lesson(lesson: CompactLesson, video_id: str, on_progress=None, question=None, on_repair=None) -> Path:
+    """
+    Returns the cached video for the lesson, rendering it on a miss. When
+    LaTeX in the lesson doesn't compile, only the broken strings are sent
+    back to the LLM and the fixed lesson is rendered again; `on_repair(lesson,
+    failure)` sees each fix. With `question`, the render reuses the animations
+    of the question's failed renders and clears its checkpoint when done.
+    """
+    on_progress = _count_reused(on_progress)
+    strict, repaired = True, False
+    for attempt in itertools.count():
+        try:
+            video = _render_once(lesson, video_id, on_progress, question, strict)
+            break
+        except RenderFailure as failure:
+            RECOVERY_STATS.record_failure(failure.category)
+            if attempt >= RENDER_REPAIRS or not repairable(failure):
+                if _lenient(failure):
+                    strict = False
+                    continue
+                _job_failed(question)
+                raise
+            try:
+                lesson = repair_lesson(lesson, failure, question)
+            except Exception as e:
+                print(f"Repair failed: {e}")
+                if _lenient(failure):
+                    strict = False
+                    continue
+                _job_failed(question)
+                raise failure
+            repaired = True
+            if _checkpointed(question):
+                CHECKPOINTS.save(question, lesson, "repaired")
+            if on_repair:
+                on_repair(lesson, failure)
+    if repaired:
+        RECOVERY_STATS.record_repaired_render()
+    if _checkpointed(question):
+        CHECKPOINTS.discard(question)
+    return video
+
+
+async def _render_once_async(lesson: CompactLesson, video_id: str, on_progress, question, render_slots,
+                             strict=True) -> Path:
+    profile = choose_render_profile(lesson, RENDER_QUALITY)
+    key = cache_key(lesson.fingerprint, profile.tag)
+    cached = RENDER_CACHE.get(key)
+    if cached:
+        return cached
+
+    async with RENDER_CACHE.async_key_lock(key):
+        cached = RENDER_CACHE.lookup(key)
+        if cached:
+            return cached
+        await asyncio.to_thread(_preflight, lesson, not FARM, strict)
+        if FARM:
+            return await asyncio.to_thread(FARM.render, key, lesson, profile, on_progress)
+        checkpointed = _checkpointed(question)
+        media = CHECKPOINTS.using_media_dir_async(question) if checkpointed else nullcontext()
+        async with media as media_dir:
+            artifacts = RenderArtifacts(video_id, media_dir)
+            rendered = False
+            try:
+                json_path = artifacts.add(write_lesson_json(lesson, video_id))
+                async with render_slots or nullcontext():
+                    mp4_path = await compile_manim_async(
+                        json_path, quality=profile.quality, fps=profile.fps,
+                        out_name=f"lesson_{video_id}", on_progress=on_progress,
+                        media_dir=artifacts.media_dir, caching=checkpointed,
+                    )
+                video = RENDER_CACHE.put(key, mp4_path, rendered_stills(mp4_path))
+                rendered = True
+            finally:
+                await asyncio.to_thread(artifacts.cleanup, checkpointed and not rendered)
+    await asyncio.to_thread(RENDER_CACHE.enforce_quota, [key])
+    if HLS_PACKAGING:
+        _schedule_hls_async(lesson, video, profile, key, video_id, render_slots)
+    return video
+
+
+async def render_lesson_async(lesson: CompactLesson, video_id: str, on_progress=None, render_slots=None,
+                              question=None, on_repair=None) -> Path:
+    """Async `render_lesson`; `render_slots` (a semaphore) bounds concurrent renders on a miss."""
+    on_progress = _count_reused(on_progress)
+    strict, repaired = True, False
+    for attempt in itertools.count():
+        try:
+            video = await _render_once_async(lesson, video_id, on_progress, question, render_slots, strict)
+            break
+        except RenderFailure as failure:
+            RECOVERY_STATS.record_failure(failure.category)
+            if attempt >= RENDER_REPAIRS or not repairable(failure):
+                if _lenient(failure):
+                    strict = False
+                    continue
+                _job_failed(question)
+                raise
+            try:
+                lesson = await repair_lesson_async(lesson, failure, question)
+            except Exception as e:
+                print(f"Repair failed: {e}")
+                if _lenient(failure):
+                    strict = False
+                    continue
+                _job_failed(question)
+                raise failure
+            repaired = True
+            if _checkpointed(question):
+                await asyncio.to_thread(CHECKPOINTS.save, question, lesson, "repaired")
+            if on_repair:
+                on_repair(lesson, failure)
+    if repaired:
+        RECOVERY_STATS.record_repaired_render()
+    if _checkpointed(question):
+        await asyncio.to_thread(CHECKPOINTS.discard, question)
+    return video
+
+
+def metrics() -> dict:
+    avg_llm_ms = SOLVER_STATS.summary()["avg_llm_ms"]
+    return {
+        "dedup": DEDUP_STATS.summary(),
+        "render_cache": RENDER_CACHE.stats(),
+        "llm": llm_stats(),
+        "local_solver": SOLVER_STATS.summary(),
+        "disk": disk_usage(),
+        "render_farm": FARM.stats() if FARM else None,
+        "hls": HLS_STATS.summary(),
+        "tex_preflight": PREFLIGHT_STATS.summary(),
+        "recovery": RECOVERY_STATS.summary(avg_llm_ms / 1000 if avg_llm_ms is not None else None),
+    }
+
+
+def record_video_access(filename: str) -> None:
+    """Feeds /get_video hits into the render cache's LRU eviction."""
+    RENDER_CACHE.record_access(filename)
+
+
+def _job_result(mp4_path: Path) -> dict:
+    result = {
+        "filename": mp4_path.name,
+        "video_url": f"/get_video/{mp4_path.name}",
+    }
+    for kind, path in still_paths(mp4_path).items():
+        if path.exists():
+            result[f"{kind}_url"] = f"/get_video/{mp4_path.name}/{kind}"
+    # A fresh render's package is still being built; its URL returns 404 until then
+    if (HLS_PACKAGING and not FARM) or (mp4_path.with_suffix(HLS_SUFFIX) / MASTER_PLAYLIST).exists():
+        result["hls_url"] = f"/get_video/{mp4_path.name}/hls/{MASTER_PLAYLIST}"
+    return result
+
+
+def _repaired_event(job):
+    """`on_repair` callback that tells the job's clients about the fixed lesson."""
+    def on_repair(lesson: CompactLesson, failure: RenderFailure) -> None:
+        job.emit("lesson_repaired", {
+            "lesson": lesson.to_dict(),
+            "repaired": [{"field": r["field"], "index": r.get("index")} for r in failure.reports],
+        })
+    return on_repair
+
+
+def run_job(job) -> None:
+    """Runs the full lesson pipeline for a job, emitting progress events."""
+    try:
+        job.emit("llm_started", {"question": job.question})
+        lesson = generate_lesson(job.question)
+        job.emit("lesson_validated", {"lesson": lesson.to_dict()})
+
+        profile = choose_render_profile(lesson, RENDER_QUALITY)
+        job.emit("render_started", {"resolution": f"{profile.height}p", "fps": profile.fps})
+        mp4_path = render_lesson(
+            lesson, job.id,
+            on_progress=lambda progress: job.emit("render_progress", progress),
+            question=job.question, on_repair=_repaired_event(job),
+        )
+        job.emit("encode_done", {"filename": mp4_path.name, "size": mp4_path.stat().st_size})
+        job.emit("done", _job_result(mp4_path))
+    except Exception as e:
+        job.emit("failed", {"error": str(e)})
+
+
+async def run_job_async(job, render_slots=None) -> None:
+    """Async variant of `run_job`; `render_slots` optionally bounds concurrent renders."""
+    try:
+        job.emit("llm_started", {"question": job.question})
+        lesson = await generate_lesson_async(job.question)
+        job.emit("lesson_validated", {"lesson": lesson.to_dict()})
+
+        profile = choose_render_profile(lesson, RENDER_QUALITY)
+        job.emit("render_started", {"resolution": f"{profile.height}p", "fps": profile.fps})
+        mp4_path = await render_lesson_async(
+            lesson, job.id,
+            on_progress=lambda progress: job.emit("render_progress", progress),
+            render_slots=render_slots, question=job.question, on_repair=_repaired_event(job),
+        )
+        job.emit("encode_done", {"filename": mp4_path.name, "size": mp4_path.stat().st_size})
+        job.emit("done", _job_result(mp4_path))
+    except Exception as e:
+        job.emit("failed", {"error": str(e)})
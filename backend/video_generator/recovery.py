@@ -0,0 +1,280 @@
+# recovery.py
+"""
+Checkpoints and partial-failure recovery for lesson jobs.
+
+A job goes question -> LLM -> validated lesson -> Manim render. Each stage
+keeps its output, so a failed job doesn't start over:
+
+- The validated lesson is checkpointed per question until its video exists.
+  Asking the same question after a failed job resumes from that lesson
+  without calling the LLM.
+- TeX output is shared by all renders in TEX_DIR, so strings that compiled
+  once don't compile again.
+- Renders of a checkpointed lesson run with Manim's per-animation cache in a
+  media directory per question. The directory is kept when the render
+  fails, so a retry only renders the animations that changed.
+
+When a string doesn't compile, the pre-flight check (tex_preflight.py) or
+LessonScene reports which one (RenderFailure.reports). `repair_lesson` sends only that string
+and its TeX error to the LLM and swaps in the fix. The pipeline then renders
+again, up to RENDER_REPAIRS times per job.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from lesson_canon import canonicalize_lesson
+from lesson_compact import CompactLesson
+from lesson_schema import Lesson
+from llm_client import repair_latex, repair_latex_async
+from manim_runner import BUILD_DIR, RENDERS_DIR, RenderFailure
+
+# Set RENDER_CHECKPOINTS=0 to start every job from scratch
+RENDER_CHECKPOINTS = os.getenv("RENDER_CHECKPOINTS", "1") != "0"
+# Targeted repairs (and re-renders) per job before it fails
+RENDER_REPAIRS = int(os.getenv("RENDER_REPAIRS", "2"))
+CHECKPOINT_DIR = BUILD_DIR / "checkpoints"
+# A checkpoint that this many resumed jobs failed on is dropped; the next job starts fresh
+MAX_RESUMES = 3
+# Failure categories a changed lesson can fix
+REPAIRABLE = {"tex", "preflight"}
+# Lesson fields whose LaTeX a repair can replace
+REPAIRABLE_FIELDS = ("title", "steps", "function_plots", "geometric_shapes")
+
+
+def checkpoint_id(question: str) -> str:
+    normalized = " ".join(question.lower().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:24]
+
+
+class CheckpointStore:
+    """Validated lessons of unfinished jobs, one JSON file per question."""
+
+    def __init__(self, root: Path = CHECKPOINT_DIR):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # checkpoint id -> [lock, users], dropped when the last user is done
+        self._media_locks: Dict[str, list] = {}
+        self._async_media_locks: Dict[str, list] = {}
+
+    def _path(self, question: str) -> Path:
+        return self.root / f"{checkpoint_id(question)}.json"
+
+    def media_dir(self, question: str) -> Path:
+        """Manim media dir of the question's renders; its animation cache survives failures."""
+        return RENDERS_DIR / f"checkpoint_{checkpoint_id(question)}"
+
+    @contextmanager
+    def using_media_dir(self, question: str):
+        """
+        Holds the question's media dir for one render. Jobs for one question can
+        render different lessons (two LLM answers, or a repaired one), which the
+        render cache's key lock doesn't serialize, so they take turns here.
+        """
+        cid = checkpoint_id(question)
+        with self._lock:
+            entry = self._media_locks.setdefault(cid, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield self.media_dir(question)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._media_locks[cid]
+
+    @asynccontextmanager
+    async def using_media_dir_async(self, question: str):
+        cid = checkpoint_id(question)
+        # Only touched from the event loop thread
+        entry = self._async_media_locks.setdefault(cid, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield self.media_dir(question)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._async_media_locks[cid]
+
+    def _read(self, path: Path) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path: Path, data: Dict[str, Any]) -> None:
+        tmp = path.with_name(f".{path.name}.{threading.get_ident()}")
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def load(self, question: str) -> Optional[CompactLesson]:
+        """The checkpointed lesson; None if there is none, or too many jobs failed on it."""
+        path = self._path(question)
+        with self._lock:
+            data = self._read(path)
+            if data is None:
+                return None
+            # The first failure is the job that wrote the checkpoint
+            if data.get("failures", 0) > MAX_RESUMES:
+                path.unlink(missing_ok=True)
+                return None
+        # Written by `save` from a lesson that was validated and canonicalized
+        return CompactLesson.from_dict(data["lesson"])
+
+    def record_failure(self, question: str) -> None:
+        """Counts a job that failed to render the checkpointed lesson."""
+        path = self._path(question)
+        with self._lock:
+            data = self._read(path)
+            if data is not None:
+                data["failures"] = data.get("failures", 0) + 1
+                self._write(path, data)
+
+    def save(self, question: str, lesson: CompactLesson, stage: str) -> None:
+        path = self._path(question)
+        with self._lock:
+            previous = self._read(path) or {}
+            self._write(path, {
+                "question": question,
+                "stage": stage,
+                "lesson": lesson.to_dict(),
+                "failures": previous.get("failures", 0),
+                "saved_at": time.time(),
+            })
+
+    def discard(self, question: str) -> None:
+        with self._lock:
+            self._path(question).unlink(missing_ok=True)
+
+
+class RecoveryStats:
+    """Render failures by category, repairs, and what resuming saved."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.failures: Dict[str, int] = {}
+        self.repair_requests = 0
+        self.repair_errors = 0
+        self.repair_seconds = 0.0
+        self.repaired_renders = 0
+        self.resumed = 0
+        self.cached_animations = 0
+        self.cached_seconds = 0.0
+
+    def record_failure(self, category: str) -> None:
+        with self._lock:
+            self.failures[category] = self.failures.get(category, 0) + 1
+
+    def record_repair(self, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self.repair_requests += 1
+            self.repair_seconds += seconds
+            if not ok:
+                self.repair_errors += 1
+
+    def record_repaired_render(self) -> None:
+        with self._lock:
+            self.repaired_renders += 1
+
+    def record_resume(self) -> None:
+        with self._lock:
+            self.resumed += 1
+
+    def record_cached(self, seconds: float) -> None:
+        with self._lock:
+            self.cached_animations += 1
+            self.cached_seconds += seconds
+
+    def summary(self, avg_llm_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """`avg_llm_seconds` (a full lesson request) prices the LLM calls saved."""
+        with self._lock:
+            avg_repair = self.repair_seconds / self.repair_requests if self.repair_requests else 0.0
+            saved = None
+            if avg_llm_seconds is not None:
+                # A resumed job skips the lesson request; a repaired render replaces
+                # the failed job's retry (a new lesson request) with small repair requests
+                saved = self.resumed * avg_llm_seconds + max(
+                    0.0, self.repaired_renders * avg_llm_seconds - self.repair_seconds)
+            return {
+                "enabled": RENDER_CHECKPOINTS,
+                "failures": dict(self.failures),
+                "repair_requests": self.repair_requests,
+                "repair_errors": self.repair_errors,
+                "avg_repair_seconds": avg_repair,
+                "repaired_renders": self.repaired_renders,
+                "resumed_from_checkpoint": self.resumed,
+                "llm_seconds_saved": saved,
+                "reused_animations": self.cached_animations,
+                "reused_video_seconds": self.cached_seconds,
+            }
+
+
+RECOVERY_STATS = RecoveryStats()
+
+
+def repairable(failure: Exception) -> bool:
+    """True if the render failed on strings the LLM can rewrite."""
+    return (
+        isinstance(failure, RenderFailure)
+        and failure.category in REPAIRABLE
+        and bool(failure.reports)
+        and all(r.get("field") in REPAIRABLE_FIELDS and "latex" in r for r in failure.reports)
+    )
+
+
+def _apply_fixes(lesson: CompactLesson, fixes) -> CompactLesson:
+    data = lesson.to_dict()
+    for report, fix in fixes:
+        if report["field"] == "title":
+            data["title"] = fix
+        elif report["field"] == "steps":
+            data["steps"][report["index"]] = fix
+        else:
+            data[report["field"]][report["index"]]["label"] = fix
+    # The fixed strings come from the LLM, so this is a new entry point: validate again
+    return canonicalize_lesson(Lesson.model_validate(data))
+
+
+def repair_lesson(lesson: CompactLesson, failure: RenderFailure, question: Optional[str] = None) -> CompactLesson:
+    """The lesson with every string `failure` reported replaced by the LLM's fix."""
+    data = lesson.to_dict()
+    fixes = []
+    for report in failure.reports:
+        t0 = time.perf_counter()
+        try:
+            fix = repair_latex(data, report["field"], report.get("index"), report["latex"],
+                               report.get("error", ""), question)
+        except Exception:
+            RECOVERY_STATS.record_repair(time.perf_counter() - t0, ok=False)
+            raise
+        RECOVERY_STATS.record_repair(time.perf_counter() - t0, ok=True)
+        fixes.append((report, fix))
+    return _apply_fixes(lesson, fixes)
+
+
+async def repair_lesson_async(lesson: CompactLesson, failure: RenderFailure,
+                              question: Optional[str] = None) -> CompactLesson:
+    data = lesson.to_dict()
+    fixes = []
+    for report in failure.reports:
+        t0 = time.perf_counter()
+        try:
+            fix = await repair_latex_async(data, report["field"], report.get("index"), report["latex"],
+                                           report.get("error", ""), question)
+        except Exception:
+            RECOVERY_STATS.record_repair(time.perf_counter() - t0, ok=False)
+            raise
+        RECOVERY_STATS.record_repair(time.perf_counter() - t0, ok=True)
+        fixes.append((report, fix))
+    return _apply_fixes(lesson, fixes)
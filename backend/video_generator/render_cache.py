@@ -0,0 +1,219 @@
+# render_cache.py
+import asyncio
+import os
+import shutil
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from manim_runner import MEDIA_DIR
+
+# Finished videos, named by the lesson fingerprint and render quality
+VIDEO_CACHE_DIR = MEDIA_DIR / "cache"
+# Byte quota of the cache; the least recently watched videos are evicted past it (0 = no limit)
+VIDEO_CACHE_QUOTA = int(float(os.getenv("VIDEO_CACHE_QUOTA_MB", "2048")) * 1024 * 1024)
+# Accesses within this many seconds of the last recorded one don't touch the file again
+ACCESS_RESOLUTION = 60.0
+
+
+def cache_key(fingerprint: str, quality: str) -> str:
+    return f"{fingerprint}_{quality}"
+
+
+class RenderCache:
+    """
+    Content-addressed store of rendered videos. Renders of the same key are
+    serialized so concurrent duplicate requests render once.
+
+    Last access times live in the files' atime (set explicitly by
+    `record_access`), so they survive restarts and are shared by every
+    worker process using the same directory.
+    """
+
+    def __init__(self, root: Path = VIDEO_CACHE_DIR, quota_bytes: int = VIDEO_CACHE_QUOTA):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.quota_bytes = quota_bytes
+        self.hits = 0
+        self.misses = 0
+        self.accesses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        # key -> [lock, holders and waiters]
+        self._key_locks: Dict[str, list] = {}
+        self._async_key_locks: Dict[str, list] = {}
+
+    def path_for(self, key: str) -> Path:
+        return self.root / f"{key}.mp4"
+
+    def lookup(self, key: str) -> Optional[Path]:
+        path = self.path_for(key)
+        return path if path.exists() else None
+
+    def get(self, key: str) -> Optional[Path]:
+        """Like `lookup`, but counted in the hit/miss stats."""
+        path = self.lookup(key)
+        found = path is not None
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return path
+
+    def sidecar_path(self, key: str, suffix: str) -> Path:
+        """A file stored with the video, e.g. its poster (`suffix` ".poster.jpg")."""
+        return self.root / f"{key}{suffix}"
+
+    def _move(self, src: Path, dest: Path) -> None:
+        tmp = dest.with_name(f".{dest.name}.{threading.get_ident()}")
+        try:
+            os.replace(src, tmp)
+        except OSError:
+            # Different filesystem
+            shutil.copyfile(src, tmp)
+            os.remove(src)
+        os.replace(tmp, dest)
+
+    def put(self, key: str, video_path: Path, sidecars: Optional[Dict[str, Path]] = None) -> Path:
+        """
+        Moves a freshly rendered video into the cache, with its sidecar files
+        by suffix. The video goes last, so once it is visible so are they.
+        """
+        for suffix, path in (sidecars or {}).items():
+            self._move(path, self.sidecar_path(key, suffix))
+        dest = self.path_for(key)
+        self._move(video_path, dest)
+        return dest
+
+    def record_access(self, filename: str) -> None:
+        """
+        Marks a cached video as watched (called by /get_video). `filename`
+        may also be a file inside a sidecar directory, e.g. "<key>.hls/master.m3u8".
+        """
+        path = self.root / filename
+        try:
+            st = path.stat()
+        except OSError:
+            return
+        with self._lock:
+            self.accesses += 1
+        now = time.time()
+        if now - st.st_atime >= ACCESS_RESOLUTION:
+            try:
+                # Keep mtime, it backs Last-Modified/ETag of the response
+                os.utime(path, (now, st.st_mtime))
+            except OSError:
+                pass
+
+    def _entries(self) -> List[tuple]:
+        """
+        (last access, size, key, paths) of every cached video, sidecars
+        included. Sidecar directories (the HLS package) count with all their
+        files; the directory's own atime is bumped by listing it, so it is ignored.
+        """
+        groups: Dict[str, list] = {}
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    if entry.is_dir():
+                        stats = [f.stat() for f in os.scandir(entry.path) if f.is_file()]
+                    elif entry.is_file():
+                        stats = [entry.stat()]
+                    else:
+                        continue
+                except OSError:
+                    continue
+                group = groups.setdefault(entry.name.split(".", 1)[0], [0.0, 0, []])
+                for st in stats:
+                    group[0] = max(group[0], st.st_atime, st.st_mtime)
+                    group[1] += st.st_size
+                group[2].append(Path(entry.path))
+        return [(last, size, key, paths) for key, (last, size, paths) in groups.items()]
+
+    def enforce_quota(self, keep: Iterable[str] = ()) -> List[str]:
+        """
+        Evicts the least recently accessed videos (with their sidecars) until
+        the cache fits its quota. Keys in `keep` (e.g. the video just
+        rendered) are never evicted. Returns the evicted keys.
+        """
+        if not self.quota_bytes:
+            return []
+        keep = set(keep)
+        evicted = []
+        with self._evict_lock:
+            entries = self._entries()
+            total = sum(size for _, size, _, _ in entries)
+            for _, size, key, paths in sorted(entries):
+                if total <= self.quota_bytes:
+                    break
+                if key in keep:
+                    continue
+                # The video first, so a half-evicted entry is a miss
+                for path in sorted(paths, key=lambda p: p.suffix != ".mp4"):
+                    try:
+                        if path.is_dir():
+                            shutil.rmtree(path)
+                        else:
+                            path.unlink()
+                    except OSError:
+                        pass
+                total -= size
+                evicted.append(key)
+                with self._lock:
+                    self.evictions += 1
+                    self.evicted_bytes += size
+        if evicted:
+            print(f"Render cache over quota, evicted {len(evicted)} videos")
+        return evicted
+
+    @contextmanager
+    def key_lock(self, key: str):
+        """
+        Holds the key for one render. The lock is dropped once nobody holds or
+        waits for it, so a late request can't get a second lock while a waiter
+        still has the first.
+        """
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    @asynccontextmanager
+    async def async_key_lock(self, key: str):
+        # Only touched from the event loop thread
+        entry = self._async_key_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._async_key_locks[key]
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "accesses": self.accesses,
+                "quota_bytes": self.quota_bytes,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+            }
@@ -0,0 +1,681 @@
+# render_farm.py
+"""
+Render stage spread over several machines: one coordinator, many workers.
+
+The coordinator keeps the render queue and the video store. Workers pull
+jobs over plain HTTP/JSON, render with Manim and upload the MP4, which the
+coordinator moves into its RenderCache. Jobs are assigned by consistent
+hashing of the lesson fingerprint, so re-renders of a lesson (other
+qualities, evicted videos) land on the node whose TeX cache already has its
+labels, and whose animation cache has its animations at that quality. An
+idle worker takes the oldest job of a busy node once that job has waited
+STEAL_AFTER seconds, so affinity never leaves workers idle for long.
+
+Workers send a heartbeat every HEARTBEAT_INTERVAL seconds. When one misses
+them for HEARTBEAT_TIMEOUT, it leaves the hash ring and its jobs are
+requeued; a job that killed MAX_ATTEMPTS workers fails.
+
+    python video_generator/render_farm.py coordinator [--port 8765] [--storage DIR]
+    python video_generator/render_farm.py worker --coordinator http://host:8765
+
+The backend sends renders to the coordinator when CLULUS_COORDINATOR_URL is
+set. It reads finished videos from its own render cache directory, so the
+coordinator's storage must be that directory (or a shared mount of it).
+
+Protocol (JSON bodies):
+    POST /workers/heartbeat   {"worker"}                      register / keep alive
+    POST /jobs                {"key", "fingerprint", "lesson", "quality", "fps"} -> {"job_id"}
+    GET  /jobs/<id>?since=n&wait=s                            status + progress after n
+    POST /jobs/pull           {"worker", "wait"}              -> job, or 204 if none
+    POST /jobs/<id>/progress  {"worker", "progress"}
+    PUT  /jobs/<id>/result?worker=w[&suffix=.poster.jpg]      MP4 bytes (or a still, sent first)
+    POST /jobs/<id>/fail      {"worker", "error", "failure"}  failure: RenderFailure category/reports
+    GET  /stats
+"""
+import bisect
+import hashlib
+import json
+import os
+import re
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qs, quote, urlparse
+
+from manim_runner import BUILD_DIR, RENDERS_DIR, RenderFailure, compile_manim
+from render_cache import VIDEO_CACHE_DIR, RenderCache
+from retention import RenderArtifacts
+from stills import STILL_SUFFIXES, still_paths
+
+COORDINATOR_URL = os.getenv("CLULUS_COORDINATOR_URL")
+HEARTBEAT_INTERVAL = float(os.getenv("RENDER_FARM_HEARTBEAT", "2.0"))
+HEARTBEAT_TIMEOUT = float(os.getenv("RENDER_FARM_HEARTBEAT_TIMEOUT", "10.0"))
+MAX_ATTEMPTS = 3
+STEAL_AFTER = float(os.getenv("RENDER_FARM_STEAL_AFTER", "5.0"))
+# Virtual nodes per worker on the hash ring
+RING_REPLICAS = 64
+# Long-poll timeouts, in seconds
+PULL_WAIT = 10.0
+STATUS_WAIT = 15.0
+# Finished jobs are forgotten after this many seconds
+JOB_TTL_SECONDS = 3600
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring; adding or removing a node only moves that node's keys."""
+
+    def __init__(self, replicas: int = RING_REPLICAS):
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: Dict[int, str] = {}
+
+    def add(self, node: str) -> None:
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            if point not in self._owners:
+                bisect.insort(self._points, point)
+                self._owners[point] = node
+
+    def remove(self, node: str) -> None:
+        self._points = [p for p in self._points if self._owners[p] != node]
+        self._owners = {p: n for p, n in self._owners.items() if n != node}
+
+    def node_for(self, key: str) -> Optional[str]:
+        if not self._points:
+            return None
+        i = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[i]]
+
+    def __len__(self) -> int:
+        return len(set(self._owners.values()))
+
+
+class FarmJob:
+    def __init__(self, key: str, fingerprint: str, lesson: Dict[str, Any], quality: str, fps: Optional[int]):
+        self.id = str(uuid.uuid4())
+        self.key = key
+        self.fingerprint = fingerprint
+        self.lesson = lesson
+        self.quality = quality
+        self.fps = fps
+        self.status = "queued"
+        self.worker: Optional[str] = None
+        self.attempts = 0
+        self.progress: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+        # Category and reports of a RenderFailure, so the backend can repair the lesson
+        self.failure: Optional[Dict[str, Any]] = None
+        self.filename: Optional[str] = None
+        # Stills uploaded ahead of the video, by cache suffix
+        self.sidecars: Dict[str, Path] = {}
+        self.created_at = time.time()
+        self.queued_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def assignment(self) -> Dict[str, Any]:
+        """What a worker needs to render the job."""
+        return {
+            "job_id": self.id, "key": self.key, "fingerprint": self.fingerprint,
+            "lesson": self.lesson, "quality": self.quality, "fps": self.fps,
+        }
+
+    def to_dict(self, since: int = 0) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "key": self.key,
+            "status": self.status,
+            "worker": self.worker,
+            "attempts": self.attempts,
+            "progress": self.progress[since:],
+            "progress_count": len(self.progress),
+            "filename": self.filename,
+            "error": self.error,
+            "failure": self.failure,
+        }
+
+
+class Coordinator:
+    """Render queue, worker membership and the shared video store."""
+
+    def __init__(self, storage: Path = VIDEO_CACHE_DIR, heartbeat_timeout: float = HEARTBEAT_TIMEOUT,
+                 steal_after: Optional[float] = STEAL_AFTER):
+        self.cache = RenderCache(storage)
+        self.heartbeat_timeout = heartbeat_timeout
+        # Told to workers; leaves room for a few lost heartbeats
+        self.heartbeat_interval = min(HEARTBEAT_INTERVAL, heartbeat_timeout / 4)
+        self.steal_after = steal_after  # None = never
+        self.ring = HashRing()
+        self.workers: Dict[str, Dict[str, Any]] = {}
+        self.jobs: Dict[str, FarmJob] = {}
+        self._queue = deque()  # job ids in submit order
+        self._active: Dict[str, str] = {}  # key -> job id of the unfinished job
+        self._cond = threading.Condition()
+        self.requeued = 0
+        self.stolen = 0
+        self.dead_workers = 0
+
+    # --- Workers ---
+
+    def heartbeat(self, worker: str) -> None:
+        with self._cond:
+            info = self.workers.get(worker)
+            if info is None:
+                print(f"Render worker joined: {worker}")
+                self.workers[worker] = info = {"completed": 0, "failed": 0, "running": None}
+                self.ring.add(worker)
+                self._cond.notify_all()
+            info["last_seen"] = time.monotonic()
+
+    def reap(self) -> List[str]:
+        """Drops workers that missed their heartbeats and requeues their jobs."""
+        now = time.monotonic()
+        with self._cond:
+            dead = [w for w, info in self.workers.items() if now - info["last_seen"] > self.heartbeat_timeout]
+            for worker in dead:
+                print(f"Render worker lost: {worker}")
+                del self.workers[worker]
+                self.ring.remove(worker)
+                self.dead_workers += 1
+            for job in self.jobs.values() if dead else ():
+                if job.status == "running" and job.worker in dead:
+                    if job.attempts >= MAX_ATTEMPTS:
+                        self._finish(job, error=f"Render worker died {job.attempts} times on this job")
+                    else:
+                        job.status = "queued"
+                        job.worker = None
+                        self._drop_sidecars(job)
+                        job.queued_at = time.monotonic()
+                        self._queue.appendleft(job.id)
+                        self.requeued += 1
+            if dead:
+                self._cond.notify_all()
+        return dead
+
+    def start_reaper(self) -> threading.Thread:
+        def loop():
+            while True:
+                time.sleep(self.heartbeat_timeout / 4)
+                self.reap()
+                self._prune()
+
+        thread = threading.Thread(target=loop, name="render-farm-reaper", daemon=True)
+        thread.start()
+        return thread
+
+    # --- Jobs ---
+
+    def submit(self, key: str, fingerprint: str, lesson: Dict[str, Any], quality: str,
+               fps: Optional[int] = None) -> FarmJob:
+        """Queues a render; a request for a key that is already queued joins that job."""
+        with self._cond:
+            active = self._active.get(key)
+            if active is not None:
+                return self.jobs[active]
+            job = FarmJob(key, fingerprint, lesson, quality, fps)
+            if self.cache.lookup(key):
+                job.status = "done"
+                job.filename = self.cache.path_for(key).name
+                job.finished_at = time.time()
+            else:
+                self._active[key] = job.id
+                self._queue.append(job.id)
+            self.jobs[job.id] = job
+            self._cond.notify_all()
+            return job
+
+    def _next_for(self, worker: str) -> Optional[FarmJob]:
+        stealable = None
+        cutoff = time.monotonic() - (self.steal_after or 0)
+        for job_id in self._queue:
+            job = self.jobs[job_id]
+            owner = self.ring.node_for(job.fingerprint)
+            if owner == worker:
+                return job
+            if (stealable is None and self.steal_after is not None and job.queued_at <= cutoff
+                    and self.workers.get(owner, {}).get("running")):
+                stealable = job
+        if stealable is not None:
+            self.stolen += 1
+        return stealable
+
+    def pull(self, worker: str, wait: float = PULL_WAIT) -> Optional[FarmJob]:
+        """Hands the worker its next job, waiting up to `wait` seconds for one."""
+        self.heartbeat(worker)
+        deadline = time.monotonic() + wait
+        with self._cond:
+            while True:
+                if worker not in self.workers:
+                    return None
+                job = self._next_for(worker)
+                if job is not None:
+                    self._queue.remove(job.id)
+                    job.status = "running"
+                    job.worker = worker
+                    job.attempts += 1
+                    self.workers[worker]["running"] = job.id
+                    return job
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                # Wake up in time to steal jobs that are about to have waited long enough
+                self._cond.wait(min(remaining, self.steal_after or remaining))
+
+    def _owned(self, job_id: str, worker: str) -> Optional[FarmJob]:
+        """The job if `worker` still holds it (it may have been requeued meanwhile)."""
+        job = self.jobs.get(job_id)
+        if job is None or job.status != "running" or job.worker != worker:
+            return None
+        return job
+
+    def progress(self, job_id: str, worker: str, progress: Dict[str, Any]) -> bool:
+        with self._cond:
+            job = self._owned(job_id, worker)
+            if job is None:
+                return False
+            job.progress.append(progress)
+            self._cond.notify_all()
+        self.heartbeat(worker)
+        return True
+
+    def _finish(self, job: FarmJob, filename: Optional[str] = None, error: Optional[str] = None) -> None:
+        job.status = "failed" if error else "done"
+        job.filename = filename
+        job.error = error
+        job.finished_at = time.time()
+        self._active.pop(job.key, None)
+        info = self.workers.get(job.worker)
+        if info is not None:
+            info["running"] = None
+            info["failed" if error else "completed"] += 1
+        self._cond.notify_all()
+
+    @staticmethod
+    def _drop_sidecars(job: FarmJob) -> None:
+        for path in job.sidecars.values():
+            path.unlink(missing_ok=True)
+        job.sidecars = {}
+
+    def add_sidecar(self, job_id: str, worker: str, suffix: str, upload: Path) -> bool:
+        """Keeps an uploaded still until the job's video arrives."""
+        with self._cond:
+            job = self._owned(job_id, worker)
+            if job is not None:
+                job.sidecars[suffix] = upload
+                return True
+        upload.unlink(missing_ok=True)
+        return False
+
+    def complete(self, job_id: str, worker: str, upload: Path) -> bool:
+        """Moves an uploaded video (and its stills) into the store and finishes the job."""
+        with self._cond:
+            job = self._owned(job_id, worker)
+        if job is None:
+            upload.unlink(missing_ok=True)
+            return False
+        path = self.cache.put(job.key, upload, job.sidecars)
+        job.sidecars = {}
+        self.cache.enforce_quota(keep=[job.key])
+        with self._cond:
+            if self._owned(job_id, worker) is not None:
+                self._finish(job, filename=path.name)
+        return True
+
+    def fail(self, job_id: str, worker: str, error: str, failure: Optional[Dict[str, Any]] = None) -> bool:
+        with self._cond:
+            job = self._owned(job_id, worker)
+            if job is None:
+                return False
+            job.failure = failure
+            self._finish(job, error=error)
+            return True
+
+    def status(self, job_id: str, since: int = 0, wait: float = 0) -> Optional[Dict[str, Any]]:
+        """Job status, waiting up to `wait` seconds for news after progress item `since`."""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            self._cond.wait_for(lambda: job.finished or len(job.progress) > since, wait)
+            return job.to_dict(since)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - JOB_TTL_SECONDS
+        with self._cond:
+            for job_id in [j.id for j in self.jobs.values() if j.finished and j.finished_at < cutoff]:
+                del self.jobs[job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            statuses: Dict[str, int] = {}
+            for job in self.jobs.values():
+                statuses[job.status] = statuses.get(job.status, 0) + 1
+            return {
+                "workers": {
+                    w: {k: v for k, v in info.items() if k != "last_seen"} for w, info in self.workers.items()
+                },
+                "queued": len(self._queue),
+                "jobs": statuses,
+                "requeued": self.requeued,
+                "stolen": self.stolen,
+                "dead_workers": self.dead_workers,
+                "render_cache": self.cache.stats(),
+            }
+
+
+# --- HTTP ---
+
+_JOB_PATH = re.compile(r"^/jobs/([0-9a-f-]+)(?:/(progress|result|fail))?$")
+
+
+def _handler(coordinator: Coordinator):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body: Optional[Dict[str, Any]] = None) -> None:
+            payload = json.dumps(body).encode() if body is not None else b""
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up on a long poll; a job it was handed is requeued by the reaper
+                self.close_connection = True
+
+        def _json(self) -> Dict[str, Any]:
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if url.path == "/stats":
+                return self._send(200, coordinator.stats())
+            match = _JOB_PATH.match(url.path)
+            if match and not match.group(2):
+                status = coordinator.status(
+                    match.group(1),
+                    since=int(query.get("since", ["0"])[0]),
+                    wait=min(float(query.get("wait", ["0"])[0]), STATUS_WAIT),
+                )
+                return self._send(200, status) if status else self._send(404, {"error": "Job not found"})
+            self._send(404, {"error": "Not found"})
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            try:
+                body = self._json()
+            except ValueError:
+                return self._send(400, {"error": "Invalid JSON"})
+
+            if path == "/workers/heartbeat":
+                coordinator.heartbeat(body["worker"])
+                return self._send(200, {"heartbeat_interval": coordinator.heartbeat_interval})
+            if path == "/jobs":
+                job = coordinator.submit(body["key"], body["fingerprint"], body["lesson"],
+                                         body.get("quality", "h"), body.get("fps"))
+                return self._send(202, job.to_dict())
+            if path == "/jobs/pull":
+                job = coordinator.pull(body["worker"], min(float(body.get("wait", PULL_WAIT)), PULL_WAIT))
+                return self._send(200, job.assignment()) if job else self._send(204)
+            match = _JOB_PATH.match(path)
+            if match and match.group(2) == "progress":
+                ok = coordinator.progress(match.group(1), body["worker"], body.get("progress") or {})
+                return self._send(200 if ok else 409, {"ok": ok})
+            if match and match.group(2) == "fail":
+                ok = coordinator.fail(match.group(1), body["worker"], body.get("error") or "Render failed",
+                                      body.get("failure"))
+                return self._send(200 if ok else 409, {"ok": ok})
+            self._send(404, {"error": "Not found"})
+
+        def do_PUT(self):
+            url = urlparse(self.path)
+            match = _JOB_PATH.match(url.path)
+            query = parse_qs(url.query)
+            worker = query.get("worker", [""])[0]
+            suffix = query.get("suffix", [""])[0]
+            if not match or match.group(2) != "result" or not worker:
+                return self._send(404, {"error": "Not found"})
+            if suffix and suffix not in STILL_SUFFIXES.values():
+                return self._send(400, {"error": "Unknown suffix"})
+            # Stream the upload next to the store so the final move is a rename
+            length = int(self.headers.get("Content-Length") or 0)
+            upload = coordinator.cache.root / f".upload.{match.group(1)}.{uuid.uuid4().hex}"
+            with open(upload, "wb") as f:
+                remaining = length
+                while remaining > 0:
+                    chunk = self.rfile.read(min(remaining, 1 << 20))
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            if remaining:
+                upload.unlink(missing_ok=True)
+                return self._send(400, {"error": "Truncated upload"})
+            if suffix:
+                ok = coordinator.add_sidecar(match.group(1), worker, suffix, upload)
+            else:
+                ok = coordinator.complete(match.group(1), worker, upload)
+            self._send(200 if ok else 409, {"ok": ok})
+
+    return Handler
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Every waiting backend request and idle worker holds a long-poll connection
+    request_queue_size = 128
+
+
+def serve_coordinator(port: int = 8765, host: str = "0.0.0.0", storage: Path = VIDEO_CACHE_DIR,
+                      heartbeat_timeout: float = HEARTBEAT_TIMEOUT, steal_after: Optional[float] = STEAL_AFTER):
+    """Starts the coordinator in background threads; returns (coordinator, server)."""
+    coordinator = Coordinator(storage, heartbeat_timeout=heartbeat_timeout, steal_after=steal_after)
+    coordinator.start_reaper()
+    server = _Server((host, port), _handler(coordinator))
+    threading.Thread(target=server.serve_forever, name="render-farm-http", daemon=True).start()
+    return coordinator, server
+
+
+def _request(url: str, method: str = "GET", body: Optional[Dict[str, Any]] = None,
+             data: Optional[bytes] = None, timeout: float = 30.0):
+    """JSON request to the coordinator; returns (status, body or None)."""
+    headers = {}
+    if body is not None:
+        data = json.dumps(body).encode()
+        headers["Content-Type"] = "application/json"
+    req = urllib.request.Request(url, data=data, method=method, headers=headers)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            payload = resp.read()
+            return resp.status, json.loads(payload) if payload else None
+    except urllib.error.HTTPError as e:
+        payload = e.read()
+        return e.code, json.loads(payload) if payload else None
+
+
+# --- Worker ---
+
+class RenderWorker:
+    """
+    Pulls jobs from the coordinator, renders them and uploads the MP4.
+    Apart from the shared TeX cache, it keeps one Manim media dir with the
+    animation cache on, so a lesson that hashes back here reuses its
+    rendered animations. Manim caps that cache at 100 files per quality.
+    `render` stands in for compile_manim (see benchmarks/farm_failover.py).
+    """
+
+    def __init__(self, coordinator_url: str, worker_id: Optional[str] = None,
+                 render: Callable[..., Path] = compile_manim):
+        self.url = coordinator_url.rstrip("/")
+        self.id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.render = render
+        self.media_dir = RENDERS_DIR / f"worker_{re.sub(r'[^A-Za-z0-9_.-]', '_', self.id)}"
+        self.interval = HEARTBEAT_INTERVAL
+        self._stop = threading.Event()
+
+    def _heartbeats(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                _request(f"{self.url}/workers/heartbeat", "POST", {"worker": self.id}, timeout=5)
+            except OSError as e:
+                print(f"Heartbeat failed: {e}")
+
+    def _progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        try:
+            _request(f"{self.url}/jobs/{job_id}/progress", "POST", {"worker": self.id, "progress": progress}, timeout=5)
+        except OSError:
+            pass  # Progress is best effort
+
+    def _render(self, job: Dict[str, Any]) -> Path:
+        # The media dir outlives the job; its lesson JSON, MP4 and stills don't
+        artifacts = RenderArtifacts(job["job_id"], self.media_dir)
+        try:
+            BUILD_DIR.mkdir(parents=True, exist_ok=True)
+            json_path = artifacts.add(BUILD_DIR / f"lesson_{job['job_id']}.json")
+            with open(json_path, "w") as f:
+                json.dump(job["lesson"], f, indent=2)
+            mp4_path = artifacts.add(self.render(
+                json_path, quality=job["quality"], fps=job["fps"], out_name=f"lesson_{job['job_id']}",
+                on_progress=lambda progress: self._progress(job["job_id"], progress),
+                media_dir=self.media_dir, caching=True,
+            ))
+            stills = {kind: artifacts.add(path) for kind, path in still_paths(mp4_path).items()}
+            # Stills go first, the video completes the job
+            result_url = f"{self.url}/jobs/{job['job_id']}/result?worker={quote(self.id)}"
+            for kind, path in stills.items():
+                if path.exists():
+                    _request(f"{result_url}&suffix={STILL_SUFFIXES[kind]}", "PUT", data=path.read_bytes(), timeout=60)
+            status, _ = _request(result_url, "PUT", data=mp4_path.read_bytes(), timeout=300)
+            if status != 200:
+                print(f"Coordinator rejected the result of {job['job_id']} ({status})")
+            return mp4_path
+        finally:
+            artifacts.cleanup(keep_media=True)
+
+    def run(self) -> None:
+        status, body = _request(f"{self.url}/workers/heartbeat", "POST", {"worker": self.id})
+        self.interval = (body or {}).get("heartbeat_interval", HEARTBEAT_INTERVAL)
+        threading.Thread(target=self._heartbeats, name="render-worker-heartbeat", daemon=True).start()
+        print(f"Render worker {self.id} pulling from {self.url}")
+        while not self._stop.is_set():
+            try:
+                status, job = _request(f"{self.url}/jobs/pull", "POST",
+                                       {"worker": self.id, "wait": PULL_WAIT}, timeout=PULL_WAIT + 10)
+            except OSError as e:
+                print(f"Pull failed: {e}")
+                time.sleep(self.interval)
+                continue
+            if status != 200 or not job:
+                continue
+            try:
+                self._render(job)
+            except Exception as e:
+                print(f"Render of {job['job_id']} failed: {e}")
+                report = {"worker": self.id, "error": str(e)}
+                if isinstance(e, RenderFailure):
+                    report["failure"] = {"category": e.category, "reports": e.reports}
+                _request(f"{self.url}/jobs/{job['job_id']}/fail", "POST", report)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+# --- Backend side ---
+
+class FarmClient:
+    """Used by the pipeline to send renders to the coordinator instead of running Manim."""
+
+    def __init__(self, coordinator_url: str, cache: RenderCache):
+        self.url = coordinator_url.rstrip("/")
+        self.cache = cache
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.failed = 0
+
+    def render(self, key: str, lesson, profile, on_progress=None) -> Path:
+        """Blocks until a worker rendered the lesson; returns the video in the shared store."""
+        status, job = _request(f"{self.url}/jobs", "POST", {
+            "key": key, "fingerprint": lesson.fingerprint, "lesson": lesson.to_dict(),
+            "quality": profile.quality, "fps": profile.fps,
+        })
+        if status != 202:
+            raise RuntimeError(f"Render coordinator refused the job ({status}): {job}")
+        with self._lock:
+            self.submitted += 1
+
+        seen = 0
+        while job["status"] not in ("done", "failed"):
+            status, job = _request(f"{self.url}/jobs/{job['job_id']}?since={seen}&wait={STATUS_WAIT}",
+                                   timeout=STATUS_WAIT + 10)
+            if status != 200:
+                raise RuntimeError(f"Render job lost by the coordinator ({status})")
+            for progress in job["progress"]:
+                if on_progress:
+                    on_progress(progress)
+            seen = job["progress_count"]
+
+        path = self.cache.lookup(key)
+        if job["status"] == "failed" or path is None:
+            with self._lock:
+                self.failed += 1
+            if job.get("failure"):
+                raise RenderFailure(job["error"], job["failure"]["category"], job["failure"]["reports"])
+            raise RuntimeError(job["error"] or f"Rendered video {key} is not in the shared store")
+        return path
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            summary = {"coordinator": self.url, "submitted": self.submitted, "failed": self.failed}
+        try:
+            summary.update(_request(f"{self.url}/stats", timeout=2)[1] or {})
+        except OSError as e:
+            summary["error"] = str(e)
+        return summary
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Render farm coordinator / worker")
+    sub = parser.add_subparsers(dest="role", required=True)
+    coord = sub.add_parser("coordinator")
+    coord.add_argument("--host", default="0.0.0.0")
+    coord.add_argument("--port", type=int, default=8765)
+    coord.add_argument("--storage", type=Path, default=VIDEO_CACHE_DIR)
+    coord.add_argument("--heartbeat-timeout", type=float, default=HEARTBEAT_TIMEOUT)
+    coord.add_argument("--steal-after", type=float, default=STEAL_AFTER)
+    work = sub.add_parser("worker")
+    work.add_argument("--coordinator", default=COORDINATOR_URL or "http://127.0.0.1:8765")
+    work.add_argument("--id")
+    args = parser.parse_args()
+
+    if args.role == "coordinator":
+        _, server = serve_coordinator(args.port, args.host, args.storage, args.heartbeat_timeout, args.steal_after)
+        print(f"Render coordinator on {args.host}:{args.port}, storage {args.storage}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+    else:
+        RenderWorker(args.coordinator, args.id).run()
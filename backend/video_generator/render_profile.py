@@ -0,0 +1,56 @@
+# render_profile.py
+"""
+Frame rate chosen from what a lesson actually draws.
+
+Title/step reveals and static shapes look the same at 30 fps as at 60, only
+curves being drawn by Create(graph) benefit from the higher rate. Manim's
+frame rate is global to a render, so the choice is made per lesson: lessons
+with function plots keep 60 fps, everything else renders at 30 fps. The
+resolution is left at the requested quality so text stays sharp.
+"""
+import os
+from typing import NamedTuple
+
+# Manim -q flags: pixel height and default frame rate
+QUALITY_HEIGHTS = {"l": 480, "m": 720, "h": 1080, "p": 1440, "k": 2160}
+QUALITY_FPS = {"l": 15, "m": 30, "h": 60, "p": 60, "k": 60}
+
+# Frame rate per lesson class (capped by the quality's own frame rate)
+CLASS_FPS = {"text": 30, "shapes": 30, "plot": 60}
+
+# Set AUTO_RENDER_QUALITY=0 to render everything at the quality's default frame rate
+AUTO_RENDER_QUALITY = os.getenv("AUTO_RENDER_QUALITY", "1") != "0"
+
+
+class RenderProfile(NamedTuple):
+    quality: str
+    fps: int
+
+    @property
+    def height(self) -> int:
+        return QUALITY_HEIGHTS[self.quality]
+
+    @property
+    def tag(self) -> str:
+        """Same name Manim uses for the output directory, e.g. '1080p30'."""
+        return f"{self.height}p{self.fps}"
+
+
+def default_profile(quality: str = "h") -> RenderProfile:
+    return RenderProfile(quality, QUALITY_FPS[quality])
+
+
+def lesson_class(lesson) -> str:
+    if lesson.plot_expressions:
+        return "plot"
+    if lesson.shape_types:
+        return "shapes"
+    return "text"
+
+
+def choose_render_profile(lesson, quality: str = "h", auto: bool = None) -> RenderProfile:
+    """Picks the frame rate for `lesson` at the given Manim quality."""
+    auto = AUTO_RENDER_QUALITY if auto is None else auto
+    if not auto:
+        return default_profile(quality)
+    return RenderProfile(quality, min(CLASS_FPS[lesson_class(lesson)], QUALITY_FPS[quality]))
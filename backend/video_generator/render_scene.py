@@ -1,178 +1,251 @@
 # render_scene.py
-import json, os
-import re
+import json, os, re
 import numpy as np
-import sympy as sp
 from manim import *
-from lesson_schema import Lesson
-from sympy.parsing.sympy_parser import (
-    parse_expr,
-    standard_transformations,
-    implicit_multiplication_application,
-    convert_xor,
-)
-
-# Try LaTeX parser if available
-try:
-    from sympy.parsing.latex import parse_latex
-    _HAS_PARSE_LATEX = True
-except Exception:
-    _HAS_PARSE_LATEX = False
-
-TRANSFORMS = standard_transformations + (
-    implicit_multiplication_application,  # "3x" -> 3*x
-    convert_xor,                          # "^"   -> "**"
-)
-
-SAFE_LOCALS = {
-    "e": sp.E, "E": sp.E, "pi": sp.pi,
-    "sin": sp.sin, "cos": sp.cos, "tan": sp.tan,
-    "asin": sp.asin, "acos": sp.acos, "atan": sp.atan,
-    "sinh": sp.sinh, "cosh": sp.cosh, "tanh": sp.tanh,
-    "sec": sp.sec, "csc": sp.csc, "cot": sp.cot,
-    "exp": sp.exp, "log": sp.log, "ln": sp.log, "sqrt": sp.sqrt,
-    "abs": sp.Abs,
+from lesson_compact import CompactLesson
+from jobs import FAILURE_PREFIX, PROGRESS_PREFIX
+from stills import LESSON_STILLS, StillsRecorder
+
+# Shared TeX cache across renders (set by manim_runner, each render has its own media_dir)
+if os.getenv("CLULUS_TEX_DIR"):
+    config.tex_dir = os.environ["CLULUS_TEX_DIR"]
+
+# Manim colors for the names in lesson_schema.SHAPE_COLORS
+COLOR_MAP = {
+    "BLUE": BLUE, "RED": RED, "GREEN": GREEN, "YELLOW": YELLOW,
+    "ORANGE": ORANGE, "PURPLE": PURPLE, "PINK": PINK, "GRAY": GRAY,
+    "WHITE": WHITE, "BLACK": BLACK
 }
 
-_LATEX_SPACING = re.compile(r"\\[,\!\;\:\s]")
-
-def _normalize_latex(s: str) -> str:
-    # Handle \frac{a}{b} -> (a)/(b) (repeat to unwrap nested)
-    frac_pat = re.compile(r"\\frac\s*\{([^{}]+)\}\s*\{([^{}]+)\}")
-    while True:
-        s2 = re.sub(frac_pat, r"(\1)/(\2)", s)
-        if s2 == s:
-            break
-        s = s2
-
-    # \sin^2 x, \cos^{3}(x) -> (sin(x))**2, (cos(x))**3
-    s = re.sub(
-        r"\\(?P<fn>sin|cos|tan|sec|csc|cot|sinh|cosh|tanh)\s*\^\s*(?P<p>\d+)\s*\(?\s*(?P<a>[A-Za-z0-9_]+)\s*\)?",
-        r"(\g<fn>(\g<a>))**\g<p>", s)
-
-    # Convert \fn(x) / \fn x -> fn(x)
-    for fn in ["sin","cos","tan","sec","csc","cot","sinh","cosh","tanh","exp","log","ln","sqrt","abs"]:
-        s = re.sub(rf"\\{fn}\s*\(", f"{fn}(", s)
-        s = re.sub(rf"\\{fn}\s+([A-Za-z0-9_]+)", rf"{fn}(\1)", s)
-
-    # Constants, operators, wrappers
-    s = s.replace(r"\pi", "pi").replace(r"\mathrm{e}", "e")
-    s = s.replace(r"\cdot", "*").replace(r"\times", "*")
-    s = s.replace(r"\left", "").replace(r"\right", "")
-    s = _LATEX_SPACING.sub("", s)
-
-    # As a last step, brace → parenthesis (helps with x^{2} etc.)
-    s = s.replace("{", "(").replace("}", ")")
-    return s.strip()
-
-def to_sympy_expr(s: str) -> sp.Expr:
-    s = s.strip()
-    x = sp.symbols("x")
-
-    # 1) Try proper LaTeX parse
-    if _HAS_PARSE_LATEX:
-        try:
-            return parse_latex(s)
-        except Exception:
-            pass  # fall back below
+# Scale down sizes and positions to fit better on screen (Manim screen is roughly 14x8 units)
+SHAPE_SCALE = 0.4
+POSITION_SCALE = 0.3
 
-    # 2) Normalize common LaTeX → plain math
-    s = _normalize_latex(s)
+# Unit-size mobjects per shape type, built once and copied for every shape.
+# Copying the (small, contiguous) point arrays is much cheaper than
+# recomputing arcs and polygons through the mobject constructors.
+_SHAPE_TEMPLATES = {}
 
-    # 3) Minor conveniences: e^x → e**x is handled by convert_xor; we map e→E
-    expr = parse_expr(
-        s,
-        transformations=TRANSFORMS,
-        local_dict={**SAFE_LOCALS, "x": x},
-        evaluate=True,
-    )
-    return expr
+def _build_template(shape_type):
+    if shape_type == "square":
+        return Square(side_length=1.0)
+    if shape_type == "circle":
+        return Circle(radius=1.0)
+    if shape_type == "triangle":
+        # Equilateral triangle
+        return Polygon(
+            np.array([0.0, 0.577, 0]),     # top vertex
+            np.array([-0.5, -0.289, 0]),   # bottom left
+            np.array([0.5, -0.289, 0]),    # bottom right
+        )
+    if shape_type == "rectangle":
+        return Rectangle(width=1.0, height=1.0)
+    if shape_type == "hexagon":
+        angles = np.linspace(0, 2*np.pi, 6, endpoint=False)
+        return Polygon(*[np.array([np.cos(a), np.sin(a), 0]) for a in angles])
+    if shape_type == "line":
+        # A horizontal line
+        return Line(LEFT * 0.5, RIGHT * 0.5)
+    raise ValueError(f"No template for {shape_type}")
+
+def _from_template(shape_type):
+    template = _SHAPE_TEMPLATES.get(shape_type)
+    if template is None:
+        template = _SHAPE_TEMPLATES[shape_type] = _build_template(shape_type)
+    return template.copy()
 
 def create_geometric_shape(shape_data):
     """Create a Manim geometric shape from shape data."""
     shape_type = shape_data.shape_type
     position = shape_data.position
-    size = shape_data.size or 1.0  # Default size if None
-    
-    # Scale down the size to fit better on screen (Manim screen is roughly 14x8 units)
-    scale_factor = 0.4  # Make shapes much smaller
-    size = size * scale_factor
-    
-    # Handle color mapping
-    color_map = {
-        "BLUE": BLUE, "RED": RED, "GREEN": GREEN, "YELLOW": YELLOW,
-        "ORANGE": ORANGE, "PURPLE": PURPLE, "PINK": PINK, "GRAY": GRAY,
-        "WHITE": WHITE, "BLACK": BLACK
-    }
-    color = color_map.get(shape_data.color, BLUE)
+    size = (shape_data.size or 1.0) * SHAPE_SCALE  # Default size if None
     
+    color = COLOR_MAP.get(shape_data.color, BLUE)
     fill_opacity = shape_data.fill_opacity or 0.3
     stroke_width = shape_data.stroke_width or 2.0
     
-    # Convert position to Manim coordinates (scale down positions too)
-    x, y = position[0] * 0.3, position[1] * 0.3  # Scale down positions more
+    # Convert position to Manim coordinates
+    x, y = position[0] * POSITION_SCALE, position[1] * POSITION_SCALE
     
-    if shape_type == "square":
-        shape = Square(side_length=size, color=color, fill_opacity=fill_opacity, stroke_width=stroke_width)
-    elif shape_type == "circle":
-        shape = Circle(radius=size, color=color, fill_opacity=fill_opacity, stroke_width=stroke_width)
-    elif shape_type == "triangle":
-        # Create equilateral triangle
-        vertices = [
-            [x, y + size * 0.577],  # top vertex
-            [x - size * 0.5, y - size * 0.289],  # bottom left
-            [x + size * 0.5, y - size * 0.289]   # bottom right
-        ]
-        shape = Polygon(*[np.array(v) for v in vertices], color=color, fill_opacity=fill_opacity, stroke_width=stroke_width)
+    filled = True
+    if shape_type in ("square", "circle", "triangle"):
+        shape = _from_template(shape_type).scale(size)
     elif shape_type == "rectangle":
-        width = (shape_data.width or size) * scale_factor
-        height = (shape_data.height or size) * scale_factor
-        shape = Rectangle(width=width, height=height, color=color, fill_opacity=fill_opacity, stroke_width=stroke_width)
+        shape = _from_template("rectangle")
+        shape.stretch_to_fit_width((shape_data.width or size) * SHAPE_SCALE)
+        shape.stretch_to_fit_height((shape_data.height or size) * SHAPE_SCALE)
     elif shape_type == "polygon":
         if shape_data.vertices:
             # Scale down custom vertices
-            vertices = [np.array([v[0] * 0.3, v[1] * 0.3, 0]) for v in shape_data.vertices]
-            shape = Polygon(*vertices, color=color, fill_opacity=fill_opacity, stroke_width=stroke_width)
+            vertices = [np.array([v[0] * POSITION_SCALE, v[1] * POSITION_SCALE, 0]) for v in shape_data.vertices]
+            shape = Polygon(*vertices)
         else:
             # Default to hexagon if no vertices provided
-            angles = np.linspace(0, 2*np.pi, 6, endpoint=False)
-            vertices = [[x + size * np.cos(a), y + size * np.sin(a)] for a in angles]
-            shape = Polygon(*[np.array(v) for v in vertices], color=color, fill_opacity=fill_opacity, stroke_width=stroke_width)
+            shape = _from_template("hexagon").scale(size)
     elif shape_type == "line":
-        # Create a horizontal line
-        start = np.array([x - size/2, y, 0])
-        end = np.array([x + size/2, y, 0])
-        shape = Line(start, end, color=color, stroke_width=stroke_width)
+        shape = _from_template("line").scale(size)
+        filled = False
     elif shape_type == "arrow":
-        # Create a horizontal arrow
-        start = np.array([x - size/2, y, 0])
-        end = np.array([x + size/2, y, 0])
-        shape = Arrow(start, end, color=color, stroke_width=stroke_width)
+        # The tip is sized from the arrow's length, so arrows are built directly
+        shape = Arrow(LEFT * size / 2, RIGHT * size / 2, color=color, stroke_width=stroke_width)
+        return shape.move_to(np.array([x, y, 0]))
     else:
         # Default to circle for unknown shapes
-        shape = Circle(radius=size, color=color, fill_opacity=fill_opacity, stroke_width=stroke_width)
+        shape = _from_template("circle").scale(size)
+    
+    shape.set_stroke(color, width=stroke_width)
+    if filled:
+        shape.set_fill(color, opacity=fill_opacity)
     
     # Position the shape
     shape.move_to(np.array([x, y, 0]))
     return shape
 
+# Extra space between rows so each label's glyphs can be told apart
+_BATCH_ROW_GAP = r" \\[2em] "
+
+def batch_math_tex(strings, **kwargs):
+    """
+    MathTex mobjects for several strings from a single TeX compile.
+
+    The strings are typeset as rows of one align* block and the glyphs are
+    split back into rows by their vertical position. If that split is
+    ambiguous (or there is only one string) each string is compiled on its own.
+    """
+    strings = list(strings)
+    if len(strings) > 1 and all(s.strip() for s in strings):
+        try:
+            block = MathTex(_BATCH_ROW_GAP.join(strings), **kwargs)
+            rows = _split_rows(block.family_members_with_points(), len(strings))
+            if rows is not None:
+                return [VGroup(*row) for row in rows]
+        except Exception:
+            pass
+    return [MathTex(s, **kwargs) for s in strings]
+
+def _split_rows(glyphs, n_rows):
+    """
+    Groups glyphs into `n_rows` rows (top to bottom), or None if unclear.
+    Each row is ordered left to right, the order Write draws it in.
+    """
+    if len(glyphs) < n_rows:
+        return None
+    glyphs = sorted(glyphs, key=lambda g: -g.get_center()[1])
+    ys = np.array([g.get_center()[1] for g in glyphs])
+    gaps = ys[:-1] - ys[1:]
+    cuts = np.sort(np.argsort(gaps)[-(n_rows - 1):])
+    inner = np.delete(gaps, cuts)
+    # Row breaks must be clearly larger than any gap inside a row
+    if inner.size and gaps[cuts].min() < 1.5 * inner.max():
+        return None
+    bounds = [0, *(cuts + 1), len(glyphs)]
+    # Stable sort: glyphs stacked at one x (a fraction) stay top to bottom
+    return [sorted(glyphs[bounds[i]:bounds[i + 1]], key=lambda g: round(g.get_center()[0], 2))
+            for i in range(n_rows)]
+
+def _report_progress(**fields):
+    print(PROGRESS_PREFIX + json.dumps(fields), flush=True)
+
+def _report_failure(**fields):
+    print(FAILURE_PREFIX + json.dumps(fields), flush=True)
+
+def _tex_error(error):
+    """The '! ...' lines (and the line they point at) of the TeX log Manim refers to."""
+    match = re.search(r"log file: (\S+)", str(error))
+    if match and os.path.exists(match.group(1)):
+        with open(match.group(1), errors="replace") as f:
+            log = f.read().splitlines()
+        lines = [l for l in log if l.startswith("!") or re.match(r"l\.\d+ ", l)]
+        if lines:
+            return "\n".join(lines[:6])[:600]
+    return str(error)[:600]
+
 class LessonScene(Scene):
+    def setup(self):
+        # Poster and preview come from the frames we render anyway (see stills.py)
+        self._stills = None
+        if LESSON_STILLS and os.environ.get("CLULUS_STILLS"):
+            self._stills = StillsRecorder(config.frame_rate)
+            add_frame = self.renderer.add_frame
+
+            def add_and_record(frame, num_frames=1):
+                add_frame(frame, num_frames)
+                self._stills.add_frame(frame, num_frames)
+
+            self.renderer.add_frame = add_and_record
+
+    def tear_down(self):
+        if self._stills is not None:
+            try:
+                self._stills.save(os.environ["CLULUS_STILLS"])
+            except Exception as e:
+                # The video is what matters; the pipeline copes without stills
+                print(f"Could not save poster/preview: {e}")
+
+    def play(self, *args, **kwargs):
+        super().play(*args, **kwargs)
+        # Set when Manim took this animation from its cache (a retry with caching on)
+        cached = bool(self.renderer.skip_animations)
+        partial = self.renderer.file_writer.partial_movie_files[-1:]
+        if cached and self._stills is not None and partial and partial[0]:
+            # No frames went through add_frame; read them back from the cached file
+            self._stills.add_video(partial[0])
+        self._animation_index = getattr(self, "_animation_index", 0) + 1
+        _report_progress(
+            animation=self._animation_index,
+            name=", ".join(type(a).__name__ for a in args),
+            cached=cached,
+            seconds=round(getattr(self, "duration", 0.0), 3),
+        )
+
+    def _build_tex(self):
+        """
+        Title and step mobjects. Every string that fails to compile is
+        reported (field, index, LaTeX and TeX error) before the render fails,
+        so the pipeline can repair just those.
+        """
+        broken = []
+
+        def build(cls, text, field, index=None, **kwargs):
+            try:
+                return cls(text, **kwargs)
+            except Exception as e:
+                broken.append(e)
+                _report_failure(category="tex", field=field, index=index, latex=text, error=_tex_error(e))
+
+        title = build(Tex, self.lesson.title, "title", font_size=48)
+        steps = [build(MathTex, s, "steps", i, font_size=36) for i, s in enumerate(self.lesson.steps)]
+        if broken:
+            self._failure_reported = True
+            raise broken[0]
+        return title, steps
+
+    def render(self, *args, **kwargs):
+        try:
+            return super().render(*args, **kwargs)
+        except Exception as e:
+            # Anything _build_tex didn't already report, e.g. a bug in the scene
+            if not getattr(self, "_failure_reported", False):
+                _report_failure(category="scene", error=f"{type(e).__name__}: {e}"[:600])
+            raise
+
     def construct(self):
         json_path = os.environ.get("LESSON_JSON")
         if not json_path or not os.path.exists(json_path):
             raise FileNotFoundError("LESSON_JSON env var must point to a lesson JSON file.")
         with open(json_path, "r") as f:
             raw = json.load(f)
-        lesson = Lesson.model_validate(raw)
+        # The pipeline writes this file from a lesson it has already validated
+        lesson = self.lesson = CompactLesson.from_dict(raw)
+        title, steps = self._build_tex()
 
         # Title
-        title = Tex(lesson.title, font_size=48)
         title.to_edge(UP)
         self.play(Write(title), run_time=1.5)
         self.wait(0.3)
 
         # Steps
-        lines = VGroup(*[MathTex(s, font_size=36) for s in lesson.steps])
+        lines = VGroup(*steps)
         lines.arrange(DOWN, aligned_edge=LEFT, buff=0.5).next_to(title, DOWN).to_edge(LEFT, buff=0.8)
 
         for i, step in enumerate(lines):
@@ -182,13 +255,18 @@ class LessonScene(Scene):
                 self.play(Indicate(step, scale_factor=1.1), run_time=0.6)
                 self.wait(0.2)
 
+        # Poster: every step on screen, before they fade out
+        if self._stills is not None:
+            if self.renderer.skip_animations:
+                # The last animation came from the cache, so the camera holds an old frame
+                self.renderer.update_frame(self)
+            self._stills.keep_poster(self.renderer.get_frame())
         self.play(FadeOut(title, lines))
         self.wait(0.5)  # A brief pause for transition
 
         # Optional graph (DROP-IN REPLACEMENT)
-        if lesson.function_plots:
+        if lesson.plot_expressions:
             PLOT_COLORS = [BLUE, GREEN]  # Colors for the 1st and 2nd plot
-            x = sp.symbols("x")
 
             def _nice_step(span, target_ticks=6):
                 # ... (this helper function is unchanged)
@@ -208,30 +286,19 @@ class LessonScene(Scene):
                 return nice * (10 ** exp)
 
             try:
-                # --- Step 1: Parse all functions and gather their data ---
-                parsed_plots = []
-                for i, plot_data in enumerate(lesson.function_plots):
-                    if i >= len(PLOT_COLORS): break  # Max 2 plots
-                    expr = to_sympy_expr(plot_data.expression)
-                    func = sp.lambdify(x, expr, modules=["numpy"])
-                    parsed_plots.append({
-                        "func": func,
-                        "label_tex": plot_data.label,
-                        "color": PLOT_COLORS[i]
-                    })
+                # --- Step 1: Parse all functions (lambdified once by the lesson) ---
+                parsed_plots = [
+                    {"func": func, "label_tex": label, "color": color}
+                    for func, label, color in zip(lesson.plot_functions(), lesson.plot_labels, PLOT_COLORS)
+                ]
 
                 if not parsed_plots:
                     raise ValueError("No valid functions to plot.")
 
                 # --- Step 2: Sample all functions to find global y-bounds ---
-                xs = np.linspace(lesson.x_min, lesson.x_max, 400)
-                all_ys = []
-                for plot in parsed_plots:
-                    ys = np.array(plot["func"](xs), dtype=float)
-                    plot["ys_sampled"] = ys  # Store for later use
-                    all_ys.append(ys[np.isfinite(ys)])
-
-                valid_ys = np.concatenate(all_ys)
+                xs, ys = lesson.sample_plots(400)
+                ys = ys[:len(parsed_plots)]
+                valid_ys = ys[np.isfinite(ys)]
                 if valid_ys.size == 0:
                     ymin, ymax = -1.0, 1.0
                 else:
@@ -257,7 +324,8 @@ class LessonScene(Scene):
 
                 # --- Step 4: Plot each function sequentially ---
                 labels_group = VGroup()
-                for plot in parsed_plots:
+                plot_labels = batch_math_tex([plot["label_tex"] for plot in parsed_plots], font_size=32)
+                for plot, label in zip(parsed_plots, plot_labels):
                     def f_scalar(t, func=plot["func"]):  # Capture func in closure
                         try:
                             val = func(float(t))
@@ -270,7 +338,7 @@ class LessonScene(Scene):
                         stroke_width=4, color=plot["color"]
                     )
 
-                    label = MathTex(plot["label_tex"], font_size=32, color=plot["color"])
+                    label.set_color(plot["color"])
                     labels_group.add(label)
 
                     self.play(Create(graph), Write(label), run_time=1.2)
@@ -287,18 +355,20 @@ class LessonScene(Scene):
                 self.wait(0.5)
 
         # Optional geometric shapes
-        if lesson.geometric_shapes:
+        if lesson.shape_types:
             try:
                 shapes_group = VGroup()
                 labels_group = VGroup()
+                # All shape labels come out of one TeX compile where possible
+                shape_labels = batch_math_tex(lesson.shape_labels, font_size=24)
                 
-                for shape_data in lesson.geometric_shapes:
+                for shape_data, label in zip(lesson.geometric_shapes, shape_labels):
                     # Create the geometric shape
                     shape = create_geometric_shape(shape_data)
                     shapes_group.add(shape)
                     
-                    # Create label for the shape
-                    label = MathTex(shape_data.label, font_size=24, color=shape.color)
+                    # Color the label like the shape
+                    label.set_color(shape.color)
                     # Position label near the shape
                     label.next_to(shape, UP, buff=0.2)
                     labels_group.add(label)
@@ -0,0 +1,299 @@
+# retention.py
+"""
+Cleanup of render intermediates and a disk usage report.
+
+Every pipeline render gets its own Manim media directory under
+media/renders/<video id> (so the partial movie files of concurrent renders
+can't collide) plus its lesson JSON in build/. `RenderArtifacts` tracks both
+and deletes them as soon as the MP4 has been moved into the render cache, or
+the render failed. A failed checkpointed render keeps its media directory
+for the retry (see recovery.py). TeX output is shared by all renders in TEX_DIR.
+
+`sweep_stale` removes what crashed renders and the old shared media layout
+left behind, and trims TeX files nobody used for a while. The render cache
+itself is kept under its byte quota by `RenderCache.enforce_quota`.
+
+    python video_generator/retention.py [--sweep]
+"""
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from manim_runner import BUILD_DIR, MEDIA_DIR, RENDERS_DIR, TEX_DIR
+from render_cache import VIDEO_CACHE_DIR
+
+# Leftovers older than this are considered orphaned (renders take minutes)
+STALE_AGE = float(os.getenv("RETENTION_STALE_SECONDS", "3600"))
+# Shared TeX files not used for this many days are removed by the sweep
+TEX_MAX_AGE = float(os.getenv("RETENTION_TEX_DAYS", "7")) * 86400
+# How often the background sweeper runs
+SWEEP_INTERVAL = float(os.getenv("RETENTION_SWEEP_SECONDS", "3600"))
+# The disk report walks the media tree, so it is reused for a little while
+REPORT_TTL = 30.0
+
+
+def _size(path: Path) -> int:
+    if path.is_file():
+        return path.stat().st_size
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _remove(path: Path) -> int:
+    """Deletes a file or directory tree and returns the bytes freed."""
+    try:
+        size = _size(path)
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink()
+        return size
+    except OSError:
+        return 0
+
+
+class RetentionStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.renders_cleaned = 0
+        self.render_bytes_freed = 0
+        self.swept = 0
+        self.swept_bytes = 0
+        self.last_sweep: Optional[float] = None
+
+    def record_cleanup(self, freed: int) -> None:
+        with self._lock:
+            self.renders_cleaned += 1
+            self.render_bytes_freed += freed
+
+    def record_sweep(self, removed: int, freed: int) -> None:
+        with self._lock:
+            self.swept += removed
+            self.swept_bytes += freed
+            self.last_sweep = time.time()
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "renders_cleaned": self.renders_cleaned,
+                "render_bytes_freed": self.render_bytes_freed,
+                "swept": self.swept,
+                "swept_bytes": self.swept_bytes,
+                "last_sweep": self.last_sweep,
+            }
+
+
+RETENTION_STATS = RetentionStats()
+
+# Media dirs of the renders running in this process, with how many use each
+_live_lock = threading.Lock()
+_live_dirs: Dict[Path, int] = {}
+
+
+def _live_media_dirs() -> List[Path]:
+    with _live_lock:
+        return list(_live_dirs)
+
+
+class RenderArtifacts:
+    """Everything one render writes outside the render cache."""
+
+    def __init__(self, video_id: str, media_dir: Optional[Path] = None):
+        # Checkpointed renders reuse the media dir of their question (see recovery.py)
+        self.media_dir = media_dir or RENDERS_DIR / video_id
+        self.paths: List[Path] = [self.media_dir]
+        if self.media_dir.is_dir():
+            # Touched so a sweep in another process leaves a reused dir alone
+            os.utime(self.media_dir)
+        self._live = True
+        with _live_lock:
+            _live_dirs[self.media_dir] = _live_dirs.get(self.media_dir, 0) + 1
+
+    def add(self, path: Path) -> Path:
+        self.paths.append(Path(path))
+        return path
+
+    def cleanup(self, keep_media: bool = False) -> int:
+        """Deletes the tracked files; the final MP4 must already be promoted."""
+        paths = [p for p in self.paths if not (keep_media and p == self.media_dir)]
+        freed = sum(_remove(path) for path in paths if path.exists())
+        RETENTION_STATS.record_cleanup(freed)
+        if self._live:
+            self._live = False
+            with _live_lock:
+                _live_dirs[self.media_dir] -= 1
+                if not _live_dirs[self.media_dir]:
+                    del _live_dirs[self.media_dir]
+        return freed
+
+
+def _newest_mtime(path: Path) -> float:
+    """Latest mtime in a directory tree; a running render keeps writing into it."""
+    newest = path.stat().st_mtime
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in dirnames + filenames:
+            try:
+                newest = max(newest, os.lstat(os.path.join(dirpath, name)).st_mtime)
+            except OSError:
+                pass
+    return newest
+
+
+def _stale_paths(now: float) -> List[Path]:
+    stale = []
+
+    def old(path: Path, age: float, accessed: bool = False) -> bool:
+        # Directory listings bump atime, so only files read by Manim go by it
+        try:
+            st = path.stat()
+        except OSError:
+            return False
+        return now - (max(st.st_mtime, st.st_atime) if accessed else st.st_mtime) > age
+
+    def abandoned(path: Path) -> bool:
+        # A long render only writes deep in its tree, so its top-level mtime says nothing
+        try:
+            return now - _newest_mtime(path) > STALE_AGE
+        except OSError:
+            return False
+
+    # Render dirs and lesson JSON of renders that crashed or were killed. Dirs
+    # of renders running here are skipped; those of other processes (farm
+    # workers, the other app) go by their newest file.
+    if RENDERS_DIR.is_dir():
+        live = set(_live_media_dirs())
+        stale += [p for p in RENDERS_DIR.iterdir() if p not in live and abandoned(p)]
+    if BUILD_DIR.is_dir():
+        stale += [p for p in BUILD_DIR.glob("lesson_*.json") if old(p, STALE_AGE)]
+        # Checkpoints of failed jobs nobody retried (their media dirs are in RENDERS_DIR)
+        stale += [p for p in BUILD_DIR.glob("checkpoints/*.json") if old(p, STALE_AGE)]
+    # Half-written cache entries and HLS packages (see RenderCache.put, hls.package_hls)
+    if VIDEO_CACHE_DIR.is_dir():
+        stale += [p for p in VIDEO_CACHE_DIR.glob(".*") if old(p, STALE_AGE)]
+    # Partial movie files of the old shared media/ layout
+    videos = MEDIA_DIR / "videos"
+    if videos.is_dir():
+        stale += [p for p in videos.glob("*/*/partial_movie_files") if old(p, STALE_AGE)]
+    # Shared TeX files that haven't been used in a while
+    if TEX_MAX_AGE and TEX_DIR.is_dir():
+        stale += [p for p in TEX_DIR.iterdir() if p.is_file() and old(p, TEX_MAX_AGE, accessed=True)]
+    return stale
+
+
+def sweep_stale() -> Dict[str, int]:
+    """Removes orphaned intermediates.
+
+    Render dirs in use by this process are never touched. Those of other
+    processes are kept while anything in them changed within STALE_AGE, so a
+    render that wrote nothing for that long is taken for crashed.
+    """
+    stale = _stale_paths(time.time())
+    freed = sum(_remove(path) for path in stale)
+    RETENTION_STATS.record_sweep(len(stale), freed)
+    if stale:
+        print(f"Retention sweep removed {len(stale)} stale paths ({freed} bytes)")
+    return {"removed": len(stale), "bytes": freed}
+
+
+def start_sweeper(interval: float = SWEEP_INTERVAL) -> Optional[threading.Thread]:
+    """Sweeps now and then every `interval` seconds in a daemon thread (0 = off)."""
+    if not interval:
+        return None
+
+    def loop():
+        while True:
+            try:
+                sweep_stale()
+            except Exception as e:
+                print(f"Retention sweep failed: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="retention-sweeper", daemon=True)
+    thread.start()
+    return thread
+
+
+def _category(path: Path) -> str:
+    """Category of a file under MEDIA_DIR in the disk report."""
+    parts = path.relative_to(MEDIA_DIR).parts
+    if "partial_movie_files" in parts:
+        return "partial_movie_files"
+    if parts[0] == "images":
+        return "images"
+    if parts[0] == "videos" and path.suffix == ".mp4":
+        return "legacy_videos"
+    return "other"
+
+
+def _usage() -> Dict[str, Any]:
+    categories: Dict[str, Dict[str, int]] = {}
+
+    def add(category: str, size: int) -> None:
+        entry = categories.setdefault(category, {"files": 0, "bytes": 0})
+        entry["files"] += 1
+        entry["bytes"] += size
+
+    roots = [(VIDEO_CACHE_DIR, "videos"), (RENDERS_DIR, "render_scratch"), (TEX_DIR, "tex"), (BUILD_DIR, "build")]
+    skip = {str(root.resolve()) for root, _ in roots}
+    for root, category in roots:
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                if category == "videos" and dirpath != str(root):
+                    name_category = "hls"
+                elif category == "videos" and not name.endswith(".mp4"):
+                    name_category = "stills"
+                else:
+                    name_category = category
+                try:
+                    add(name_category, os.lstat(os.path.join(dirpath, name)).st_size)
+                except OSError:
+                    pass
+    for dirpath, dirnames, filenames in os.walk(MEDIA_DIR):
+        dirnames[:] = [d for d in dirnames if str(Path(dirpath, d).resolve()) not in skip]
+        for name in filenames:
+            path = Path(dirpath, name)
+            try:
+                add(_category(path), path.lstat().st_size)
+            except OSError:
+                pass
+
+    disk = shutil.disk_usage(MEDIA_DIR if MEDIA_DIR.exists() else BUILD_DIR.parent)
+    return {
+        "categories": categories,
+        "total_bytes": sum(c["bytes"] for c in categories.values()),
+        "disk_free_bytes": disk.free,
+        "disk_total_bytes": disk.total,
+    }
+
+
+_report_lock = threading.Lock()
+_report_cache: Optional[tuple] = None
+
+
+def disk_usage() -> Dict[str, Any]:
+    """Bytes and file counts of the media tree by category, plus free space."""
+    global _report_cache
+    with _report_lock:
+        if _report_cache is None or time.monotonic() - _report_cache[0] > REPORT_TTL:
+            _report_cache = (time.monotonic(), _usage())
+        report = dict(_report_cache[1])
+    report["cleanup"] = RETENTION_STATS.summary()
+    return report
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    if "--sweep" in sys.argv:
+        print(json.dumps(sweep_stale()))
+    print(json.dumps(_usage(), indent=2))
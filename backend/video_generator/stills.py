@@ -0,0 +1,117 @@
+# stills.py
+"""
+Poster image and animated preview of a lesson, taken from the frames Manim
+rasterizes anyway.
+
+LessonScene hands every frame it writes to a StillsRecorder. The recorder
+keeps a small copy of one frame every 1/PREVIEW_FPS seconds for the preview
+and the frame it is told to keep as the poster (the one with all steps on
+screen). Both are written next to the MP4 and moved into the render cache
+with it, so the lesson list can show them without fetching any video.
+"""
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import av
+import numpy as np
+from PIL import Image, features
+
+# Sidecar files of a video: <video stem><suffix>
+POSTER_SUFFIX = ".poster.jpg"
+PREVIEW_SUFFIX = ".preview.webp" if features.check("webp") else ".preview.gif"
+STILL_SUFFIXES = {"poster": POSTER_SUFFIX, "preview": PREVIEW_SUFFIX}
+STILL_MIMETYPES = {".jpg": "image/jpeg", ".webp": "image/webp", ".gif": "image/gif"}
+
+POSTER_WIDTH = 960
+PREVIEW_WIDTH = 320
+# Frames sampled per second of video, and how much faster the preview plays
+PREVIEW_FPS = 4
+PREVIEW_SPEED = 2.0
+PREVIEW_MAX_FRAMES = 48
+
+# Set LESSON_STILLS=0 to render without poster and preview
+LESSON_STILLS = os.getenv("LESSON_STILLS", "1") != "0"
+
+
+def still_paths(video_path: Path) -> Dict[str, Path]:
+    """Where the stills of `video_path` live, by kind."""
+    video_path = Path(video_path)
+    return {kind: video_path.with_suffix(suffix) for kind, suffix in STILL_SUFFIXES.items()}
+
+
+def _shrink(frame: np.ndarray, width: int) -> Image.Image:
+    factor = frame.shape[1] // width
+    if factor >= 4:
+        # Point-sample every other pixel first; the box filter below smooths it out
+        frame = frame[::2, ::2]
+        factor //= 2
+    image = Image.fromarray(np.ascontiguousarray(frame[..., :3]))
+    if factor > 1:
+        # Box filter over whole pixel blocks, much cheaper than resize()
+        image = image.reduce(factor)
+    return image
+
+
+class StillsRecorder:
+    """Collects the poster frame and preview frames while a scene renders."""
+
+    def __init__(self, frame_rate: float, preview_fps: float = PREVIEW_FPS):
+        self.frame_rate = frame_rate
+        self.preview_fps = preview_fps
+        self.frames_seen = 0
+        self.last_frame: Optional[np.ndarray] = None
+        self.poster: Optional[Image.Image] = None
+        self.preview: List[Image.Image] = []
+
+    def add_frame(self, frame: np.ndarray, num_frames: int = 1) -> None:
+        """Called for every frame (or run of identical frames) Manim writes."""
+        start = self.frames_seen / self.frame_rate
+        self.frames_seen += num_frames
+        end = self.frames_seen / self.frame_rate
+        self.last_frame = frame
+        # One preview frame per sampling instant this run of frames covers
+        wanted = int(end * self.preview_fps) - int(start * self.preview_fps)
+        if wanted > 0 or not self.preview:
+            small = _shrink(frame, PREVIEW_WIDTH)
+            self.preview.extend([small] * max(wanted, 1))
+
+    def add_video(self, path: str) -> None:
+        """
+        Frames of an animation Manim reused from its cache, which never went
+        through add_frame. Only the frames the preview samples are converted.
+        """
+        with av.open(str(path)) as container:
+            for frame in container.decode(video=0):
+                start = self.frames_seen / self.frame_rate
+                end = (self.frames_seen + 1) / self.frame_rate
+                if int(end * self.preview_fps) > int(start * self.preview_fps) or not self.preview:
+                    self.add_frame(frame.to_ndarray(format="rgb24"))
+                else:
+                    self.frames_seen += 1
+
+    def keep_poster(self, frame: Optional[np.ndarray] = None) -> None:
+        """Uses `frame` (by default the last frame written so far) as the poster."""
+        frame = self.last_frame if frame is None else frame
+        if frame is not None:
+            self.poster = _shrink(frame, POSTER_WIDTH)
+
+    def save(self, prefix: str) -> Dict[str, str]:
+        """Writes <prefix>.poster.jpg and <prefix>.preview.*; returns the paths written."""
+        written = {}
+        if self.poster is None:
+            self.keep_poster()
+        if self.poster is not None:
+            path = prefix + POSTER_SUFFIX
+            self.poster.save(path, quality=82, optimize=True)
+            written["poster"] = path
+        if self.preview:
+            frames = self.preview
+            step = -(-len(frames) // PREVIEW_MAX_FRAMES)  # ceil
+            frames = frames[::step]
+            duration = int(1000 * step / (self.preview_fps * PREVIEW_SPEED))
+            path = prefix + PREVIEW_SUFFIX
+            options = {"quality": 60, "method": 4} if PREVIEW_SUFFIX.endswith(".webp") else {"optimize": True}
+            frames[0].save(path, save_all=True, append_images=frames[1:], duration=duration, loop=0, **options)
+            written["preview"] = path
+        return written
@@ -0,0 +1,465 @@
+# tex_preflight.py
+"""
+Pre-flight LaTeX check of a lesson, before Manim spends seconds on it.
+
+Every TeX string of a lesson (title, steps, plot and shape labels) is
+typeset by a pool of persistent `latex` processes. Each one loads the
+packages of Manim's default template once and then reads from stdin:
+
+    \\setbox0=\\vbox{\\begin{align*}
+    <string>
+    \\end{align*}}\\immediate\\write16{CLULUS\\string_END 7}
+
+The box is never shipped out. Any "! ..." message TeX prints before the
+marker is that string's error. A lesson's strings are spread over the idle
+processes and typeset in parallel, with no TeX startup per string. After an
+error the process is replaced in the background, since a broken string can
+leave TeX in an odd state.
+
+Strings that could hang or reconfigure a shared TeX process (unbalanced
+braces or environments, \\def, \\input, conditionals...) are rejected by
+`guard` without going to TeX.
+
+Strings that pass are then compiled to SVG by a background `TexWarmer`. Its
+workers build the same Tex/MathTex objects LessonScene does and copy the
+SVGs into Manim's shared TEX_DIR, where the render finds them. It overlaps
+with Manim's startup.
+
+Both are skipped when `latex` (or Manim, for warming) isn't installed.
+"""
+import os
+import queue
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from importlib.util import find_spec
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from manim_runner import RENDERS_DIR, TEX_DIR
+
+# Set PREFLIGHT_TEX=0 to send lessons to Manim unchecked
+PREFLIGHT_TEX = os.getenv("PREFLIGHT_TEX", "1") != "0" and shutil.which("latex") is not None
+PREFLIGHT_WORKERS = int(os.getenv("PREFLIGHT_WORKERS", str(min(4, os.cpu_count() or 1))))
+# A lesson whose strings aren't all back by then goes to Manim unchecked
+PREFLIGHT_TIMEOUT = float(os.getenv("PREFLIGHT_TIMEOUT", "5"))
+# Set TEX_WARM=0 to leave compiling SVGs to the render
+TEX_WARM = os.getenv("TEX_WARM", "1") != "0" and find_spec("manim") is not None
+# Processes are replaced after this many strings: every undefined command name stays in TeX's tables
+MAX_USES = 500
+# Longer than any step or label the schema allows, by far
+MAX_LENGTH = 1000
+
+# The packages of Manim's default TexTemplate
+PREAMBLE = (
+    r"\documentclass{article}\usepackage[english]{babel}\usepackage{amsmath}\usepackage{amssymb}"
+    r"\begin{document}"
+)
+MARKER = "CLULUS_END"
+_MARKER_RE = re.compile(MARKER + r" (\d+)")
+# Written with \string so the context TeX shows for an error on that line doesn't match MARKER
+_WRITE_MARKER = r"\immediate\write16{CLULUS\string_END %d}"
+
+# Commands that change TeX's state, touch files or skip input. Lessons don't need them,
+# and in a shared process they could swallow the markers or break later strings.
+_DANGEROUS = re.compile(
+    r"\\(?:[egx]?def|let|futurelet|global|long|outer|catcode|lccode|uccode|mathcode|"
+    r"input|include|endinput|openin|openout|closein|closeout|read|write|immediate|special|"
+    r"newcommand|renewcommand|providecommand|DeclareRobustCommand|newenvironment|renewenvironment|"
+    r"csname|expandafter|noexpand|afterassignment|aftergroup|every\w*|output|shipout|"
+    r"if(?:x|num|dim|case|mmode|true|false|odd|vmode|hmode|inner|cat|eof|void|hbox|vbox|defined|csname)?|"
+    r"fi|else|or|loop|repeat|verb|usepackage|documentclass|makeatletter|makeatother|"
+    r"(?:batch|nonstop|scroll|errorstop)mode|enddocument|end(?=\s*\{\s*document\s*\}))(?![a-zA-Z])"
+)
+
+
+class TexItem(NamedTuple):
+    field: str  # "title", "steps", "function_plots" or "geometric_shapes"
+    index: Optional[int]
+    latex: str
+    environment: str  # "center" for Tex, "align*" for MathTex
+
+
+def lesson_tex(lesson) -> List[TexItem]:
+    """Every string of a CompactLesson that LessonScene typesets, with its environment."""
+    items = [TexItem("title", None, lesson.title, "center")]
+    items += [TexItem("steps", i, s, "align*") for i, s in enumerate(lesson.steps)]
+    items += [TexItem("function_plots", i, s, "align*") for i, s in enumerate(lesson.plot_labels)]
+    items += [TexItem("geometric_shapes", i, s, "align*") for i, s in enumerate(lesson.shape_labels)]
+    return items
+
+
+def guard(latex: str) -> Optional[str]:
+    """Why `latex` can't go to a shared TeX process, or None if it can."""
+    if len(latex) > MAX_LENGTH:
+        return f"String is longer than {MAX_LENGTH} characters"
+    if MARKER in latex:
+        return f"String contains {MARKER}"
+    match = _DANGEROUS.search(latex)
+    if match:
+        return f"{match.group(0)} is not allowed in lessons"
+    depth = 0
+    escaped = False
+    for char in latex:
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth < 0:
+                return "Unbalanced braces: '}' without '{'"
+    if depth:
+        return "Unbalanced braces: missing '}'"
+    begins = re.findall(r"\\begin\s*\{([^}]*)\}", latex)
+    ends = re.findall(r"\\end\s*\{([^}]*)\}", latex)
+    if sorted(begins) != sorted(ends):
+        return "Unbalanced \\begin/\\end"
+    return None
+
+
+def _document_line(n: int, item: TexItem) -> str:
+    # The string on its own lines, as in Manim's .tex file, so a '%' comments out the same text
+    return (
+        f"\\setbox0=\\vbox{{\\begin{{{item.environment}}}\n{item.latex}\n"
+        f"\\end{{{item.environment}}}}}" + _WRITE_MARKER % n + "\n"
+    )
+
+
+class TexProcess:
+    """One `latex` reading documents from stdin; not thread safe, the pool hands it out."""
+
+    def __init__(self):
+        self.proc: Optional[subprocess.Popen] = None
+        self.lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        self.workdir = tempfile.mkdtemp(prefix="clulus_preflight_")
+        self.uses = 0
+        self.next_id = 0
+
+    def start(self, timeout: float = 30.0) -> None:
+        self.lines = queue.Queue()
+        self.uses = 0
+        # scrollmode: errors don't stop for input, but TeX still reads from the terminal
+        self.proc = subprocess.Popen(
+            ["latex", "-interaction=scrollmode", "-jobname=preflight", f"-output-directory={self.workdir}"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            cwd=self.workdir, text=True, encoding="utf-8", errors="replace", bufsize=1,
+        )
+        threading.Thread(target=self._read, args=(self.proc, self.lines), daemon=True).start()
+        self.proc.stdin.write(PREAMBLE + "\n" + _WRITE_MARKER % 0 + "\n")
+        self.proc.stdin.flush()
+        deadline = time.monotonic() + timeout
+        output = []
+        while True:
+            line = self._next_line(deadline)
+            if line is None:
+                self.stop()
+                raise RuntimeError("latex did not start: " + " ".join(output)[-300:])
+            if _MARKER_RE.search(line):
+                return
+            output.append(line.strip())
+
+    @staticmethod
+    def _read(proc: subprocess.Popen, lines: queue.Queue) -> None:
+        for line in proc.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    def _next_line(self, deadline: float) -> Optional[str]:
+        """Next line TeX printed; None on timeout or exit."""
+        try:
+            return self.lines.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            return None
+
+    def send(self, items: List[TexItem]) -> List[int]:
+        """Writes the documents for `items`; returns their marker ids."""
+        ids = []
+        for item in items:
+            self.next_id += 1
+            ids.append(self.next_id)
+            self.proc.stdin.write(_document_line(self.next_id, item))
+        self.proc.stdin.flush()
+        self.uses += len(items)
+        return ids
+
+    def collect(self, ids: List[int], deadline: float) -> Dict[int, Optional[str]]:
+        """
+        TeX's error for each marker id that came back (None = compiled). Ids
+        missing from the result weren't checked: TeX timed out or exited.
+        """
+        results: Dict[int, Optional[str]] = {}
+        output: List[str] = []
+        while len(results) < len(ids):
+            line = self._next_line(deadline)
+            if line is None:
+                break
+            # Output can follow TeX's '*' prompt on the same line
+            line = line.lstrip("*").rstrip()
+            match = _MARKER_RE.search(line)
+            if match:
+                errors = [l for l in output if l.startswith("!")]
+                if errors:
+                    start = output.index(errors[0])
+                    results[int(match.group(1))] = "\n".join(output[start:start + 6])[:600]
+                else:
+                    results[int(match.group(1))] = None
+                output = []
+            elif line:
+                output.append(line)
+        return results
+
+    @property
+    def healthy(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None and self.uses < MAX_USES
+
+    def stop(self) -> None:
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc = None
+
+    def restart(self) -> None:
+        self.stop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+        self.workdir = tempfile.mkdtemp(prefix="clulus_preflight_")
+        self.start()
+
+
+class PreflightStats:
+    """Pre-flight latency, and the renders it kept from failing."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.lessons = 0
+        self.strings = 0
+        self.rejected_lessons = 0
+        self.rejected_strings = 0
+        self.guard_rejections = 0
+        self.unchecked_strings = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.restarts = 0
+        self.warmed = 0
+        self.warm_errors = 0
+
+    def record(self, strings: int, rejected: int, guarded: int, unchecked: int, seconds: float) -> None:
+        with self._lock:
+            self.lessons += 1
+            self.strings += strings
+            self.rejected_strings += rejected
+            self.guard_rejections += guarded
+            self.unchecked_strings += unchecked
+            if rejected:
+                self.rejected_lessons += 1
+            self.seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def record_restart(self) -> None:
+        with self._lock:
+            self.restarts += 1
+
+    def record_warm(self, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self.warmed += 1
+            else:
+                self.warm_errors += 1
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": PREFLIGHT_TEX,
+                "workers": PREFLIGHT_WORKERS if PREFLIGHT_TEX else 0,
+                "lessons": self.lessons,
+                "strings": self.strings,
+                "avg_ms": self.seconds / self.lessons * 1000 if self.lessons else 0.0,
+                "max_ms": self.max_seconds * 1000,
+                # Each of these renders would have failed inside Manim
+                "failed_renders_avoided": self.rejected_lessons,
+                "rejected_strings": self.rejected_strings,
+                "guard_rejections": self.guard_rejections,
+                "unchecked_strings": self.unchecked_strings,
+                "process_restarts": self.restarts,
+                "warm_enabled": TEX_WARM,
+                "warmed": self.warmed,
+                "warm_errors": self.warm_errors,
+            }
+
+
+PREFLIGHT_STATS = PreflightStats()
+
+
+class TexPreflight:
+    """Pool of TexProcess; `check` typesets a lesson's strings on the idle ones in parallel."""
+
+    def __init__(self, size: int = PREFLIGHT_WORKERS, timeout: float = PREFLIGHT_TIMEOUT):
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._idle: "queue.Queue[TexProcess]" = queue.Queue()
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Starts the processes in the background; `check` waits for the first one."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(self.size):
+            threading.Thread(target=self._replace, args=(TexProcess(), False), daemon=True).start()
+
+    def _replace(self, process: TexProcess, restart: bool = True) -> None:
+        try:
+            process.restart() if restart else process.start()
+        except Exception as e:
+            print(f"Pre-flight TeX process failed to start: {e}")
+            return
+        if restart:
+            PREFLIGHT_STATS.record_restart()
+        self._idle.put(process)
+
+    def _release(self, process: TexProcess, dirty: bool) -> None:
+        if dirty or not process.healthy:
+            threading.Thread(target=self._replace, args=(process,), daemon=True).start()
+        else:
+            self._idle.put(process)
+
+    def check(self, items: List[TexItem]) -> Dict[TexItem, Optional[str]]:
+        """
+        Error per item (None = compiled). Items missing from the result
+        weren't checked (no TeX process was ready in time, or TeX hung).
+        """
+        self.start()
+        deadline = time.monotonic() + self.timeout
+        results: Dict[TexItem, Optional[str]] = {}
+        pending = []
+        for item in items:
+            reason = guard(item.latex)
+            if reason is not None:
+                results[item] = reason
+            else:
+                pending.append(item)
+
+        while pending:
+            # Waits for one process, then takes whichever others are idle
+            try:
+                processes = [self._idle.get(timeout=max(0.0, deadline - time.monotonic()))]
+            except queue.Empty:
+                break
+            while len(processes) < min(len(pending), self.size):
+                try:
+                    processes.append(self._idle.get_nowait())
+                except queue.Empty:
+                    break
+
+            batches = [pending[i::len(processes)] for i in range(len(processes))]
+            sent = [process.send(batch) for process, batch in zip(processes, batches)]
+            pending = []
+            for process, batch, ids in zip(processes, batches, sent):
+                errors = process.collect(ids, deadline)
+                failed = False
+                for item, marker in zip(batch, ids):
+                    if marker not in errors:
+                        continue
+                    if failed:
+                        # TeX's state after an error is unreliable: check again on a fresh process
+                        pending.append(item)
+                    else:
+                        results[item] = errors[marker]
+                        failed = errors[marker] is not None
+                # A process that failed a string or didn't finish is replaced
+                self._release(process, failed or len(errors) < len(ids))
+        return results
+
+
+def check_lesson(pool: TexPreflight, lesson) -> List[Dict[str, Any]]:
+    """
+    Typesets every string of the lesson; returns a failure report per broken
+    string, in the format LessonScene reports render failures in.
+    """
+    t0 = time.perf_counter()
+    items = lesson_tex(lesson)
+    results = pool.check(items)
+    reports = [
+        {"category": "preflight", "field": item.field, "index": item.index,
+         "latex": item.latex, "error": error}
+        for item, error in results.items() if error is not None
+    ]
+    guarded = sum(1 for item in items if guard(item.latex) is not None)
+    PREFLIGHT_STATS.record(len(items), len(reports), guarded, len(items) - len(results),
+                           time.perf_counter() - t0)
+    return reports
+
+
+# --- Glyph cache warming ---
+
+_WARM_DIR: Optional[Path] = None
+
+
+def _warm_init() -> None:
+    """Warm worker: Manim compiles into a private dir, finished SVGs are moved into TEX_DIR."""
+    global _WARM_DIR
+    from manim import config
+    _WARM_DIR = RENDERS_DIR / f"tex_warm_{os.getpid()}"
+    _WARM_DIR.mkdir(parents=True, exist_ok=True)
+    config.tex_dir = str(_WARM_DIR)
+
+
+def _warm(kind: str, payload) -> int:
+    """Builds what LessonScene builds for `payload`; returns the number of SVGs published."""
+    from render_scene import MathTex, Tex, batch_math_tex
+    # The private dir keeps its SVGs, so strings this worker has seen compile no more
+    _WARM_DIR.mkdir(parents=True, exist_ok=True)
+    before = set(os.listdir(_WARM_DIR))
+    if kind == "title":
+        Tex(payload)
+    elif kind == "labels":
+        batch_math_tex(payload)
+    else:
+        MathTex(payload)
+    published = 0
+    TEX_DIR.mkdir(parents=True, exist_ok=True)
+    for name in set(os.listdir(_WARM_DIR)) - before:
+        target = TEX_DIR / name
+        if not name.endswith(".svg") or target.exists():
+            continue
+        # Renders read TEX_DIR concurrently, so the SVG has to appear there complete
+        tmp = TEX_DIR / f".{name}.{os.getpid()}"
+        shutil.copyfile(_WARM_DIR / name, tmp)
+        os.replace(tmp, target)
+        published += 1
+    return published
+
+
+class TexWarmer:
+    """Background processes that compile a checked lesson's SVGs ahead of the render."""
+
+    def __init__(self, workers: int = PREFLIGHT_WORKERS):
+        self.workers = max(1, workers)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking a threaded web server is not safe
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=get_context("spawn"),
+                                                 initializer=_warm_init)
+            return self._pool
+
+    def warm(self, lesson) -> None:
+        """Queues the lesson's strings; returns at once."""
+        tasks = [("title", lesson.title)] + [("step", s) for s in lesson.steps]
+        tasks += [("labels", list(labels)) for labels in (lesson.plot_labels, lesson.shape_labels) if labels]
+        pool = self._executor()
+        for kind, payload in tasks:
+            future = pool.submit(_warm, kind, payload)
+            future.add_done_callback(lambda f: PREFLIGHT_STATS.record_warm(f.exception() is None))